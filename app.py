@@ -1,30 +1,72 @@
-import json
+import csv
+import hashlib
+import hmac
+import io
+import ipaddress
 import logging
+import math
+import mimetypes
 import os
 import random
 import string
-from collections import defaultdict
-from datetime import datetime
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 from functools import wraps
 from pathlib import Path
 from urllib.parse import urlparse
 
+import click
 from dotenv import load_dotenv
-from flask import (Flask, Response, flash, jsonify, redirect, render_template, request,
-                   session, url_for)
-from flask.sessions import SecureCookieSessionInterface
+from flask import (Flask, Response, before_render_template, flash, g, jsonify, redirect,
+                   render_template, request, send_from_directory, session, template_rendered,
+                   url_for)
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.security import safe_join
+
+import assets
+import dayhours
+import jsoncodec
+import slots
+from compression import compress_response
+from coalesce import WriteCoalescer
+from metrics import Metrics, RequestProfiler, TimedProxy
+from pagecache import PageCache
+from ratelimit import RateLimiter, parse_budget
+from storage import RESPONDENT_SORTS, FileStorage, SQLiteStorage, create_storage, is_valid_id, migrate
 
 logger = logging.getLogger(__name__)
 
-def init_app():
-    # Load environment variables from .env
-    load_dotenv()
+# Register custom Jinja2 filters
+def to_json(value):
+    return jsoncodec.dumps(value)
+
+class JSONProvider(DefaultJSONProvider):
+    """jsonify() and request.get_json() through jsoncodec, so they use orjson when it's installed"""
+    
+    def dumps(self, obj, **kwargs):
+        return jsoncodec.dumps(obj, default=self.default)
+    
+    def loads(self, s, **kwargs):
+        return jsoncodec.loads(s)
+
+def create_app():
+    """Build the app and its configuration from the environment. 
     
-    # Try loading .env.docker if we're in a Docker environment
+    Called once, below; the routes in this module are registered on that app.
+    Keep imports of anything heavy or optional out of module level, so worker
+    boot stays fast ( see `python -m bench.startup` ).
+    """
+    # Load environment variables: a .env in the working directory overrides the
+    # environment, otherwise the nearest .env only fills in what's missing
     if os.path.exists('.env'):
         load_dotenv('.env', override=True)
+    else:
+        load_dotenv()
 
     app = Flask(__name__)
+    app.json = JSONProvider(app)
     app.secret_key = os.environ.get('FLASK_SECRET_KEY', 'dev-secret-key')  # For development only
     
     # Set server name if EXTERNAL_URL is defined to ensure correct URL generation
@@ -55,43 +97,74 @@ def init_app():
     # Ensure data directory exists
     os.makedirs(app.config['DATA_DIR'], exist_ok=True)
     
-    app.logger = logger
-
-    return app
-
-# Register custom Jinja2 filters
-def to_json(value):
-    return json.dumps(value)
-
-app = init_app()
-app.jinja_env.filters['to_json'] = to_json
-
-def init_db(db):
-    # Get the list of existing collections first to avoid errors
-    existing_collections = db.list_collection_names()
+    # Storage backend: 'file' ( one JSON file per user, the default ) or 'sqlite'
+    app.config['STORAGE_BACKEND'] = os.environ.get('STORAGE_BACKEND', 'file')
+    app.config['SQLITE_PATH'] = os.environ.get('SQLITE_PATH')
+    
+    # In-process cache of parsed files for the file backend ( 0 turns it off )
+    app.config['CACHE_SIZE'] = int(os.environ.get('CACHE_SIZE', 1024))
+    app.config['CACHE_TTL'] = float(os.environ.get('CACHE_TTL', 300))
+    
+    # Threads the file backend reads a schedule's user files on at once ( 0 reads them in turn )
+    app.config['STORAGE_READ_THREADS'] = int(os.environ.get('STORAGE_READ_THREADS', 8))
+    
+    # Under asgi.py, threads each worker runs requests on
+    app.config['ASGI_THREADS'] = int(os.environ.get('ASGI_THREADS', 32))
     
-    # Create collections only if they do not exist
-    if 'users' not in existing_collections:
-        db.create_collection('users', capped=False)
-    if 'userteam' not in existing_collections:
-        db.create_collection('userteam', capped=False)
+    # Server-Sent Events: seconds between polls of the change log, between
+    # keepalive comments, and before a stream is closed for the client to reconnect
+    app.config['SSE_POLL_INTERVAL'] = float(os.environ.get('SSE_POLL_INTERVAL', 1))
+    app.config['SSE_KEEPALIVE'] = float(os.environ.get('SSE_KEEPALIVE', 15))
+    app.config['SSE_MAX_AGE'] = float(os.environ.get('SSE_MAX_AGE', 300))
     
-    # Create GitHub team cache collection 
-    if 'github_teams_cache' not in existing_collections:
-        db.create_collection('github_teams_cache')
+    # Seconds a PATCH of selections waits for more PATCHes from the same user to
+    # write together. Concurrent PATCHes are merged even with 0.
+    app.config['SELECTIONS_COALESCE_WINDOW'] = float(os.environ.get('SELECTIONS_COALESCE_WINDOW', 0))
     
-    # Create cache key index for faster lookups
-    db.github_teams_cache.create_index('cache_key', unique=True)
+    # Journal entries between snapshots of a schedule's responses
+    app.config['JOURNAL_SNAPSHOT_EVERY'] = int(os.environ.get('JOURNAL_SNAPSHOT_EVERY', 100))
     
-    # Ensure other indexes exist
-    db.users.create_index('username', unique=True)
-    db.userteam.create_index([('user_id', 1), ('team', 1)], unique=True)
+    # Bytes of rendered schedule and user pages each worker keeps ( 0 turns it off )
+    app.config['PAGE_CACHE_BYTES'] = int(os.environ.get('PAGE_CACHE_BYTES', 16 * 1024 * 1024))
     
-    # Add test users if not present
-    for username in ['test1', 'test2', 'test3']:
-        db.users.update_one({'username': username}, {'$setOnInsert': {'username': username}}, upsert=True)
+    # Token buckets for the routes that write, as <count>/<second|minute|hour|day>
+    # ( 'off' turns one off ): new schedules per client address and per session,
+    # and saves of selections, blackouts and settings per session, per address
+    # and per schedule. The buckets are kept in RATE_LIMIT_PATH, default
+    # DATA_DIR/ratelimit.sqlite3, shared by every worker.
+    app.config['RATE_LIMIT_NEW'] = parse_budget(os.environ.get('RATE_LIMIT_NEW', '30/hour'))
+    app.config['RATE_LIMIT_USER'] = parse_budget(os.environ.get('RATE_LIMIT_USER', '120/minute'))
+    app.config['RATE_LIMIT_IP'] = parse_budget(os.environ.get('RATE_LIMIT_IP', '600/minute'))
+    app.config['RATE_LIMIT_SCHEDULE'] = parse_budget(os.environ.get('RATE_LIMIT_SCHEDULE', '1200/minute'))
+    app.config['RATE_LIMIT_PATH'] = os.environ.get('RATE_LIMIT_PATH')
+    
+    # Bearer token for the /bulk routes; they are disabled when it isn't set
+    app.config['BULK_API_TOKEN'] = os.environ.get('BULK_API_TOKEN')
+    
+    # Latency histograms at /metrics. Under gunicorn each worker also writes
+    # them to METRICS_DIR, so a scrape of any worker reports all of them.
+    app.config['METRICS_DIR'] = os.environ.get('METRICS_DIR')
+    # Addresses or networks allowed to read /metrics
+    app.config['METRICS_ALLOW'] = os.environ.get('METRICS_ALLOW', '127.0.0.1,::1')
+    
+    # Fraction of requests to run under cProfile ( 0 turns it off ), and how many
+    # of the slowest profiles each worker keeps in PROFILE_DIR. Not in DATA_DIR,
+    # where a directory would be taken for a schedule.
+    app.config['PROFILE_SAMPLE_RATE'] = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+    app.config['PROFILE_DIR'] = os.environ.get('PROFILE_DIR') or Path(__file__).parent / 'profiles'
+    app.config['PROFILE_KEEP'] = int(os.environ.get('PROFILE_KEEP', 20))
+    
+    # Compress JSON, HTML and CSV responses of at least this many bytes with
+    # gzip or brotli, whichever the client accepts ( -1 turns it off, e.g.
+    # when a proxy in front already compresses )
+    app.config['COMPRESS_MIN_SIZE'] = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))
+    
+    app.jinja_env.filters['to_json'] = to_json
+    app.logger = logger
+
+    return app
 
-app = init_app()
+app = create_app()
 
 # Set up logger
 logger = logging.getLogger("scheduler")
@@ -102,111 +175,549 @@ def generate_random_id(length=6):
     chars = string.ascii_letters + string.digits  # Base-62: a-z, A-Z, 0-9
     return ''.join(random.choice(chars) for _ in range(length))
 
-def get_meta_path(schedule_id):
-    """Get the path for a schedule's meta file"""
-    data_dir = app.config['DATA_DIR']
-    schedule_dir = os.path.join(data_dir, schedule_id)
-    return os.path.join(schedule_dir, "meta.json")
+metrics = Metrics(app.config['METRICS_DIR'])
+metrics.describe('scheduler_request_seconds', 'Time to handle a request, by route, method and status.')
+metrics.describe('scheduler_storage_seconds', 'Time spent in storage calls, by operation.')
+metrics.describe('scheduler_section_seconds', 'Time spent in respondent scans, aggregation and ranking.')
+metrics.describe('scheduler_template_seconds', 'Time to render a template.')
+
+profiler = RequestProfiler(app.config['PROFILE_DIR'], app.config['PROFILE_SAMPLE_RATE'],
+                           app.config['PROFILE_KEEP'])
+
+page_cache = PageCache(app.config['PAGE_CACHE_BYTES'])
 
-def get_schedule_path(schedule_id):
-    """Get the path for a schedule's data file (alias for meta path for compatibility)"""
-    return get_meta_path(schedule_id)
+# Storage calls timed in scheduler_storage_seconds
+STORAGE_OPERATIONS = {
+    **dict.fromkeys(['schedule_exists', 'get_schedule', 'get_user', 'list_users',
+                     'list_respondents', 'get_aggregate',
+                     'list_schedules', 'scan_schedules', 'last_activity', 'is_archived',
+                     'read_events', 'last_event_seq', 'read_journal', 'get_snapshot',
+                     'schedule_version', 'aggregate_version', 'user_version'], 'read'),
+    **dict.fromkeys(['save_schedule', 'save_user', 'save_aggregate', 'append_event',
+                     'append_journal', 'save_snapshot',
+                     'delete_schedule', 'archive_schedule', 'restore_schedule'], 'write'),
+}
 
-def get_user_path(schedule_id, user_id):
-    """Get the path for a user's data file"""
-    data_dir = app.config['DATA_DIR']
-    schedule_dir = os.path.join(data_dir, schedule_id)
-    return os.path.join(schedule_dir, f"{user_id}.json")
+def init_storage(app):
+    """Create the storage backend selected by STORAGE_BACKEND"""
+    app.extensions['storage'] = TimedProxy(create_storage(app.config), metrics,
+                                           'scheduler_storage_seconds', STORAGE_OPERATIONS)
+    return app.extensions['storage']
 
-def get_schedule_directory(schedule_id):
-    """Get the directory path for a schedule"""
-    data_dir = app.config['DATA_DIR']
-    return os.path.join(data_dir, schedule_id)
+def get_storage():
+    """Get the app's storage backend"""
+    return app.extensions['storage']
+
+init_storage(app)
+
+# Fingerprinted static files are cached by browsers for a year
+ASSET_MAX_AGE = 365 * 24 * 3600
+
+def load_assets(app):
+    """Load the manifest written by `flask build-assets`, if it has been run"""
+    app.extensions['assets'] = assets.load_manifest(app.static_folder)
+    return app.extensions['assets']
+
+load_assets(app)
+
+@app.url_defaults
+def fingerprint_static_url(endpoint, values):
+    """Point url_for('static', ...) at the fingerprinted copy of the file, if there is one.
+    The debug server uses the files as they are, so edits show up on reload."""
+    if endpoint == 'static' and not app.debug:
+        hashed = app.extensions['assets'].get(values.get('filename'))
+        if hashed:
+            values['filename'] = hashed
+
+@app.template_global()
+def vendor_url(path):
+    """URL of a vendored asset ( see assets.VENDOR_ASSETS ), or its CDN URL
+    if `flask build-assets --vendor` hasn't downloaded it"""
+    if path in app.extensions['assets'] or os.path.exists(os.path.join(app.static_folder, path)):
+        return url_for('static', filename=path)
+    return assets.VENDOR_ASSETS[path]
 
 def get_schedule_data(schedule_id):
-    """Get schedule data from meta.json file"""
-    file_path = get_meta_path(schedule_id)
-    if not os.path.exists(file_path):
-        return None
-    
+    """Get schedule metadata"""
+    return get_storage().get_schedule(schedule_id)
+
+def save_schedule_data(schedule_id, data):
+    """Save schedule metadata"""
+    page_cache.invalidate(schedule_id)
+    return get_storage().save_schedule(schedule_id, data)
+
+def get_user_data(schedule_id, user_id):
+    """Get a user's response"""
+    return get_storage().get_user(schedule_id, user_id)
+
+def save_user_data(schedule_id, user_id, data):
+    """Save a user's response"""
+    page_cache.invalidate(schedule_id)
+    return get_storage().save_user(schedule_id, user_id, data)
+
+# --- Weekly and date-range schedules ---
+# A weekly schedule stores selections and blackouts as lists of dayhour keys,
+# and counts per dayhour. A date-range schedule has a `calendar` in its
+# metadata and stores them as lists of [start, end) slot intervals under
+# `intervals` and `blackout_intervals`, with counts as runs ( see slots.py ).
+# Clients send and receive slot keys either way.
+
+def schedule_calendar(schedule_data):
+    """The schedule's slots.Calendar, or None for a weekly schedule"""
+    config = (schedule_data or {}).get('calendar')
+    return slots.Calendar.from_dict(config) if config else None
+
+def selection_field(calendar):
+    return 'intervals' if calendar else 'selections'
+
+def stored_selections(user_data, calendar):
+    """A response's selections as stored: intervals or dayhour keys"""
+    return user_data.get(selection_field(calendar), [])
+
+def stored_blackouts(schedule_data, calendar):
+    return schedule_data.get('blackout_intervals' if calendar else 'blackouts', [])
+
+def selection_keys(selections, calendar):
+    """Keys of stored selections or blackouts"""
+    return calendar.keys(selections) if calendar else selections
+
+def set_blackouts(schedule_data, keys, calendar):
+    """Store a list of blackout keys in the schedule's metadata"""
+    if calendar:
+        schedule_data['blackout_intervals'] = calendar.intervals(keys)
+    else:
+        schedule_data['blackouts'] = keys
+
+def blackouts_event(schedule_data, calendar):
+    return {'type': 'blackouts', 'blackouts': stored_blackouts(schedule_data, calendar)}
+
+def selections_event(aggregate, delta):
+    """The change log event for a change to the aggregate"""
+    event = {
+        'type': 'selections',
+        'version': aggregate['version'],
+        'count': aggregate['count'],
+        'tiers': aggregate['tiers']
+    }
+    # Runs are small whatever changed, so date-range schedules send them all
+    if 'runs' in aggregate:
+        event['runs'] = aggregate['runs']
+    else:
+        event['delta'] = delta
+    return event
+
+@metrics.timer('scheduler_section_seconds', section='respondent_scan')
+def get_all_users_for_schedule(schedule_id):
+    """Get all users who have responded to a schedule"""
     try:
-        with open(file_path, 'r') as f:
-            return json.load(f)
+        # The latest snapshot and the journal after it are a read or two,
+        # instead of one per respondent
+        view = journal_view(schedule_id)
+        if view is not None:
+            return [{
+                'id': user_id,
+                'name': response['name'],
+                'selections': response.get('selections', []),
+                'updated_at': response.get('updated_at')
+            } for user_id, response in view['responses'].items()]
+        return [{
+            'id': user_id,
+            'name': user_data.get('name', 'Anonymous'),
+            'selections': user_data.get('selections', []),
+            'updated_at': user_data.get('updated_at')
+        } for user_id, user_data in get_storage().list_users(schedule_id) if 'name' in user_data]
     except Exception as e:
-        logger.error(f"Error reading schedule data: {e}")
-        return None
+        logger.error(f"Error listing users for schedule: {e}")
+        return []
 
-def save_schedule_data(schedule_id, data):
-    """Save schedule data to meta.json file"""
-    schedule_dir = get_schedule_directory(schedule_id)
+def get_aggregate_data(schedule_id):
+    """Get the per-schedule aggregate, rebuilding it from the user responses if it is missing"""
+    aggregate = get_storage().get_aggregate(schedule_id)
+    if aggregate is None:
+        with get_storage().lock(schedule_id):
+            # Another worker may have rebuilt it while we waited for the lock
+            aggregate = get_storage().get_aggregate(schedule_id)
+            if aggregate is None:
+                return rebuild_aggregate(schedule_id)
     
-    # Ensure the schedule directory exists
-    os.makedirs(schedule_dir, exist_ok=True)
+    # Aggregates saved before tiers existed get them on their next save
+    if 'tiers' not in aggregate:
+        aggregate['tiers'] = aggregate_tiers(aggregate)
+    return aggregate
+
+def save_aggregate_data(schedule_id, data):
+    """Save the per-schedule aggregate, with its heatmap tiers brought up to date"""
+    data['tiers'] = aggregate_tiers(data)
+    return get_storage().save_aggregate(schedule_id, data)
+
+def aggregate_tiers(aggregate):
+    """Heatmap tiers by dayhour, or as [start, end, tier] runs for a date-range schedule"""
+    if 'runs' in aggregate:
+        runs = aggregate['runs']
+        tiers = heatmap_tiers({i: run[2] for i, run in enumerate(runs)}, aggregate.get('count', 0))
+        return [[runs[i][0], runs[i][1], tier] for i, tier in sorted(tiers.items())]
+    return heatmap_tiers(aggregate.get('dayhours', {}), aggregate.get('count', 0))
+
+@metrics.timer('scheduler_section_seconds', section='heatmap_tiers')
+def heatmap_tiers(counts, respondents):
+    """Assign each dayhour ( or any other key ) its heatmap color tier from the aggregate counts.
     
-    file_path = get_meta_path(schedule_id)
+    '100' when every respondent selected it, '1st', '2nd' and '3rd' for the
+    three highest distinct counts, and 'red' for anything else under 70% of the
+    respondents. Dayhours without a tier are left out ( shown white ).
+    Blackouts are not known here; see schedule_tiers().
+    """
+    if not respondents:
+        return {}
+    ranked = sorted({count for count in counts.values() if count > 0}, reverse=True)[:3]
+    names = dict(zip(ranked, ('1st', '2nd', '3rd')))
     
-    try:
-        with open(file_path, 'w') as f:
-            json.dump(data, f)
-        return True
-    except Exception as e:
-        logger.error(f"Error saving schedule data: {e}")
-        return False
+    tiers = {}
+    for dh, count in counts.items():
+        if count <= 0:
+            continue
+        if count == respondents:
+            tiers[dh] = '100'
+        elif count in names:
+            tiers[dh] = names[count]
+        elif count / respondents < 0.7:
+            tiers[dh] = 'red'
+    return tiers
 
-def get_user_data(schedule_id, user_id):
-    """Get user data from file"""
-    file_path = get_user_path(schedule_id, user_id)
-    if not os.path.exists(file_path):
-        return None
+def schedule_tiers(aggregate, blackouts):
+    """The aggregate's tiers with the schedule's blackouts laid over them"""
+    tiers = dict(aggregate['tiers'])
+    for dh in blackouts:
+        tiers[dh] = 'blackout'
+    return tiers
+
+@metrics.timer('scheduler_section_seconds', section='aggregate_rebuild')
+def rebuild_aggregate(schedule_id):
+    """Recount every user file and persist a fresh aggregate. 
+    
+    Only needed for schedules created before aggregates existed, or if the
+    aggregate file was lost; normal saves update it incrementally. Once a
+    schedule has a journal its aggregate is the latest snapshot's, brought up
+    to date with the entries after it.
+    """
+    view = journal_view(schedule_id)
+    if view is not None:
+        aggregate = view['aggregate']
+    else:
+        calendar = schedule_calendar(get_schedule_data(schedule_id))
+        aggregate = count_responses(
+            [user_data for _, user_data in get_storage().list_users(schedule_id) if 'name' in user_data],
+            calendar)
+    save_aggregate_data(schedule_id, aggregate)
+    return aggregate
+
+def count_responses(responses, calendar):
+    """A new aggregate of a list of responses"""
+    if calendar:
+        intervals = [response.get('intervals', []) for response in responses]
+        return {'version': 1, 'count': len(intervals), 'runs': slots.count_runs(intervals)}
+    
+    # Grid selections are counted bitwise; anything that isn't on the grid is
+    # counted the slow way so it isn't lost
+    masks = []
+    counts = defaultdict(int)
+    for response in responses:
+        selections = response.get('selections', [])
+        if dayhours.is_encodable(selections):
+            masks.append(dayhours.to_mask(selections))
+        else:
+            for dh in set(selections):
+                counts[dh] += 1
     
+    for i, count in enumerate(dayhours.count_masks(masks)):
+        if count:
+            counts[dayhours.DAYHOURS[i]] += count
+    
+    return {
+        'version': 1,
+        'count': len(responses),
+        'dayhours': dict(counts)
+    }
+
+@metrics.timer('scheduler_section_seconds', section='aggregate_update')
+def apply_selection_change(aggregate, old_selections, new_selections, new_respondent=False):
+    """Apply the difference between a user's old and new selections to an aggregate.
+    Returns the change in each dayhour's count.
+    
+    For a date-range schedule the selections are intervals, the runs are merged
+    with them and the change is {}.
+    """
+    if 'runs' in aggregate:
+        aggregate['runs'] = slots.apply_change(aggregate['runs'], old_selections or [],
+                                               new_selections or [])
+        if new_respondent:
+            aggregate['count'] = aggregate.get('count', 0) + 1
+        aggregate['version'] = aggregate.get('version', 0) + 1
+        return {}
+    
+    old_set = set(old_selections or [])
+    new_set = set(new_selections or [])
+    counts = aggregate.setdefault('dayhours', {})
+    delta = {}
+    
+    for dh in new_set - old_set:
+        counts[dh] = counts.get(dh, 0) + 1
+        delta[dh] = 1
+    for dh in old_set - new_set:
+        remaining = counts.get(dh, 0) - 1
+        if remaining > 0:
+            counts[dh] = remaining
+        else:
+            counts.pop(dh, None)
+        delta[dh] = -1
+    
+    if new_respondent:
+        aggregate['count'] = aggregate.get('count', 0) + 1
+    aggregate['version'] = aggregate.get('version', 0) + 1
+    return delta
+
+# --- Response journal ---
+# Every change to a response or to the blackouts is appended to the
+# schedule's journal, with the whole new value, once the files are written.
+# The first change snapshots the schedule as it was before it, so its history
+# goes back to then ( to when it was created, if it was still empty ).
+# If the append fails, the journal starts over from a snapshot of the files,
+# so the two never disagree; applying an entry twice changes nothing. Every
+# JOURNAL_SNAPSHOT_EVERY entries the journal is folded into a snapshot
+# of the responses, blackouts and aggregate, and the entries older than the
+# oldest kept snapshot are dropped. Any state since then is a snapshot plus
+# the entries after it: the current one for reads that would otherwise open
+# every response, and older ones for /info?as_of=.
+
+def journal_response(user_id, user_data, calendar):
+    """The journal entry for a response being saved"""
+    field = selection_field(calendar)
+    return {'type': 'response', 'user_id': user_id, 'name': user_data['name'],
+            field: user_data.get(field, [])}
+
+def journal_blackouts(schedule_data, calendar):
+    """The journal entry for the blackouts being saved"""
+    field = 'blackout_intervals' if calendar else 'blackouts'
+    return {'type': 'blackouts', field: schedule_data.get(field, [])}
+
+def start_journal(schedule_id, seq=0):
+    """Snapshot the schedule's responses as they are now, as the start of its
+    journal, or as a fresh start after entry seq"""
+    schedule_data = get_schedule_data(schedule_id) or {}
+    calendar = schedule_calendar(schedule_data)
+    field = selection_field(calendar)
+    responses = {user_id: {'name': user_data['name'], field: user_data.get(field, []),
+                           'updated_at': user_data.get('updated_at')}
+                 for user_id, user_data in get_storage().list_users(schedule_id) if 'name' in user_data}
+    # A schedule that is still empty has been since it was created
+    empty = not seq and not responses and not stored_blackouts(schedule_data, calendar)
+    snapshot = {
+        'seq': seq,
+        'at': (empty and schedule_data.get('created_at')) or datetime.now().isoformat(),
+        'responses': responses,
+        'aggregate': count_responses(list(responses.values()), calendar)
+    }
+    if calendar:
+        snapshot['blackout_intervals'] = schedule_data.get('blackout_intervals', [])
+    else:
+        snapshot['blackouts'] = schedule_data.get('blackouts', [])
+    get_storage().save_snapshot(schedule_id, snapshot)
+    return snapshot
+
+def ensure_journal(schedule_id):
+    """Start the schedule's journal if it has none yet. Call it holding the
+    schedule lock, before writing a change that record_change() will append."""
+    if get_storage().get_snapshot(schedule_id) is None:
+        start_journal(schedule_id)
+
+def record_change(schedule_id, entry):
+    """Append a change to the schedule's journal, once it has been written.
+    Call it holding the schedule lock. Returns the entry's sequence number."""
+    storage = get_storage()
+    snapshot = storage.get_snapshot(schedule_id) or start_journal(schedule_id)
     try:
-        with open(file_path, 'r') as f:
-            return json.load(f)
-    except Exception as e:
-        logger.error(f"Error reading user data: {e}")
+        seq = storage.append_journal(schedule_id, dict(entry, at=datetime.now().isoformat()))
+    except OSError as e:
+        logger.error(f"Error appending to journal, starting it over: {e}")
+        entries = storage.read_journal(schedule_id, snapshot['seq'])
+        seq = (entries[-1][0] if entries else snapshot['seq']) + 1
+        start_journal(schedule_id, seq)
+        if (storage.get_snapshot(schedule_id) or {}).get('seq') != seq:
+            logger.error(f"Error starting the journal over for {schedule_id}")
+        return seq
+    if seq - snapshot['seq'] >= app.config['JOURNAL_SNAPSHOT_EVERY']:
+        storage.save_snapshot(schedule_id, journal_view(schedule_id))
+    return seq
+
+def journal_view(schedule_id, as_of=None):
+    """The schedule's responses, blackouts and aggregate from its journal, now
+    or as of an ISO time. None if the journal doesn't go back that far, or the
+    schedule has none yet."""
+    snapshot = get_storage().get_snapshot(schedule_id, as_of)
+    if snapshot is None:
         return None
+    return fold_journal(snapshot, get_storage().read_journal(schedule_id, snapshot['seq']), as_of)
 
-def save_user_data(schedule_id, user_id, data):
-    """Save user data to file"""
-    schedule_dir = get_schedule_directory(schedule_id)
+@metrics.timer('scheduler_section_seconds', section='journal_fold')
+def fold_journal(snapshot, entries, as_of=None):
+    """Apply journal entries, up to the ISO time as_of, to a snapshot in place"""
+    aggregate = snapshot['aggregate']
+    field = 'intervals' if 'runs' in aggregate else 'selections'
+    for seq, entry in entries:
+        if as_of is not None and entry['at'] > as_of:
+            break
+        if entry['type'] == 'response':
+            old = snapshot['responses'].get(entry['user_id'])
+            apply_selection_change(aggregate, old.get(field, []) if old else [],
+                                   entry.get(field, []), new_respondent=old is None)
+            snapshot['responses'][entry['user_id']] = {
+                'name': entry['name'], field: entry.get(field, []), 'updated_at': entry['at']}
+        elif entry['type'] == 'blackouts':
+            snapshot.update((key, entry[key]) for key in ('blackouts', 'blackout_intervals') if key in entry)
+        snapshot['seq'], snapshot['at'] = seq, entry['at']
+    return snapshot
+
+# Merges concurrent PATCHes of one user's selections into a single write
+selection_patches = WriteCoalescer()
+
+def apply_selection_patches(schedule_id, user_id, patches):
+    """Apply a batch of selection PATCHes for one user with one write of the
+    user's response and one update of the aggregate. Call it holding the
+    schedule lock.
     
-    # Ensure the schedule directory exists
-    os.makedirs(schedule_dir, exist_ok=True)
+    Each patch is a dict with 'add', 'remove', 'version' ( the selections
+    version the client last saw, or None to skip the check ) and 'name'.
+    Patches are applied in order; one whose version doesn't match is
+    rejected. Returns a result dict per patch. For a date-range schedule
+    'add' and 'remove' are intervals.
+    """
+    calendar = schedule_calendar(get_schedule_data(schedule_id))
+    user_data = get_user_data(schedule_id, user_id) or {}
+    old_selections = stored_selections(user_data, calendar)
+    new_respondent = 'name' not in user_data
+    version = user_data.get('selections_version', 0)
     
-    file_path = get_user_path(schedule_id, user_id)
+    selections = list(old_selections)
+    applied = []
+    for patch in patches:
+        if patch['version'] is not None and patch['version'] != version:
+            applied.append(None)
+            continue
+        if calendar:
+            selections = slots.union(slots.difference(selections, patch['remove']), patch['add'])
+        else:
+            remove = set(patch['remove'])
+            selections = [dh for dh in selections if dh not in remove]
+            current = set(selections)
+            selections += [dh for dh in dict.fromkeys(patch['add']) if dh not in current]
+        version += 1
+        applied.append(version)
     
-    try:
-        with open(file_path, 'w') as f:
-            json.dump(data, f)
-        return True
-    except Exception as e:
-        logger.error(f"Error saving user data: {e}")
-        return False
+    aggregate_version = None
+    if any(applied):
+        # Load the aggregate before saving so a rebuild can't count this save twice
+        aggregate = get_aggregate_data(schedule_id)
+        user_data.update({
+            'name': patches[-1]['name'],
+            selection_field(calendar): selections,
+            'selections_version': version,
+            'updated_at': datetime.now().isoformat()
+        })
+        ensure_journal(schedule_id)
+        if not save_user_data(schedule_id, user_id, user_data):
+            raise IOError('Failed to save selections')
+        record_change(schedule_id, journal_response(user_id, user_data, calendar))
+        
+        delta = apply_selection_change(aggregate, old_selections, selections, new_respondent)
+        save_aggregate_data(schedule_id, aggregate)
+        get_storage().append_event(schedule_id, selections_event(aggregate, delta))
+        aggregate_version = aggregate['version']
+    
+    # A rejected patch gets the current state, so the client can rebase onto it
+    return [{'status': 'ok', 'version': aggregate_version, 'selections_version': patch_version}
+            if patch_version else
+            {'status': 'conflict', 'selections': selection_keys(selections, calendar),
+             'selections_version': version}
+            for patch_version in applied]
 
-def get_all_users_for_schedule(schedule_id):
-    """Get all users who have responded to a schedule"""
-    schedule_dir = get_schedule_directory(schedule_id)
-    users = []
+def make_etag(*parts):
+    """Build a strong ETag from storage versions and whatever else the response depends on"""
+    return hashlib.sha1('|'.join(str(part) for part in parts).encode()).hexdigest()[:20]
+
+def not_modified(etag):
+    """A 304 response if the client's If-None-Match already has this ETag, otherwise None"""
+    # Weak, because a compressed response's ETag is weakened ( see compression.py )
+    if request.if_none_match.contains_weak(etag):
+        return set_validators(Response(status=304), etag)
+    return None
+
+def render_page(schedule_id, key, version, template, viewer, context):
+    """render_template() through the page cache.
     
-    try:
-        # Check if schedule directory exists
-        if not os.path.exists(schedule_dir):
-            return users
-            
-        for filename in os.listdir(schedule_dir):
-            if filename.endswith('.json') and filename != 'meta.json':
-                user_id = filename[:-5]  # Remove .json extension
-                user_data = get_user_data(schedule_id, user_id)
-                if user_data and 'name' in user_data:
-                    users.append({
-                        'id': user_id,
-                        'name': user_data.get('name', 'Anonymous'),
-                        'selections': user_data.get('selections', [])
-                    })
-        return users
-    except Exception as e:
-        logger.error(f"Error listing users for schedule: {e}")
-        return []
+    key: what, besides the schedule, the page depends on ( page, role, host ).
+    version: storage versions of everything the page is rendered from.
+    viewer: values that differ between viewers of the same page. They are
+    rendered as placeholders and filled in per request, HTML escaped, so the
+    template may only print them.
+    context: a function returning the rest of the template's values, only
+    called when the page has to be rendered.
+    """
+    # Flashed messages are shown once, so they can't be in a cached page
+    if page_cache.maxbytes <= 0 or None in version or session.get('_flashes'):
+        return render_template(template, **context(), **viewer)
+    html = page_cache.get(schedule_id, key, version)
+    if html is None:
+        html = render_template(template, **context(),
+                               **{name: page_cache.placeholder(name) for name in viewer})
+        page_cache.set(schedule_id, key, version, html)
+    return page_cache.fill(html, viewer)
+
+def set_validators(response, etag):
+    """Add the ETag, and make clients revalidate instead of reusing a stale copy"""
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.vary.add('Cookie')
+    return response
+
+def wants_bits():
+    """True if the client asked for the compact bitset wire format"""
+    return request.args.get('format') == 'bits'
+
+def compact_info(response_data):
+    """Convert a /info response to the bitset wire format.
+    
+    'mask' has a bit for every dayhour with at least one selection, and 'counts'
+    lists the counts of those dayhours in bit order. 'full' marks the dayhours
+    that every respondent selected ( the star ), with blackouts masked out.
+    'tiers' maps each heatmap tier to the mask of its dayhours.
+    Keys that are not on the grid are left out.
+    """
+    counts = [0] * dayhours.SLOTS
+    for dh, count in response_data['dayhours'].items():
+        if dh in dayhours.DAYHOUR_BITS:
+            counts[dayhours.DAYHOUR_BITS[dh]] = count
+    
+    blackout_mask = dayhours.to_mask(
+        dh for dh in response_data['blackouts'] if dh in dayhours.DAYHOUR_BITS)
+    respondents = response_data['count']
+    full_mask = dayhours.counts_to_mask(counts, respondents) if respondents else 0
+    
+    tier_masks = defaultdict(int)
+    for dh, tier in response_data['tiers'].items():
+        if dh in dayhours.DAYHOUR_BITS:
+            tier_masks[tier] |= 1 << dayhours.DAYHOUR_BITS[dh]
+    
+    return {
+        'id': response_data['id'],
+        'count': respondents,
+        'version': response_data['version'],
+        'is_owner': response_data['is_owner'],
+        'mask': dayhours.encode(dayhours.counts_to_mask(counts, 1)),
+        'counts': [count for count in counts if count],
+        'blackouts': dayhours.encode(blackout_mask),
+        'full': dayhours.encode(full_mask & ~blackout_mask),
+        'tiers': {tier: dayhours.encode(mask) for tier, mask in tier_masks.items()}
+    }
 
 def name_required(f):
     """Decorator to check if user has set a name"""
@@ -220,21 +731,445 @@ def name_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def get_rate_limiter():
+    """The rate limiter for the current RATE_LIMIT_PATH or DATA_DIR"""
+    path = app.config.get('RATE_LIMIT_PATH') or os.path.join(app.config['DATA_DIR'], 'ratelimit.sqlite3')
+    limiter = app.extensions.get('rate_limiter')
+    if limiter is None or limiter.path != path:
+        limiter = app.extensions['rate_limiter'] = RateLimiter(path)
+    return limiter
 
+def rate_limit_buckets(kind, schedule_id=None):
+    """The (key, budget) buckets a request of this kind takes a token from: the
+    caller's, or with schedule_id the schedule's"""
+    address = request.remote_addr
+    user_id = session.get('user_id')
+    if schedule_id:
+        budgets = [('schedule', schedule_id, 'RATE_LIMIT_SCHEDULE')]
+    elif kind == 'new':
+        budgets = [('ip', address, 'RATE_LIMIT_NEW'), ('user', user_id, 'RATE_LIMIT_NEW')]
+    else:
+        budgets = [('user', user_id, 'RATE_LIMIT_USER'), ('ip', address, 'RATE_LIMIT_IP')]
+    return [(f'{kind}:{scope}:{key}', app.config[setting])
+            for scope, key, setting in budgets if key and app.config.get(setting)]
 
+def take_rate_limit(buckets):
+    """Take a token from each bucket. A 429 response with Retry-After if one
+    is empty, otherwise None."""
+    try:
+        wait = get_rate_limiter().take(buckets) if buckets else 0
+    except Exception as e:
+        # Better to let writes through than to refuse everyone
+        logger.error(f"Error checking rate limits: {e}")
+        wait = 0
+    if not wait:
+        return None
+    retry_after = math.ceil(wait)
+    logger.warning(f"Rate limited {request.method} {request.path} from {request.remote_addr}")
+    response = jsonify({'error': 'Too many requests, please slow down',
+                        'retry_after': retry_after})
+    response.headers['Retry-After'] = str(retry_after)
+    return response, 429
+
+def rate_limited(kind):
+    """Decorator for the routes that write: answer 429 when one of the caller's
+    buckets is empty. kind is 'new' for /new, whose GETs write, or 'write',
+    which leaves GETs alone. A 'write' route also calls
+    schedule_rate_limited() once the caller may write to the schedule."""
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if kind == 'new' or request.method != 'GET':
+                limited = take_rate_limit(rate_limit_buckets(kind))
+                if limited:
+                    return limited
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
+
+def schedule_rate_limited(schedule_id):
+    """Take a token from a schedule's write bucket. Call it only once the
+    schedule is known to exist and the caller may write to it, so nobody else
+    can use up its budget. A 429 response if it is empty, otherwise None."""
+    return take_rate_limit(rate_limit_buckets('write', schedule_id))
+
+def bulk_token_required(f):
+    """Decorator for the /bulk routes: require the BULK_API_TOKEN as a bearer token"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        token = app.config.get('BULK_API_TOKEN')
+        if not token:
+            return jsonify({'error': 'Bulk API is not enabled'}), 404
+        auth = request.headers.get('Authorization', '')
+        if not auth.startswith('Bearer ') or not hmac.compare_digest(auth[7:].strip(), token):
+            return jsonify({'error': 'Not authorized'}), 401
+        return f(*args, **kwargs)
+    return decorated_function
+
+def import_records(lines):
+    """Import schedules and responses from NDJSON lines in a single pass.
+    
+    Each line is a record:
+    
+        {"type": "schedule", "id": ..., "name": ..., "description": ..., "blackouts": [...]}
+        {"type": "response", "schedule_id": ..., "user_id": ..., "name": ..., "selections": [...]}
+    
+    A schedule without an id is created with a new id and password, and a
+    response without a schedule_id belongs to the schedule record before it.
+    Consecutive records for one schedule are written under one lock, with one
+    update of its aggregate and one event, however many responses there are.
+    
+    Returns a summary with the counts, the schedules created and any errors.
+    Bad lines are reported by line number and skipped.
+    """
+    summary = {'schedules': 0, 'responses': 0, 'created': [], 'errors': []}
+    current_id = None
+    group_id, group = None, []
+    
+    for line_number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = jsoncodec.loads(line)
+            if not isinstance(record, dict):
+                raise ValueError('Records must be JSON objects')
+            if record.get('type') == 'schedule':
+                # Responses after a rejected schedule don't fall to the one before it
+                current_id = None
+                if not record.get('id'):
+                    record['id'] = generate_random_id()
+                check_import_id(record['id'], 'schedule id')
+                current_id = record['id']
+                schedule_id = current_id
+            elif record.get('type') == 'response':
+                schedule_id = record.get('schedule_id') or current_id
+                if not schedule_id:
+                    raise ValueError('Response has no schedule_id')
+                check_import_id(schedule_id, 'schedule_id')
+                if record.get('user_id') is not None:
+                    check_import_id(record['user_id'], 'user_id')
+            else:
+                raise ValueError(f"Unknown record type: {record.get('type')}")
+        except ValueError as e:
+            summary['errors'].append({'line': line_number, 'error': str(e)})
+            continue
+        
+        if schedule_id != group_id and group:
+            import_schedule_records(group_id, group, summary)
+            group = []
+        group_id = schedule_id
+        group.append((line_number, record))
+    
+    if group:
+        import_schedule_records(group_id, group, summary)
+    summary['errors'].sort(key=lambda error: error['line'])
+    return summary
+
+def check_import_id(value, what):
+    """Raise ValueError unless value can be used as an id ( see is_valid_id() )"""
+    if not is_valid_id(value):
+        raise ValueError(f"Invalid {what}: {str(value)[:40]!r}")
+
+def import_schedule_records(schedule_id, records, summary):
+    """Apply a run of import records that all belong to one schedule"""
+    storage = get_storage()
+    with storage.lock(schedule_id):
+        schedule_data = get_schedule_data(schedule_id)
+        aggregate = None
+        delta = defaultdict(int)
+        
+        for line_number, record in records:
+            try:
+                if record['type'] == 'schedule':
+                    schedule_data = import_schedule(schedule_id, schedule_data, record, summary)
+                    continue
+                
+                if not schedule_data:
+                    raise ValueError(f"Schedule not found: {schedule_id}")
+                if not record.get('name'):
+                    raise ValueError('Response has no name')
+                calendar = schedule_calendar(schedule_data)
+                selections = record.get('selections', [])
+                if 'bits' in record:
+                    selections = dayhours.from_mask(dayhours.decode(record['bits']))
+                if not isinstance(selections, list):
+                    raise ValueError('Selections must be a list')
+                if calendar:
+                    selections = (slots.normalize(record['intervals'], calendar.size)
+                                  if 'intervals' in record else calendar.intervals(selections))
+                
+                if aggregate is None:
+                    ensure_journal(schedule_id)
+                    aggregate = get_aggregate_data(schedule_id)
+                    start_version = aggregate.get('version', 0)
+                
+                user_id = record.get('user_id') or generate_random_id()
+                user_data = get_user_data(schedule_id, user_id) or {}
+                old_selections = stored_selections(user_data, calendar)
+                new_respondent = 'name' not in user_data
+                user_data.update({
+                    'name': record['name'],
+                    selection_field(calendar): selections,
+                    'selections_version': user_data.get('selections_version', 0) + 1,
+                    'updated_at': record.get('updated_at') or datetime.now().isoformat()
+                })
+                if not save_user_data(schedule_id, user_id, user_data):
+                    raise ValueError('Failed to save response')
+                record_change(schedule_id, journal_response(user_id, user_data, calendar))
+                
+                for dh, change in apply_selection_change(
+                        aggregate, old_selections, selections, new_respondent).items():
+                    delta[dh] += change
+                summary['responses'] += 1
+            except (KeyError, TypeError, ValueError) as e:
+                summary['errors'].append({'line': line_number, 'error': str(e)})
+        
+        # However many responses there were, viewers see a single change
+        if aggregate is not None and aggregate['version'] != start_version:
+            aggregate['version'] = start_version + 1
+            save_aggregate_data(schedule_id, aggregate)
+            storage.append_event(schedule_id, selections_event(
+                aggregate, {dh: change for dh, change in delta.items() if change}))
+
+def import_schedule(schedule_id, schedule_data, record, summary):
+    """Create or update a schedule from an import record. Returns the saved metadata."""
+    created = schedule_data is None
+    if created:
+        schedule_data = {
+            'id': schedule_id,
+            'password': record.get('password') or generate_random_id(),
+            'name': '',
+            'description': '',
+            'created_at': record.get('created_at') or datetime.now().isoformat(),
+            'creator_id': record.get('creator_id')
+        }
+        # The calendar can't change once there are responses laid out on it
+        if record.get('calendar'):
+            schedule_data['calendar'] = slots.Calendar.from_dict(record['calendar']).to_dict()
+    
+    calendar = schedule_calendar(schedule_data)
+    for field in ('name', 'description'):
+        if field in record:
+            schedule_data[field] = record[field]
+    if 'blackouts' in record:
+        if not isinstance(record['blackouts'], list):
+            raise ValueError('Blackouts must be a list')
+        set_blackouts(schedule_data, record['blackouts'], calendar)
+    if calendar and 'blackout_intervals' in record:
+        schedule_data['blackout_intervals'] = slots.normalize(record['blackout_intervals'], calendar.size)
+    if not created:
+        schedule_data['updated_at'] = datetime.now().isoformat()
+        if 'blackouts' in record or 'blackout_intervals' in record:
+            ensure_journal(schedule_id)
+    
+    if not save_schedule_data(schedule_id, schedule_data):
+        raise ValueError('Failed to save schedule')
+    if created:
+        rebuild_aggregate(schedule_id)
+        summary['created'].append({'id': schedule_id, 'password': schedule_data['password']})
+    elif 'blackouts' in record or 'blackout_intervals' in record:
+        record_change(schedule_id, journal_blackouts(schedule_data, calendar))
+        get_storage().append_event(schedule_id, blackouts_event(schedule_data, calendar))
+    summary['schedules'] += 1
+    return schedule_data
+
+def export_records(schedule_ids=None):
+    """Yield a schedule record followed by its response records, for each of
+    the given schedules or for every stored schedule, archived ones included.
+    Only one schedule's responses are in memory at a time."""
+    storage = get_storage()
+    for schedule_id in schedule_ids or storage.list_schedule_ids():
+        # Read before yielding, so an archived schedule is packed again before
+        # the export moves on rather than whenever the client reads on
+        with storage.unarchived(schedule_id):
+            schedule_data = storage.get_schedule(schedule_id)
+            users = storage.list_users(schedule_id) if schedule_data else []
+        if not schedule_data:
+            continue
+        yield dict(schedule_data, type='schedule', id=schedule_id)
+        for user_id, user_data in users:
+            yield dict(user_data, type='response', schedule_id=schedule_id, user_id=user_id)
+
+EXPORT_CSV_FIELDS = ['schedule_id', 'schedule_name', 'user_id', 'name', 'updated_at', 'selections']
+
+def export_ndjson(records):
+    """Yield each record as a line of NDJSON"""
+    for record in records:
+        yield jsoncodec.dumpb(record) + b'\n'
+
+def export_csv(records):
+    """Yield a header and one CSV row per response, with space separated selections"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    
+    def flush():
+        row = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return row
+    
+    writer.writerow(EXPORT_CSV_FIELDS)
+    yield flush()
+    schedule_name, calendar = '', None
+    for record in records:
+        if record['type'] == 'schedule':
+            schedule_name = record.get('name', '')
+            calendar = schedule_calendar(record)
+            continue
+        writer.writerow([record['schedule_id'], schedule_name, record['user_id'],
+                         record.get('name', ''), record.get('updated_at', ''),
+                         ' '.join(selection_keys(stored_selections(record, calendar), calendar))])
+        yield flush()
+
+# Loads the schedules of a combined query in parallel
+schedule_loader = ThreadPoolExecutor(max_workers=8, thread_name_prefix='schedule-loader')
+
+# The most schedules one combined query may name
+MAX_COMBINED_SCHEDULES = 100
+
+def restore_if_archived(schedule_id):
+    """Unpack a schedule archived by the retention job, if it is archived"""
+    if get_storage().is_archived(schedule_id):
+        with get_storage().lock(schedule_id):
+            # Another request may have restored it while we waited
+            if get_storage().restore_schedule(schedule_id):
+                logger.info(f"Restored archived schedule {schedule_id}")
+
+def load_schedule_for_combining(schedule_id):
+    """The schedule, its respondents and its aggregate, or None if it doesn't exist"""
+    restore_if_archived(schedule_id)
+    schedule_data = get_schedule_data(schedule_id)
+    if not schedule_data:
+        return None
+    return {
+        'schedule': schedule_data,
+        'users': get_all_users_for_schedule(schedule_id),
+        'aggregate': get_aggregate_data(schedule_id)
+    }
+
+@metrics.timer('scheduler_section_seconds', section='combine')
+def combine_schedules(loaded):
+    """Merge the availability of several loaded schedules, counting each person once.
+    
+    Counts start from the sum of the aggregates. A user id that responded to
+    more than one schedule is then taken out of every schedule and added back
+    once, with their most recent response. Returns (counts, selections per
+    person, blackouts).
+    """
+    counts = Counter()
+    blackouts = set()
+    for item in loaded:
+        counts.update(item['aggregate'].get('dayhours', {}))
+        blackouts.update(item['schedule'].get('blackouts', []))
+    
+    responses = defaultdict(list)
+    for item in loaded:
+        for user in item['users']:
+            responses[user['id']].append(user)
+    
+    people = {}
+    for user_id, answers in responses.items():
+        # The latest response wins; without timestamps, the later schedule in the query
+        latest = max(enumerate(answers), key=lambda a: (a[1].get('updated_at') or '', a[0]))[1]
+        people[user_id] = latest['selections']
+        if len(answers) > 1:
+            for answer in answers:
+                counts.subtract(set(answer['selections']))
+            counts.update(set(latest['selections']))
+    
+    return {dh: count for dh, count in counts.items() if count > 0}, people, blackouts
+
+# --- Request timing and profiling ---
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    g.profile = profiler.start()
+
+@app.after_request
+def record_request_time(response):
+    """Observe the request's latency. Streamed responses are timed to their first byte."""
+    started = g.pop('request_started', None)
+    if started is None:
+        return response
+    seconds = time.perf_counter() - started
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    metrics.observe('scheduler_request_seconds', seconds, route=route, method=request.method,
+                    status=str(response.status_code))
+    
+    profile = g.pop('profile', None)
+    if profile is not None:
+        path = profiler.finish(profile, seconds, f'{request.method} {route}')
+        if path:
+            logger.info(f"Profiled {request.method} {request.path} ({seconds * 1000:.1f}ms): {path}")
+    return response
+
+@app.after_request
+def compress(response):
+    # Registered after record_request_time so it runs first, and is timed
+    min_size = app.config['COMPRESS_MIN_SIZE']
+    if min_size < 0:
+        return response
+    return compress_response(response, request.accept_encodings, min_size)
+
+@app.teardown_request
+def stop_request_profile(exc):
+    # A request that failed before after_request must not leave the profiler running
+    profile = g.pop('profile', None)
+    if profile is not None:
+        profile.disable()
+
+@before_render_template.connect_via(app)
+def start_template_timer(sender, template, context, **extra):
+    g.template_started = time.perf_counter()
+
+@template_rendered.connect_via(app)
+def record_template_time(sender, template, context, **extra):
+    started = g.pop('template_started', None)
+    if started is not None:
+        metrics.observe('scheduler_template_seconds', time.perf_counter() - started,
+                        template=template.name)
+
+@app.before_request
+def restore_archived_schedule():
+    """Unpack a schedule archived by the retention job when it is opened again"""
+    schedule_id = (request.view_args or {}).get('schedule_id')
+    if schedule_id:
+        restore_if_archived(schedule_id)
 
 # --- Main page ---
 @app.route('/')
 def index():
-    return render_template('index.html')
+    # The schedules this browser created, from the storage index
+    my_schedules = []
+    if 'user_id' in session:
+        for summary in get_storage().list_schedules(creator_id=session['user_id'], limit=50):
+            schedule_data = get_schedule_data(summary['id']) or {}
+            summary['url'] = url_for('schedule_page', schedule_id=summary['id'],
+                                     pw=schedule_data.get('password'))
+            my_schedules.append(summary)
+    return render_template('index.html', my_schedules=my_schedules)
 
 # --- Create a new schedule ---
 @app.route('/new')
+@rate_limited('new')
 def new_schedule():
     # The /new route should not create a new schedule if the user does not have a session with a user id
     if 'user_id' not in session:
         session['user_id'] = generate_random_id()
     
+    # ?start=YYYY-MM-DD&end=YYYY-MM-DD makes a date-range schedule instead of a weekly one
+    calendar = None
+    if request.args.get('start') or request.args.get('end'):
+        try:
+            calendar = slots.Calendar(
+                request.args.get('start', ''), request.args.get('end', ''),
+                request.args.get('day_start') or '08:00', request.args.get('day_end') or '22:00',
+                request.args.get('slot_minutes') or 60)
+        except ValueError as e:
+            flash(f'Could not create the schedule: {e}', 'error')
+            return redirect(url_for('index'))
+    
     schedule_id = generate_random_id()
     password = generate_random_id()
     
@@ -247,8 +1182,12 @@ def new_schedule():
         'created_at': datetime.now().isoformat(),
         'creator_id': session.get('user_id')
     }
+    if calendar:
+        schedule_data['calendar'] = calendar.to_dict()
     
     save_schedule_data(schedule_id, schedule_data)
+    # Start with an empty aggregate, so the first /info doesn't have to build one
+    rebuild_aggregate(schedule_id)
     
     # Redirect to the schedule page with password
     return redirect(url_for('schedule_page', schedule_id=schedule_id, pw=password))
@@ -312,32 +1251,76 @@ def schedule_page(schedule_id):
     
     user_id = session.get('user_id')
     
-    # Get all users who have responded
-    users = get_all_users_for_schedule(schedule_id)
-    
     # Check if current user is the owner (can manage blackouts)
     # Owner is someone who either created the schedule OR has the correct password
-    is_owner = (user_id == schedule_data.get('creator_id')) or (pw_param and pw_param == schedule_password)
+    is_owner = bool((user_id == schedule_data.get('creator_id')) or (pw_param and pw_param == schedule_password))
     
-    # Debug logging
-    app.logger.info(f"Schedule {schedule_id}: user_id={user_id}, creator_id={schedule_data.get('creator_id')}, pw_param={pw_param}, schedule_password={schedule_password}, is_owner={is_owner}")
+    # Debug logging; never log the password
+    app.logger.debug(f"Schedule {schedule_id}: user_id={user_id}, is_owner={is_owner}")
     
-    schedule_url = url_for('schedule_page', schedule_id=schedule_id, _external=True)
-    schedule_url_with_pw = url_for('schedule_page', schedule_id=schedule_id, pw=schedule_password, _external=True) if schedule_password else None
-    user_url = url_for('user_page', schedule_id=schedule_id, user_id=user_id, _external=True)
-    show_instructions = False  # Schedule page is read-only, no instructions needed
+    # The respondent list changes with the aggregate, and the links with the host
+    storage = get_storage()
+    version = (storage.schedule_version(schedule_id), storage.aggregate_version(schedule_id))
+    key = ('schedule', is_owner, request.host_url)
+    viewer = {
+        'user_id': user_id,
+        'user_url': url_for('user_page', schedule_id=schedule_id, user_id=user_id, _external=True),
+        'user_path': url_for('user_page', schedule_id=schedule_id, user_id=user_id),
+    }
+    
+    def context():
+        # Only the first page of names; the page fetches the rest from /respondents
+        respondents, respondent_count = storage.list_respondents(schedule_id, limit=RESPONDENTS_PAGE_SIZE)
+        return {
+            'schedule': schedule_data,
+            'respondents': respondents,
+            'respondent_count': respondent_count,
+            'respondents_page_size': RESPONDENTS_PAGE_SIZE,
+            'is_owner': str(is_owner),
+            'schedule_url': url_for('schedule_page', schedule_id=schedule_id, _external=True),
+            'schedule_url_with_pw': url_for('schedule_page', schedule_id=schedule_id, pw=schedule_password,
+                                            _external=True) if schedule_password else None,
+            'show_instructions': False,  # Schedule page is read-only, no instructions needed
+        }
     
+    return render_page(schedule_id, key, version, 'schedule.html', viewer, context)
 
+# --- Respondent names, a page at a time, for the schedule page ---
+RESPONDENTS_PAGE_SIZE = 50
+MAX_RESPONDENTS_PAGE = 200
 
-    return render_template('schedule.html', 
-                          schedule=schedule_data, 
-                          users=users, 
-                          user_id=user_id,
-                          is_owner=str(is_owner),
-                          schedule_url=schedule_url,
-                          schedule_url_with_pw=schedule_url_with_pw,
-                          user_url=user_url,
-                          show_instructions=show_instructions)
+@app.route('/s/<schedule_id>/respondents', methods=['GET'])
+def schedule_respondents(schedule_id):
+    schedule_data = get_schedule_data(schedule_id)
+    if not schedule_data:
+        return jsonify({'error': 'Schedule not found'}), 404
+    
+    # The names are only shown to the owner, like the schedule page
+    pw_param = request.args.get('pw')
+    if not (session.get('user_id') == schedule_data.get('creator_id') or
+            (schedule_data.get('password') and pw_param == schedule_data.get('password'))):
+        return jsonify({'error': 'Not authorized'}), 403
+    
+    sort = request.args.get('sort', 'name')
+    if sort not in RESPONDENT_SORTS:
+        return jsonify({'error': f"sort must be one of {', '.join(RESPONDENT_SORTS)}"}), 400
+    try:
+        offset = max(int(request.args.get('offset', 0)), 0)
+        limit = min(max(int(request.args.get('limit', RESPONDENTS_PAGE_SIZE)), 1), MAX_RESPONDENTS_PAGE)
+    except ValueError:
+        return jsonify({'error': 'offset and limit must be integers'}), 400
+    search = request.args.get('q', '').strip() or None
+    
+    respondents, total = get_storage().list_respondents(schedule_id, sort, search, offset, limit)
+    for respondent in respondents:
+        respondent['url'] = url_for('user_page', schedule_id=schedule_id, user_id=respondent['id'])
+    next_offset = offset + len(respondents)
+    return jsonify({
+        'respondents': respondents,
+        'total': total,
+        'offset': offset,
+        'next_offset': next_offset if next_offset < total else None,
+    })
 
 # --- User page ---
 @app.route('/u/<schedule_id>/<user_id>')
@@ -352,98 +1335,307 @@ def user_page(schedule_id, user_id):
         flash('Schedule not found.', 'error')
         return redirect(url_for('index'))
     
-    # Get user data
-    user_data = get_user_data(schedule_id, user_id)
-    
     current_user_id = session.get('user_id')
     is_owner = (current_user_id == user_id)
-   
-    show_instructions = is_owner  # Show instructions only for the owner
     
-    schedule_url = url_for('schedule_page', schedule_id=schedule_id, _external=True)
+    # The page shows the schedule's name and description, and the user's
+    # selections are fetched by the page, so only meta.json matters
+    version = (get_storage().schedule_version(schedule_id),)
+    key = ('user', user_id, is_owner, request.host_url)
+    viewer = {'user_name': session.get('name', '')} if is_owner else {}
     
-    return render_template('user.html', 
-                          schedule=schedule_data, 
-                          user_data=user_data,
-                          user_id=user_id,
-                          is_owner=str(is_owner), # Use strings to make the Javascript linter happy. 
-                          show_instructions=show_instructions,
-                          schedule_url=schedule_url)
+    def context():
+        return {
+            'schedule': schedule_data,
+            'user_id': user_id,
+            'is_owner': str(is_owner),  # Use strings to make the Javascript linter happy.
+            'show_instructions': is_owner,  # Show instructions only for the owner
+            'schedule_url': url_for('schedule_page', schedule_id=schedule_id, _external=True),
+        }
+    
+    return render_page(schedule_id, key, version, 'user.html', viewer, context)
 
 # --- Get schedule info ---
 @app.route('/s/<schedule_id>/info', methods=['GET'])
 def schedule_info(schedule_id):
-    # Use explicit API response headers to ensure JSON content type
-    headers = {'Content-Type': 'application/json'}
-    
     try:
-        app.logger.info(f"schedule_info: Getting info for schedule {schedule_id}")
+        app.logger.debug(f"schedule_info: Getting info for schedule {schedule_id}")
         
-        # Check if schedule exists first
-        schedule_path = get_meta_path(schedule_id)
-        if not os.path.exists(schedule_path):
-            app.logger.warning(f"Schedule not found: {schedule_id}")
-            error_response = json.dumps({"error": "Schedule not found"})
-            return Response(error_response, status=404, headers=headers)
+        if request.args.get('as_of'):
+            return schedule_info_as_of(schedule_id, request.args['as_of'])
+        
+        # The ETag only needs the versions of meta.json and the aggregate, so an
+        # unchanged schedule gets a 304 without reading anything. is_owner depends
+        # on the session, so the user id is part of it too.
+        etag = make_etag('info', get_storage().schedule_version(schedule_id),
+                         get_storage().aggregate_version(schedule_id),
+                         session.get('user_id'), request.args.get('format'))
+        cached = not_modified(etag)
+        if cached:
+            return cached
         
-        # Load schedule data
+        # Load schedule data, and only check why if that fails
         schedule_data = get_schedule_data(schedule_id)
+        if not schedule_data and not get_storage().schedule_exists(schedule_id):
+            app.logger.warning(f"Schedule not found: {schedule_id}")
+            return jsonify({'error': 'Schedule not found'}), 404
+        
         if not schedule_data:
             app.logger.warning(f"Failed to load schedule data: {schedule_id}")
-            error_response = json.dumps({"error": "Failed to load schedule data"})
-            return Response(error_response, status=500, headers=headers)
+            return jsonify({'error': 'Failed to load schedule data'}), 500
         
-        # Get users and process data
-        users = get_all_users_for_schedule(schedule_id)
-        count = len(users)
+        # The aggregate is maintained by user_selections, so this is a single small read
+        aggregate = get_aggregate_data(schedule_id)
+        
+        # Date-range schedules send runs of slot numbers, which the page expands
+        # with the calendar; the bitset format only covers the weekly grid
+        if 'calendar' in schedule_data:
+            return set_validators(jsonify({
+                'id': schedule_id,
+                'calendar': schedule_data['calendar'],
+                'count': aggregate.get('count', 0),
+                'version': aggregate.get('version', 0),
+                'runs': aggregate.get('runs', []),
+                'is_owner': session.get('user_id') == schedule_data.get('creator_id'),
+                'blackouts': schedule_data.get('blackout_intervals', []),
+                'tiers': aggregate['tiers']
+            }), etag)
         
         # Build simple response object
         response_data = {
             'id': schedule_id,
-            'count': count,
-            'dayhours': {},
+            'count': aggregate.get('count', 0),
+            'version': aggregate.get('version', 0),
+            'dayhours': aggregate.get('dayhours', {}),
             'is_owner': session.get('user_id') == schedule_data.get('creator_id'),
             'blackouts': schedule_data.get('blackouts', []),
-            'dayhours': {}
+            'tiers': schedule_tiers(aggregate, schedule_data.get('blackouts', []))
         }
         
-        # Aggregate all selections
-        for user in users:
-            for dh in user.get('selections', []):
-                if dh not in response_data['dayhours']:
-                    response_data['dayhours'][dh] = 0
-                response_data['dayhours'][dh] += 1
+        if wants_bits():
+            response_data = compact_info(response_data)
         
-        # Return JSON with proper headers
-        success_response = json.dumps(response_data)
-        return Response(success_response, status=200, headers=headers)
+        return set_validators(jsonify(response_data), etag)
         
     except Exception as e:
         app.logger.error(f"Error in schedule_info: {e}")
         import traceback
         app.logger.error(traceback.format_exc())
-        error_response = json.dumps({"error": str(e)})
-        return Response(error_response, status=500, headers=headers)
-    except Exception as e:
-        app.logger.error(f"Error in schedule_info: {str(e)}")
-        import traceback
-        app.logger.error(traceback.format_exc())
-        return app.response_class(
-            response=json.dumps({"error": str(e)}),
-            status=500,
-            mimetype='application/json'
-        )
+        return jsonify({'error': str(e)}), 500
+
+def schedule_info_as_of(schedule_id, as_of):
+    """/info as it was at an ISO time, from the schedule's journal"""
+    try:
+        as_of = datetime.fromisoformat(as_of)
+    except ValueError:
+        return jsonify({'error': 'as_of must be an ISO date and time'}), 400
+    if as_of.tzinfo:
+        # Journal times are local, like every other timestamp here
+        as_of = as_of.astimezone().replace(tzinfo=None)
+    as_of = as_of.isoformat()
+    
+    schedule_data = get_schedule_data(schedule_id)
+    if not schedule_data:
+        return jsonify({'error': 'Schedule not found'}), 404
+    view = journal_view(schedule_id, as_of)
+    if view is None:
+        return jsonify({'error': f'No history of this schedule as of {as_of}'}), 404
+    
+    aggregate = view['aggregate']
+    response_data = {
+        'id': schedule_id,
+        'as_of': as_of,
+        'count': aggregate.get('count', 0),
+        'is_owner': session.get('user_id') == schedule_data.get('creator_id'),
+    }
+    if 'calendar' in schedule_data:
+        response_data.update({
+            'calendar': schedule_data['calendar'],
+            'runs': aggregate.get('runs', []),
+            'blackouts': view.get('blackout_intervals', []),
+            'tiers': aggregate_tiers(aggregate)
+        })
+    else:
+        blackouts = view.get('blackouts', [])
+        response_data.update({
+            'dayhours': aggregate.get('dayhours', {}),
+            'blackouts': blackouts,
+            'tiers': schedule_tiers({'tiers': aggregate_tiers(aggregate)}, blackouts)
+        })
+    return jsonify(response_data)
+
+# --- Rank the best meeting times ---
+MAX_BEST_SLOTS = 100
+
+@app.route('/s/<schedule_id>/best', methods=['GET'])
+def schedule_best(schedule_id):
+    schedule_data = get_schedule_data(schedule_id)
+    if not schedule_data:
+        return jsonify({'error': 'Schedule not found'}), 404
+    
+    try:
+        hours = int(request.args.get('hours', 1))
+        quorum = int(request.args.get('quorum', 1))
+        limit = min(max(int(request.args.get('limit', 10)), 1), MAX_BEST_SLOTS)
+    except ValueError:
+        return jsonify({'error': 'hours, quorum and limit must be integers'}), 400
+    required_ids = [r for r in request.args.get('required', '').split(',') if r]
+    
+    calendar = schedule_calendar(schedule_data)
+    if calendar:
+        view = journal_view(schedule_id)
+        responses = view['responses'].items() if view else get_storage().list_users(schedule_id)
+        users = [{'id': user_id, 'intervals': response.get('intervals', [])}
+                 for user_id, response in responses if 'name' in response]
+    else:
+        users = get_all_users_for_schedule(schedule_id)
+    user_index = {user['id']: i for i, user in enumerate(users)}
+    missing = [r for r in required_ids if r not in user_index]
+    if missing:
+        return jsonify({'error': f"Unknown required participants: {', '.join(missing)}"}), 400
+    required = [user_index[r] for r in required_ids]
+    
+    try:
+        if calendar:
+            # Blocks are a whole number of slots, and stay within a day
+            length, remainder = divmod(hours * 60, calendar.slot_minutes)
+            if remainder:
+                raise ValueError(f'hours must be a whole number of {calendar.slot_minutes} minute slots')
+            with metrics.timer('scheduler_section_seconds', section='ranking'):
+                ranked = slots.rank_blocks(calendar, [user['intervals'] for user in users],
+                                           schedule_data.get('blackout_intervals', []), length=length,
+                                           quorum=quorum, required=required, limit=limit)
+        else:
+            masks = [dayhours.to_mask(dh for dh in user['selections'] if dh in dayhours.DAYHOUR_BITS)
+                     for user in users]
+            blackout_mask = dayhours.to_mask(
+                dh for dh in schedule_data.get('blackouts', []) if dh in dayhours.DAYHOUR_BITS)
+            # Imported here so numpy only loads in workers that rank
+            import ranking
+            with metrics.timer('scheduler_section_seconds', section='ranking'):
+                ranked = ranking.rank_slots(masks, blackout_mask, hours=hours, quorum=quorum,
+                                            required=required, limit=limit)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify({
+        'id': schedule_id,
+        'count': len(users),
+        'hours': hours,
+        'quorum': quorum,
+        'required': required_ids,
+        'slots': ranked
+    })
+
+# --- Fingerprinted static assets, precompressed and cached for good ---
+@app.route('/static/dist/<path:filename>', methods=['GET'])
+def static_asset(filename):
+    dist_dir = os.path.join(app.static_folder, assets.DIST_DIR)
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    
+    # The smallest variant the browser accepts
+    served, encoding = filename, None
+    for candidate, suffix in (('br', '.br'), ('gzip', '.gz')):
+        path = safe_join(dist_dir, filename + suffix)
+        if request.accept_encodings[candidate] and path and os.path.isfile(path):
+            served, encoding = filename + suffix, candidate
+            break
+    
+    response = send_from_directory(dist_dir, served, mimetype=mimetype, max_age=ASSET_MAX_AGE)
+    if encoding:
+        response.content_encoding = encoding
+    response.vary.add('Accept-Encoding')
+    response.cache_control.immutable = True
+    return response
+
+# --- Combined availability across several schedules ---
+def combined_schedule_ids():
+    """Schedule ids from repeated ?schedule= arguments, which may also be comma separated"""
+    ids = [i.strip() for value in request.args.getlist('schedule') for i in value.split(',')]
+    return list(dict.fromkeys(i for i in ids if i))
+
+@app.route('/combined', methods=['GET'])
+def combined_page():
+    return render_template('combined.html', schedule_ids=combined_schedule_ids())
+
+@app.route('/combined/info', methods=['GET'])
+def combined_info():
+    schedule_ids = combined_schedule_ids()
+    if not schedule_ids:
+        return jsonify({'error': 'Give at least one ?schedule=<id>'}), 400
+    if len(schedule_ids) > MAX_COMBINED_SCHEDULES:
+        return jsonify({'error': f'At most {MAX_COMBINED_SCHEDULES} schedules can be combined'}), 400
+    try:
+        hours = int(request.args.get('hours', 1))
+        quorum = int(request.args.get('quorum', 1))
+        limit = min(max(int(request.args.get('limit', 10)), 1), MAX_BEST_SLOTS)
+    except ValueError:
+        return jsonify({'error': 'hours, quorum and limit must be integers'}), 400
+    
+    loaded = list(schedule_loader.map(load_schedule_for_combining, schedule_ids))
+    missing = [schedule_id for schedule_id, item in zip(schedule_ids, loaded) if item is None]
+    if missing:
+        return jsonify({'error': f"Schedules not found: {', '.join(missing)}"}), 404
+    dated = [schedule_id for schedule_id, item in zip(schedule_ids, loaded) if 'calendar' in item['schedule']]
+    if dated:
+        return jsonify({'error': f"Only weekly schedules can be combined: {', '.join(dated)}"}), 400
+    
+    counts, people, blackouts = combine_schedules(loaded)
+    masks = [dayhours.to_mask(dh for dh in selections if dh in dayhours.DAYHOUR_BITS)
+             for selections in people.values()]
+    blackout_mask = dayhours.to_mask(dh for dh in blackouts if dh in dayhours.DAYHOUR_BITS)
+    try:
+        # Imported here so numpy only loads in workers that rank
+        import ranking
+        with metrics.timer('scheduler_section_seconds', section='ranking'):
+            ranked = ranking.rank_slots(masks, blackout_mask, hours=hours, quorum=quorum, limit=limit)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify({
+        'schedules': [{'id': schedule_id, 'name': item['schedule'].get('name', ''),
+                       'count': len(item['users'])} for schedule_id, item in zip(schedule_ids, loaded)],
+        'count': len(people),
+        'responses': sum(len(item['users']) for item in loaded),
+        'dayhours': counts,
+        'blackouts': sorted(blackouts),
+        'tiers': schedule_tiers({'tiers': heatmap_tiers(counts, len(people))}, blackouts),
+        'hours': hours,
+        'quorum': quorum,
+        'slots': ranked
+    })
 
 # --- Get user selections ---
-@app.route('/u/<schedule_id>/<user_id>/selections', methods=['GET', 'POST'])
+@app.route('/u/<schedule_id>/<user_id>/selections', methods=['GET', 'POST', 'PATCH'])
+@rate_limited('write')
 def user_selections(schedule_id, user_id):
     current_user_id = session.get('user_id')
     
     # For GET requests, anyone can view
     if request.method == 'GET':
-        user_data = get_user_data(schedule_id, user_id)
-        selections = user_data.get('selections', []) if user_data else []
-        return jsonify(selections)
+        etag = make_etag('selections', get_storage().user_version(schedule_id, user_id),
+                         request.args.get('format'))
+        cached = not_modified(etag)
+        if cached:
+            return cached
+        
+        user_data = get_user_data(schedule_id, user_id) or {}
+        if 'intervals' in user_data or request.args.get('format') == 'intervals':
+            calendar = schedule_calendar(get_schedule_data(schedule_id))
+            intervals = user_data.get('intervals', [])
+            response = jsonify({'intervals': intervals} if request.args.get('format') == 'intervals'
+                               else selection_keys(intervals, calendar))
+            response.headers['X-Selections-Version'] = str(user_data.get('selections_version', 0))
+            return set_validators(response, etag)
+        selections = user_data.get('selections', [])
+        if wants_bits():
+            response = jsonify({'bits': dayhours.encode(dayhours.to_mask(
+                dh for dh in selections if dh in dayhours.DAYHOUR_BITS))})
+        else:
+            response = jsonify(selections)
+        # The version to send back with a PATCH
+        response.headers['X-Selections-Version'] = str(user_data.get('selections_version', 0))
+        return set_validators(response, etag)
     
     # For POST requests, only the owner can update
     if current_user_id != user_id:
@@ -453,23 +1645,103 @@ def user_selections(schedule_id, user_id):
     if 'name' not in session:
         return jsonify({'error': 'Name required'}), 403
     
+    limited = get_storage().schedule_exists(schedule_id) and schedule_rate_limited(schedule_id)
+    if limited:
+        return limited
+    
+    if request.method == 'PATCH':
+        return patch_selections(schedule_id, user_id)
+    
     data = request.get_json(force=True)
+    calendar = schedule_calendar(get_schedule_data(schedule_id))
+    try:
+        if calendar and isinstance(data, dict) and 'intervals' in data:
+            data = slots.normalize(data['intervals'], calendar.size)
+        elif isinstance(data, dict) and 'bits' in data and not calendar:
+            data = dayhours.from_mask(dayhours.decode(data['bits']))
+        elif calendar and isinstance(data, list):
+            data = calendar.intervals(data)
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': f'Invalid selections: {e}'}), 400
     if not isinstance(data, list):
         return jsonify({'error': 'Selections must be a list'}), 400
     
-    # Get existing data or create new
-    user_data = get_user_data(schedule_id, user_id) or {}
-    user_data.update({
-        'name': session.get('name'),
-        'selections': data,
-        'updated_at': datetime.now().isoformat()
-    })
+    # The user file and the aggregate change together, so hold the schedule lock
+    with get_storage().lock(schedule_id):
+        # Get existing data or create new
+        user_data = get_user_data(schedule_id, user_id) or {}
+        old_selections = stored_selections(user_data, calendar)
+        new_respondent = 'name' not in user_data
+        
+        # Load the aggregate before saving so a rebuild can't count this save twice
+        aggregate = get_aggregate_data(schedule_id)
+        
+        user_data.update({
+            'name': session.get('name'),
+            selection_field(calendar): data,
+            'selections_version': user_data.get('selections_version', 0) + 1,
+            'updated_at': datetime.now().isoformat()
+        })
+        
+        ensure_journal(schedule_id)
+        if not save_user_data(schedule_id, user_id, user_data):
+            return jsonify({'error': 'Failed to save selections'}), 500
+        record_change(schedule_id, journal_response(user_id, user_data, calendar))
+        
+        delta = apply_selection_change(aggregate, old_selections, data, new_respondent)
+        save_aggregate_data(schedule_id, aggregate)
+        get_storage().append_event(schedule_id, selections_event(aggregate, delta))
+    return jsonify({'status': 'ok', 'version': aggregate['version'],
+                    'selections_version': user_data['selections_version']})
+
+def patch_selections(schedule_id, user_id):
+    """Add and remove dayhours from a user's selections.
+    
+    Takes {"add": [...], "remove": [...], "selections_version": n}. Replies with
+    the new selections_version and aggregate version, or 409 with the current
+    selections if selections_version is out of date.
+    """
+    data = request.get_json(force=True, silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Expected an object with add and remove lists'}), 400
+    patch = {
+        'add': data.get('add', []),
+        'remove': data.get('remove', []),
+        'version': data.get('selections_version'),
+        'name': session.get('name')
+    }
+    for field in ('add', 'remove'):
+        if not isinstance(patch[field], list) or not all(isinstance(dh, str) for dh in patch[field]):
+            return jsonify({'error': f'{field} must be a list of dayhours'}), 400
+    if patch['version'] is not None and not isinstance(patch['version'], int):
+        return jsonify({'error': 'selections_version must be an integer'}), 400
+    
+    # Date-range patches are merged as intervals
+    calendar = schedule_calendar(get_schedule_data(schedule_id))
+    if calendar:
+        try:
+            patch['add'] = calendar.intervals(patch['add'])
+            patch['remove'] = calendar.intervals(patch['remove'])
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+    
+    try:
+        result = selection_patches.submit(
+            (schedule_id, user_id), patch,
+            lambda patches: apply_selection_patches(schedule_id, user_id, patches),
+            guard=lambda: get_storage().lock(schedule_id),
+            window=app.config['SELECTIONS_COALESCE_WINDOW'])
+    except Exception as e:
+        logger.error(f"Error patching selections: {e}")
+        return jsonify({'error': 'Failed to save selections'}), 500
     
-    save_user_data(schedule_id, user_id, user_data)
-    return jsonify({'status': 'ok'})
+    if result['status'] == 'conflict':
+        return jsonify(dict(result, error='Selections have changed since selections_version')), 409
+    return jsonify(result)
 
 # --- Update schedule metadata ---
 @app.route('/s/<schedule_id>/update', methods=['POST'])
+@rate_limited('write')
 def update_schedule(schedule_id):
     # Get current schedule data
     schedule_data = get_schedule_data(schedule_id)
@@ -489,6 +1761,9 @@ def update_schedule(schedule_id):
     
     if not has_permission:
         return jsonify({'error': 'Not authorized to update this schedule'}), 403
+    limited = schedule_rate_limited(schedule_id)
+    if limited:
+        return limited
     
     # Get update data
     if request.is_json:
@@ -496,25 +1771,52 @@ def update_schedule(schedule_id):
     else:
         data = request.form.to_dict()
     
-    # Update allowed fields
-    if 'name' in data:
-        schedule_data['name'] = data['name']
-    if 'description' in data:
-        schedule_data['description'] = data['description']
-    if 'blackouts' in data:
-        schedule_data['blackouts'] = data['blackouts']
-    
-    schedule_data['updated_at'] = datetime.now().isoformat()
+    # Apply the update to a fresh read under the schedule lock, so concurrent
+    # updates of different fields don't undo each other
+    with get_storage().lock(schedule_id):
+        schedule_data = get_schedule_data(schedule_id) or schedule_data
+        
+        # Update allowed fields
+        if 'name' in data:
+            schedule_data['name'] = data['name']
+        if 'description' in data:
+            schedule_data['description'] = data['description']
+        calendar = schedule_calendar(schedule_data)
+        if 'blackouts' in data:
+            try:
+                set_blackouts(schedule_data, data['blackouts'], calendar)
+            except (TypeError, ValueError) as e:
+                return jsonify({'error': f'Invalid blackouts: {e}'}), 400
+        
+        schedule_data['updated_at'] = datetime.now().isoformat()
+        if 'blackouts' in data:
+            ensure_journal(schedule_id)
+        saved = save_schedule_data(schedule_id, schedule_data)
+        if saved and 'blackouts' in data:
+            record_change(schedule_id, journal_blackouts(schedule_data, calendar))
+            get_storage().append_event(schedule_id, blackouts_event(schedule_data, calendar))
     
-    # Save updated data
-    if save_schedule_data(schedule_id, schedule_data):
-        return jsonify({'status': 'ok', 'schedule': schedule_data})
+    # Only what changed on the server; the client already has the rest, and
+    # echoing the document would send the password back too
+    if saved:
+        return jsonify({'status': 'ok', 'updated_at': schedule_data['updated_at']})
     else:
         return jsonify({'error': 'Failed to save schedule'}), 500
 
 # --- Get/Update blackout times for schedule owners ---
 @app.route('/s/<schedule_id>/blackouts', methods=['GET', 'POST'])
+@rate_limited('write')
 def schedule_blackouts(schedule_id):
+    # Blackouts only live in meta.json, so its version is enough for the ETag
+    if request.method == 'GET':
+        version = get_storage().schedule_version(schedule_id)
+        if not version:
+            return jsonify({'error': 'Schedule not found'}), 404
+        etag = make_etag('blackouts', version)
+        cached = not_modified(etag)
+        if cached:
+            return cached
+    
     # Get schedule data
     schedule_data = get_schedule_data(schedule_id)
     if not schedule_data:
@@ -524,8 +1826,9 @@ def schedule_blackouts(schedule_id):
     
     # For GET requests, return current blackouts
     if request.method == 'GET':
-        blackouts = schedule_data.get('blackouts', [])
-        return jsonify(blackouts)
+        calendar = schedule_calendar(schedule_data)
+        blackouts = selection_keys(stored_blackouts(schedule_data, calendar), calendar)
+        return set_validators(jsonify(blackouts), etag)
     
     # For POST requests, check if user has permission to update blackouts
     pw_param = None
@@ -546,21 +1849,241 @@ def schedule_blackouts(schedule_id):
     
     if not has_permission:
         return jsonify({'error': 'Not authorized to update blackouts'}), 403
+    limited = schedule_rate_limited(schedule_id)
+    if limited:
+        return limited
     
     # Get blackout data
     data = request.get_json(force=True)
     if not isinstance(data, list):
         return jsonify({'error': 'Blackouts must be a list'}), 400
     
-    # Update blackouts
-    schedule_data['blackouts'] = data
-    schedule_data['updated_at'] = datetime.now().isoformat()
+    # Update blackouts on a fresh read under the schedule lock
+    with get_storage().lock(schedule_id):
+        schedule_data = get_schedule_data(schedule_id) or schedule_data
+        calendar = schedule_calendar(schedule_data)
+        try:
+            set_blackouts(schedule_data, data, calendar)
+        except (TypeError, ValueError) as e:
+            return jsonify({'error': f'Invalid blackouts: {e}'}), 400
+        schedule_data['updated_at'] = datetime.now().isoformat()
+        ensure_journal(schedule_id)
+        saved = save_schedule_data(schedule_id, schedule_data)
+        if saved:
+            record_change(schedule_id, journal_blackouts(schedule_data, calendar))
+            get_storage().append_event(schedule_id, blackouts_event(schedule_data, calendar))
     
     # Save updated data
-    if save_schedule_data(schedule_id, schedule_data):
+    if saved:
         return jsonify({'status': 'ok'})
     else:
         return jsonify({'error': 'Failed to save blackouts'}), 500
 
+# --- Live updates over Server-Sent Events ---
+# The parts of an event stream, shared with the ASGI stream in asgi.py
+SSE_HEADERS = {
+    'Cache-Control': 'no-cache',
+    'X-Accel-Buffering': 'no'
+}
+SSE_KEEPALIVE = ": keepalive\n\n"
+
+def events_after(storage, schedule_id, last_event_id, after):
+    """The seq a stream starts after. A reconnecting EventSource sends the
+    last id it saw; a new client only wants what happens from now on."""
+    try:
+        return int(last_event_id or after)
+    except (TypeError, ValueError):
+        return storage.last_event_seq(schedule_id)
+
+def sse_retry(poll_interval):
+    """How long a browser waits before reconnecting a closed stream"""
+    return f"retry: {int(poll_interval * 1000) + 1000}\n\n"
+
+def sse_message(seq, event):
+    return f"id: {seq}\nevent: {event['type']}\ndata: {jsoncodec.dumps(event)}\n\n"
+
+@app.route('/s/<schedule_id>/events', methods=['GET'])
+def schedule_events(schedule_id):
+    storage = get_storage()
+    if not storage.schedule_exists(schedule_id):
+        return jsonify({'error': 'Schedule not found'}), 404
+    
+    after = events_after(storage, schedule_id, request.headers.get('Last-Event-ID'),
+                         request.args.get('after'))
+    
+    poll_interval = app.config['SSE_POLL_INTERVAL']
+    keepalive = app.config['SSE_KEEPALIVE']
+    max_age = app.config['SSE_MAX_AGE']
+    
+    def stream():
+        # Every worker polls the schedule's change log, so it doesn't matter
+        # which worker handled the write. Streams end after max_age and the
+        # browser reconnects with Last-Event-ID, so nothing is missed.
+        seq, cursor = after, None
+        started = last_sent = time.monotonic()
+        yield sse_retry(poll_interval)
+        while time.monotonic() - started < max_age:
+            events, cursor = storage.read_events(schedule_id, seq, cursor)
+            for seq, event in events:
+                yield sse_message(seq, event)
+                last_sent = time.monotonic()
+            if time.monotonic() - last_sent >= keepalive:
+                yield SSE_KEEPALIVE
+                last_sent = time.monotonic()
+            time.sleep(poll_interval)
+    
+    return Response(stream(), mimetype='text/event-stream', headers=SSE_HEADERS)
+
+# --- Bulk import and export ---
+@app.route('/bulk/import', methods=['POST'])
+@bulk_token_required
+def bulk_import():
+    # Read the body a line at a time, so a large import isn't held in memory
+    summary = import_records(request.stream)
+    return jsonify(summary), 400 if summary['errors'] and not (
+        summary['schedules'] or summary['responses']) else 200
+
+@app.route('/bulk/export', methods=['GET'])
+@bulk_token_required
+def bulk_export():
+    # ?schedule=<id> may be repeated; without it every schedule is exported
+    schedule_ids = request.args.getlist('schedule')
+    if request.args.get('format') == 'csv':
+        return Response(export_csv(export_records(schedule_ids)), mimetype='text/csv',
+                        headers={'Content-Disposition': 'attachment; filename=export.csv'})
+    return Response(export_ndjson(export_records(schedule_ids)), mimetype='application/x-ndjson')
+
+# --- Prometheus metrics, for scrapers on METRICS_ALLOW ---
+def metrics_allowed(address):
+    try:
+        address = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    for network in filter(None, (n.strip() for n in app.config['METRICS_ALLOW'].split(','))):
+        try:
+            if address in ipaddress.ip_network(network):
+                return True
+        except ValueError:
+            logger.error(f"Invalid METRICS_ALLOW entry: {network}")
+    return False
+
+@app.route('/metrics', methods=['GET'])
+def metrics_page():
+    if not metrics_allowed(request.remote_addr or ''):
+        return jsonify({'error': 'Forbidden'}), 403
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+# --- Read cache counters, for sizing CACHE_SIZE, for the same addresses as /metrics ---
+@app.route('/_stats/cache', methods=['GET'])
+def cache_stats():
+    if not metrics_allowed(request.remote_addr or ''):
+        return jsonify({'error': 'Forbidden'}), 403
+    stats = get_storage().cache_stats()
+    return jsonify({'backend': get_storage().name, 'pid': os.getpid(), 'cache': stats,
+                    'pages': page_cache.stats()})
+
+# --- Offline migration from the file layout to SQLite ---
+@app.cli.command('migrate-storage')
+@click.option('--source-dir', default=None,
+              help='Data directory to copy from. Defaults to DATA_DIR.')
+@click.option('--sqlite-path', default=None,
+              help='SQLite database to copy into. Defaults to SQLITE_PATH or DATA_DIR/scheduler.sqlite3.')
+def migrate_storage_command(source_dir, sqlite_path):
+    """Copy every schedule directory in a file DATA_DIR into a SQLite database.
+    
+    The source files are left in place. Run this with the app stopped, then
+    start it with STORAGE_BACKEND=sqlite.
+    """
+    source = FileStorage(source_dir or app.config['DATA_DIR'])
+    sqlite_path = sqlite_path or app.config['SQLITE_PATH'] or os.path.join(
+        app.config['DATA_DIR'], 'scheduler.sqlite3')
+    schedules, responses = migrate(source, SQLiteStorage(sqlite_path))
+    click.echo(f"Migrated {schedules} schedules and {responses} responses to {sqlite_path}")
+
+@app.cli.command('reindex-schedules')
+@click.option('--move-flat', is_flag=True,
+              help='Also move schedule directories from before sharding into DATA_DIR/ab/cd/<id>.')
+def reindex_schedules_command(move_flat):
+    """Rebuild the file backend's schedule index from the schedule directories.
+    
+    Needed once for schedules created before the index existed. Run it with the
+    app stopped.
+    """
+    storage = get_storage()
+    if not hasattr(storage, 'reindex'):
+        raise click.UsageError('The SQLite backend indexes its schedules table directly')
+    click.echo(f"Indexed {storage.reindex(move_flat=move_flat)} schedules")
+
+@app.cli.command('retention')
+@click.option('--archive-days', default=180, show_default=True,
+              help='Archive schedules with no activity for this many days.')
+@click.option('--purge-days', default=7, show_default=True,
+              help='Delete schedules never named or answered after this many days.')
+@click.option('--batch-size', default=500, show_default=True)
+@click.option('--max-seconds', default=60.0, show_default=True,
+              help='Stop after this long; the next run carries on from the checkpoint.')
+@click.option('--checkpoint', default=None,
+              help='Checkpoint file. Defaults to DATA_DIR/retention-checkpoint.json.')
+@click.option('--dry-run', is_flag=True, help='Count what would be done without doing it.')
+def retention_command(archive_days, purge_days, batch_size, max_seconds, checkpoint, dry_run):
+    """Archive stale schedules and purge abandoned ones, one slice at a time.
+    
+    Safe to run from cron while the app is up. On the file backend, run
+    `flask reindex-schedules` once first so the index covers old schedules.
+    """
+    import retention
+    
+    now = datetime.now()
+    stats = retention.run_retention(
+        get_storage(),
+        archive_before=(now - timedelta(days=archive_days)).isoformat(),
+        purge_before=(now - timedelta(days=purge_days)).isoformat(),
+        checkpoint_path=checkpoint or os.path.join(app.config['DATA_DIR'], 'retention-checkpoint.json'),
+        batch_size=batch_size, max_seconds=max_seconds, dry_run=dry_run)
+    click.echo(f"Scanned {stats['scanned']}, archived {stats['archived']}, "
+               f"purged {stats['purged']}, errors {stats['errors']}"
+               + (", pass complete" if stats['finished'] else "")
+               + (" (dry run)" if dry_run else ""))
+
+@app.cli.command('build-assets')
+@click.option('--vendor', is_flag=True,
+              help='First download the Bootstrap and Font Awesome files into static/vendor/.')
+def build_assets_command(vendor):
+    """Fingerprint and precompress the files in static/ into static/dist/.
+    
+    Restart the app afterwards so it loads the new manifest.
+    """
+    if vendor:
+        for path in assets.fetch_vendor(app.static_folder):
+            click.echo(f"Downloaded {path}")
+    manifest = assets.build_assets(app.static_folder)
+    click.echo(f"Built {len(manifest)} assets into {os.path.join(app.static_folder, assets.DIST_DIR)}")
+
+@app.cli.command('import-data')
+@click.argument('source', type=click.File('rb'), default='-')
+def import_data_command(source):
+    """Import schedules and responses from an NDJSON file ( or - for stdin ).
+    
+    See import_records() for the record format.
+    """
+    summary = import_records(source)
+    for created in summary['created']:
+        click.echo(f"Created {created['id']} password={created['password']}")
+    for error in summary['errors']:
+        click.echo(f"Line {error['line']}: {error['error']}", err=True)
+    click.echo(f"Imported {summary['schedules']} schedules and {summary['responses']} responses")
+
+@app.cli.command('export-data')
+@click.option('--schedule', 'schedule_ids', multiple=True,
+              help='Schedule to export; repeat for more. Defaults to every schedule.')
+@click.option('--format', 'fmt', type=click.Choice(['ndjson', 'csv']), default='ndjson')
+@click.option('--output', type=click.File('wb'), default='-', help='File to write, default stdout.')
+def export_data_command(schedule_ids, fmt, output):
+    """Stream schedules and responses out as NDJSON or CSV"""
+    # NDJSON comes out as bytes, CSV as text
+    export = export_csv if fmt == 'csv' else export_ndjson
+    for chunk in export(export_records(list(schedule_ids))):
+        output.write(chunk.encode() if isinstance(chunk, str) else chunk)
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
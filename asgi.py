@@ -0,0 +1,221 @@
+"""ASGI entry point, for serving the app from an asyncio event loop:
+
+    uvicorn asgi:application --workers 4
+    gunicorn asgi:application -k uvicorn.workers.UvicornWorker
+
+The routes are Flask's, so every request except the event stream runs the
+WSGI app on one of ASGI_THREADS threads. A request waiting on a slow disk
+holds one of those threads rather than a whole worker process: the event
+loop keeps accepting and answering requests, and once every thread is busy
+new requests wait in the loop, not in the kernel's accept queue behind a
+stalled worker. Response bodies are passed on a chunk at a time as the app
+produces them, so streamed exports aren't held in memory.
+
+/s/<id>/events is served here as a coroutine instead. It polls the change
+log on the same threads between sleeps, so an open stream holds no thread at
+all while it waits.
+"""
+
+import asyncio
+import re
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+from app import (SSE_HEADERS, SSE_KEEPALIVE, app, events_after, get_storage, logger, sse_message,
+                 sse_retry)
+
+# Request bodies up to this size are kept in memory, bigger ones in a temporary file
+BODY_MEMORY_LIMIT = 1024 * 1024
+
+EVENTS_PATH = re.compile(r'^/s/([^/]+)/events$')
+
+
+def wsgi_environ(scope, body):
+    """A WSGI environ for an ASGI http scope, with body as wsgi.input"""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        # WSGI strings are bytes decoded as latin-1
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1] or 80),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        key = name.decode('latin-1').upper().replace('-', '_')
+        if key not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            key = f'HTTP_{key}'
+        value = value.decode('latin-1')
+        # Repeated headers are joined, as a WSGI server would
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+def header(scope, name):
+    """The first value of a request header, or None"""
+    for key, value in scope.get('headers', []):
+        if key.lower() == name:
+            return value.decode('latin-1')
+    return None
+
+
+async def read_body(receive):
+    """Read the whole request body into a file object.
+    Returns None if the client goes away first."""
+    body = tempfile.SpooledTemporaryFile(max_size=BODY_MEMORY_LIMIT)
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            body.close()
+            return None
+        body.write(message.get('body', b''))
+        if not message.get('more_body'):
+            body.seek(0)
+            return body
+
+
+class Application:
+    """Serves a WSGI app to an ASGI server, on a bounded pool of threads"""
+
+    def __init__(self, wsgi_app, threads):
+        self.wsgi_app = wsgi_app
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='asgi')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+        elif scope['type'] == 'http':
+            body = await read_body(receive)
+            if body is None:
+                return
+            with body:
+                match = EVENTS_PATH.match(scope['path'])
+                if match and scope['method'] == 'GET' and await self.events(scope, receive, send, match[1]):
+                    return
+                loop = asyncio.get_running_loop()
+                await loop.run_in_executor(self.executor, self.run, scope, body, send, loop)
+        elif scope['type'] == 'websocket':
+            await receive()
+            await send({'type': 'websocket.close'})
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=False, cancel_futures=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def run(self, scope, body, send, loop):
+        """Run one request through the WSGI app, on a pool thread"""
+        def call(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info and response.get('sent'):
+                raise exc_info[1].with_traceback(exc_info[2])
+            response['start'] = {
+                'type': 'http.response.start',
+                'status': int(status.split(' ', 1)[0]),
+                'headers': [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                            for name, value in headers],
+            }
+            return write
+
+        def write(data):
+            # Headers go out with the first chunk, since start_response may
+            # be called again with exc_info until then
+            if not response.get('sent'):
+                call(response['start'])
+                response['sent'] = True
+            if data:
+                call({'type': 'http.response.body', 'body': data, 'more_body': True})
+
+        try:
+            result = self.wsgi_app(wsgi_environ(scope, body), start_response)
+            try:
+                for chunk in result:
+                    write(chunk)
+            finally:
+                if hasattr(result, 'close'):
+                    result.close()
+            write(b'')
+            call({'type': 'http.response.body', 'body': b''})
+        except Exception as e:
+            # Flask turns errors in routes into 500s, so this is the client
+            # going away mid response or a bug in the bridge
+            logger.error(f"Error serving {scope['method']} {scope['path']}: {e}")
+            if not response.get('sent'):
+                call({'type': 'http.response.start', 'status': 500,
+                      'headers': [(b'content-type', b'text/plain')]})
+                call({'type': 'http.response.body', 'body': b'Internal Server Error'})
+
+    async def events(self, scope, receive, send, schedule_id):
+        """Serve an event stream like schedule_events() in app.py, without a
+        thread. Returns False to leave the request to Flask, for its 404."""
+        loop = asyncio.get_running_loop()
+
+        def blocking(function, *args):
+            return loop.run_in_executor(self.executor, function, *args)
+
+        storage = get_storage()
+        if not await blocking(storage.schedule_exists, schedule_id):
+            return False
+        query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+        after = await blocking(events_after, storage, schedule_id, header(scope, b'last-event-id'),
+                               query.get('after', [None])[0])
+
+        poll_interval = app.config['SSE_POLL_INTERVAL']
+        keepalive = app.config['SSE_KEEPALIVE']
+        max_age = app.config['SSE_MAX_AGE']
+
+        # The body has been read, so the next message is the client going away
+        disconnected = asyncio.ensure_future(receive())
+
+        async def send_text(text, more=True):
+            await send({'type': 'http.response.body', 'body': text.encode('utf-8'), 'more_body': more})
+
+        try:
+            await send({'type': 'http.response.start', 'status': 200, 'headers': [
+                (b'content-type', b'text/event-stream; charset=utf-8'),
+                *((name.lower().encode('latin-1'), value.encode('latin-1'))
+                  for name, value in SSE_HEADERS.items())]})
+            await send_text(sse_retry(poll_interval))
+            seq, cursor = after, None
+            started = last_sent = time.monotonic()
+            while time.monotonic() - started < max_age and not disconnected.done():
+                events, cursor = await blocking(storage.read_events, schedule_id, seq, cursor)
+                for seq, event in events:
+                    await send_text(sse_message(seq, event))
+                    last_sent = time.monotonic()
+                if time.monotonic() - last_sent >= keepalive:
+                    await send_text(SSE_KEEPALIVE)
+                    last_sent = time.monotonic()
+                await asyncio.wait([disconnected], timeout=poll_interval)
+            if not disconnected.done():
+                await send_text('', more=False)
+        finally:
+            disconnected.cancel()
+        return True
+
+
+application = Application(app, app.config['ASGI_THREADS'])
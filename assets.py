@@ -0,0 +1,171 @@
+"""Fingerprinted, precompressed static assets.
+
+`flask build-assets` copies every file under static/ into static/dist/ with a
+hash of its contents in the name ( app.js -> app.3f2a9c81d0e4.js ), writes
+.gz and .br ( when the brotli package is installed ) variants of the text
+files next to them, and records the names in static/dist/manifest.json. The
+app then rewrites url_for('static', filename=...) to the hashed name, and
+serves those files with `Cache-Control: immutable`, so a browser that has
+them never asks again.
+
+With --vendor it first downloads the CDN assets in VENDOR_ASSETS into
+static/vendor/, so pages work without internet access. Templates link them
+with vendor_url(), which falls back to the CDN when they haven't been
+fetched.
+
+url() references in CSS are rewritten to the hashed names, so fonts are
+fingerprinted too.
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import os
+import posixpath
+import re
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+DIST_DIR = 'dist'
+MANIFEST_FILE = 'manifest.json'
+
+# Files worth compressing; fonts like woff2 and images are compressed already
+COMPRESSIBLE = {'.css', '.js', '.json', '.map', '.svg', '.txt', '.html', '.ttf', '.eot'}
+
+BOOTSTRAP = 'https://cdn.jsdelivr.net/npm/bootstrap@5.3.3/dist'
+FONT_AWESOME = 'https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.5.0'
+
+# Path under static/ -> the CDN URL it is downloaded from
+VENDOR_ASSETS = {
+    'vendor/bootstrap/bootstrap.min.css': f'{BOOTSTRAP}/css/bootstrap.min.css',
+    'vendor/bootstrap/bootstrap.bundle.min.js': f'{BOOTSTRAP}/js/bootstrap.bundle.min.js',
+    'vendor/fontawesome/css/all.min.css': f'{FONT_AWESOME}/css/all.min.css',
+    **{f'vendor/fontawesome/webfonts/{font}': f'{FONT_AWESOME}/webfonts/{font}'
+       for name in ('fa-solid-900', 'fa-regular-400', 'fa-brands-400', 'fa-v4compatibility')
+       for font in (f'{name}.woff2', f'{name}.ttf')},
+}
+
+CSS_URL = re.compile(r'''url\(\s*(['"]?)([^'")]+)\1\s*\)''')
+
+
+def fetch_vendor(static_dir, force=False):
+    """Download the VENDOR_ASSETS that aren't in static_dir yet. Returns the paths fetched."""
+    import urllib.request
+    
+    fetched = []
+    for path, url in VENDOR_ASSETS.items():
+        target = os.path.join(static_dir, path)
+        if os.path.exists(target) and not force:
+            continue
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with urllib.request.urlopen(url, timeout=30) as response:
+            atomic_write(target, response.read())
+        fetched.append(path)
+    return fetched
+
+
+def hashed_name(path, data):
+    root, ext = posixpath.splitext(path)
+    return f'{root}.{hashlib.sha256(data).hexdigest()[:12]}{ext}'
+
+
+def rewrite_css_urls(path, css, manifest):
+    """Point url() references in the stylesheet at path to the hashed files"""
+    directory = posixpath.dirname(path)
+
+    def replace(match):
+        quote, url = match.groups()
+        if re.match(r'^([a-z]+:|//|#)', url):
+            return match.group(0)
+        # Keep ?query and #fragment, such as the ones on font URLs
+        target, suffix = re.match(r'([^?#]*)(.*)', url).groups()
+        resolved = posixpath.normpath(posixpath.join(directory, target))
+        if resolved not in manifest:
+            return match.group(0)
+        # Relative to where the hashed stylesheet is written
+        relative = posixpath.relpath(manifest[resolved], posixpath.join(DIST_DIR, directory))
+        return f'url({quote}{relative}{suffix}{quote})'
+
+    return CSS_URL.sub(replace, css.decode('utf-8')).encode('utf-8')
+
+
+def compress_variants(path):
+    """Write path.gz and, when brotli is installed, path.br, if they are smaller"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    variants = {'.gz': gzip.compress(data, compresslevel=9, mtime=0)}
+    try:
+        import brotli
+        variants['.br'] = brotli.compress(data, quality=11)
+    except ImportError:
+        pass
+    for suffix, compressed in variants.items():
+        if len(compressed) < len(data) * 0.9:
+            atomic_write(path + suffix, compressed)
+
+
+def source_files(static_dir):
+    """Paths under static_dir to fingerprint, relative and with / separators"""
+    for root, dirs, files in os.walk(static_dir):
+        relative_root = os.path.relpath(root, static_dir)
+        if relative_root == '.':
+            dirs[:] = [d for d in dirs if d != DIST_DIR]
+        dirs[:] = [d for d in dirs if not d.startswith('.')]
+        for filename in files:
+            if filename.startswith('.') or filename.endswith(('.gz', '.br')):
+                continue
+            yield posixpath.normpath(posixpath.join(relative_root.replace(os.sep, '/'), filename))
+
+
+def build_assets(static_dir):
+    """Fingerprint and compress everything in static_dir into static_dir/dist.
+    Returns the manifest: {path: hashed path}, both relative to static_dir.
+    
+    Files from earlier builds are left in place, so pages rendered by a worker
+    that still has the old manifest keep working; delete static/dist to clear
+    them out.
+    """
+    dist_dir = os.path.join(static_dir, DIST_DIR)
+    paths = sorted(source_files(static_dir), key=lambda p: (p.endswith('.css'), p))
+    manifest = {}
+    # Everything else before the stylesheets, so their url()s can be rewritten
+    for path in paths:
+        with open(os.path.join(static_dir, path), 'rb') as f:
+            data = f.read()
+        if path.endswith('.css'):
+            data = rewrite_css_urls(path, data, manifest)
+        name = hashed_name(path, data)
+        target = os.path.join(dist_dir, name)
+        if not os.path.exists(target):
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            atomic_write(target, data)
+            if posixpath.splitext(path)[1] in COMPRESSIBLE:
+                compress_variants(target)
+        manifest[path] = posixpath.join(DIST_DIR, name)
+
+    # The manifest last, so it never names a file that isn't there yet
+    atomic_write(os.path.join(dist_dir, MANIFEST_FILE),
+                 json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'))
+    return manifest
+
+
+def atomic_write(path, data):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.', suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.chmod(tmp_path, 0o644)
+    os.replace(tmp_path, path)
+
+
+def load_manifest(static_dir):
+    """The manifest from the last build, or {} if the assets haven't been built"""
+    try:
+        with open(os.path.join(static_dir, DIST_DIR, MANIFEST_FILE)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except ValueError as e:
+        logger.error(f"Error reading the asset manifest: {e}")
+        return {}
@@ -0,0 +1,5 @@
+"""Benchmarks for the Flask routes.
+
+Run with `python -m bench` ( or `just bench` ). See bench/__main__.py for the
+options and bench/fixtures.py for the synthetic data.
+"""
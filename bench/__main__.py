@@ -0,0 +1,58 @@
+"""Command line for the benchmarks: python -m bench --help"""
+
+import argparse
+import json
+import os
+import sys
+
+from bench.runner import DEFAULT_SIZES, compare, run_benchmarks
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m bench', description=__doc__)
+    parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)),
+                        help='Comma separated respondent counts, one schedule each')
+    parser.add_argument('--many', type=int, default=1000,
+                        help='Number of small schedules for the many-schedules fixture')
+    parser.add_argument('--iterations', type=int, default=200, help='Requests per scenario')
+    parser.add_argument('--backend', choices=['file', 'sqlite'], default='file')
+    parser.add_argument('--threads', type=int, default=8,
+                        help='Writers in the concurrent scenario, 0 to skip it')
+    parser.add_argument('--writes', type=int, default=25, help='Saves per concurrent writer')
+    parser.add_argument('--scenario', action='append', help='Only run this scenario; repeatable')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--data-dir', help='Build the fixtures here instead of a temporary directory')
+    parser.add_argument('--output', help='Results file, default bench/results/<time>-<commit>.json')
+    parser.add_argument('--compare', help='Earlier results file to compare against')
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(
+        sizes=[int(size) for size in args.sizes.split(',') if size],
+        many_schedules=args.many, iterations=args.iterations, backend=args.backend,
+        threads=args.threads, writes_per_thread=args.writes, seed=args.seed,
+        data_dir=args.data_dir, scenarios=args.scenario, progress=print)
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = results['meta']['timestamp'][:19].replace(':', '')
+        output = os.path.join(RESULTS_DIR, f"{stamp}-{results['meta']['commit'] or 'nogit'}.json")
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Wrote {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            for line in compare(json.load(f), results):
+                print(line)
+
+    if any(result.get('consistent') is False for result in results['results']):
+        print("Aggregate did not match the responses after concurrent writes", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,245 @@
+"""Concurrency benchmark: python -m bench.asgi --help
+
+Compares the sync serving path with asgi.py when many clients are waiting at
+once. Both run in this process against the same fixtures:
+
+* sync: --workers threads each take one request at a time and run the app to
+  the end, the way `gunicorn -w N app:app` sync workers do, reading a
+  schedule's user files one after another ( STORAGE_READ_THREADS=0 ).
+* asgi: every client is a coroutine calling the ASGI application, which runs
+  the app on --threads threads and reads user files on --read-threads.
+
+Each of --clients clients sends its requests one after another, a mix of
+/s/<id>/info, /u/<id>/<user>/selections and /s/<id>/best ( which reads every
+respondent ). Latency counts from when the client sends the request, so time
+spent queued behind a busy worker is included. --read-latency adds a sleep to
+every file read, standing in for a slow volume, which is where the two paths
+differ. The cache is off, so every request reads its files.
+
+Threads in one process share the GIL, unlike gunicorn's worker processes, so
+CPU bound work favours neither path here; this measures waiting, not parsing.
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from unittest import mock
+
+from bench import fixtures
+from bench.runner import git_commit, summarize
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+
+
+def request_paths(schedule_ids, respondents, count, seed):
+    """`count` request paths, mixing the read routes across the schedules"""
+    rng = random.Random(seed)
+    paths = []
+    for i in range(count):
+        schedule_id = rng.choice(schedule_ids)
+        kind = i % 3
+        if kind == 0:
+            paths.append(f'/s/{schedule_id}/info')
+        elif kind == 1:
+            paths.append(f'/u/{schedule_id}/{fixtures.user_id_for(rng.randrange(respondents))}/selections')
+        else:
+            paths.append(f'/s/{schedule_id}/best')
+    return paths
+
+
+def scope_for(path):
+    return {'type': 'http', 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+            'path': path, 'root_path': '', 'query_string': b'', 'headers': [],
+            'server': ('bench', 80), 'client': ('127.0.0.1', 0)}
+
+
+def run_sync(app, paths, clients, workers):
+    """Clients in threads, with at most `workers` requests in the app at once"""
+    from asgi import wsgi_environ
+
+    slots = threading.BoundedSemaphore(workers)
+    queue = list(reversed(paths))
+    guard = threading.Lock()
+    latencies = []
+    errors = []
+
+    def client():
+        while True:
+            with guard:
+                if not queue:
+                    return
+                path = queue.pop()
+            started = time.perf_counter()
+            with slots:
+                status = []
+                result = app(wsgi_environ(scope_for(path), io.BytesIO()),
+                             lambda s, headers, exc_info=None: status.append(s))
+                b''.join(result)
+                if hasattr(result, 'close'):
+                    result.close()
+            with guard:
+                latencies.append(time.perf_counter() - started)
+                if not status[0].startswith('200'):
+                    errors.append(f"{path}: {status[0]}")
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors, time.perf_counter() - started
+
+
+def run_asgi(application, paths, clients):
+    """Clients as coroutines on one event loop, calling the ASGI application"""
+    queue = list(reversed(paths))
+    latencies = []
+    errors = []
+
+    async def request(path):
+        messages = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            messages.append(message)
+
+        await application(scope_for(path), receive, send)
+        return messages[0]['status']
+
+    async def client():
+        while queue:
+            path = queue.pop()
+            started = time.perf_counter()
+            status = await request(path)
+            latencies.append(time.perf_counter() - started)
+            if status != 200:
+                errors.append(f"{path}: {status}")
+
+    async def main():
+        started = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(clients)))
+        return time.perf_counter() - started
+
+    elapsed = asyncio.run(main())
+    return latencies, errors, elapsed
+
+
+def run_asgi_benchmark(requests=600, clients=200, workers=4, threads=32, read_threads=8,
+                       read_latency=0.005, schedules=10, respondents=50, seed=1, progress=None):
+    from app import app, init_storage
+    from asgi import Application
+    from storage import FileStorage
+
+    progress = progress or (lambda line: None)
+    data_dir = tempfile.mkdtemp(prefix='scheduler-bench-asgi-')
+    old_config = dict(app.config)
+    app.config.update(DATA_DIR=data_dir, STORAGE_BACKEND='file', SQLITE_PATH=None, CACHE_SIZE=0,
+                      COMPRESS_MIN_SIZE=-1)
+    logging.disable(logging.INFO)
+
+    read_json = FileStorage._read_json
+
+    def slow_read_json(self, file_path, what):
+        time.sleep(read_latency)
+        return read_json(self, file_path, what)
+
+    results = {}
+    try:
+        storage = init_storage(app)
+        rng = random.Random(seed)
+        schedule_ids = [f'a{n:03d}' for n in range(schedules)]
+        for schedule_id in schedule_ids:
+            fixtures.build_schedule(storage, schedule_id, respondents, rng)
+        paths = request_paths(schedule_ids, respondents, requests, seed)
+        progress(f"Built {schedules} schedules of {respondents} respondents")
+
+        with mock.patch.object(FileStorage, '_read_json', slow_read_json):
+            app.config['STORAGE_READ_THREADS'] = 0
+            init_storage(app)
+            latencies, errors, elapsed = run_sync(app, paths, clients, workers)
+            results['sync'] = {**summarize(latencies, elapsed), 'errors': len(errors), 'workers': workers}
+            progress(format_result('sync', results['sync']))
+
+            app.config['STORAGE_READ_THREADS'] = read_threads
+            init_storage(app)
+            application = Application(app, threads)
+            try:
+                latencies, errors, elapsed = run_asgi(application, paths, clients)
+            finally:
+                application.executor.shutdown()
+            results['asgi'] = {**summarize(latencies, elapsed), 'errors': len(errors),
+                               'threads': threads, 'read_threads': read_threads}
+            progress(format_result('asgi', results['asgi']))
+    finally:
+        logging.disable(logging.NOTSET)
+        app.config.clear()
+        app.config.update(old_config)
+        init_storage(app)
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    results['meta'] = {
+        'timestamp': datetime.now().isoformat(),
+        'commit': git_commit(),
+        'python': sys.version.split()[0],
+        'requests': requests,
+        'clients': clients,
+        'read_latency_ms': read_latency * 1000,
+        'schedules': schedules,
+        'respondents': respondents,
+        'seed': seed,
+    }
+    return results
+
+
+def format_result(name, result):
+    return (f"{name:>6}  p50 {result['p50_ms']:.1f}ms  p99 {result['p99_ms']:.1f}ms  "
+            f"max {result['max_ms']:.1f}ms  {result['rps']} req/s  errors {result['errors']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m bench.asgi', description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=600, help='Requests in all, shared by the clients')
+    parser.add_argument('--clients', type=int, default=200, help='Concurrent clients')
+    parser.add_argument('--workers', type=int, default=4, help='Sync workers')
+    parser.add_argument('--threads', type=int, default=32, help='ASGI_THREADS for the asgi run')
+    parser.add_argument('--read-threads', type=int, default=8, help='STORAGE_READ_THREADS for the asgi run')
+    parser.add_argument('--read-latency', type=float, default=5,
+                        help='Milliseconds added to every file read')
+    parser.add_argument('--schedules', type=int, default=10)
+    parser.add_argument('--respondents', type=int, default=50, help='Respondents per schedule')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='Results file, default bench/results/asgi-<time>-<commit>.json')
+    args = parser.parse_args(argv)
+
+    results = run_asgi_benchmark(requests=args.requests, clients=args.clients, workers=args.workers,
+                                 threads=args.threads, read_threads=args.read_threads,
+                                 read_latency=args.read_latency / 1000, schedules=args.schedules,
+                                 respondents=args.respondents, seed=args.seed, progress=print)
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = results['meta']['timestamp'][:19].replace(':', '')
+        output = os.path.join(RESULTS_DIR, f"asgi-{stamp}-{results['meta']['commit'] or 'nogit'}.json")
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Wrote {output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
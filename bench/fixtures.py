@@ -0,0 +1,63 @@
+"""Synthetic DATA_DIR fixtures for the benchmarks.
+
+Schedules are written through the storage backend, the same way the app writes
+them, so a fixture is valid for either STORAGE_BACKEND. Selections are random
+but seeded, so two runs with the same seed benchmark the same data.
+"""
+
+import random
+from datetime import datetime
+
+import dayhours
+
+CREATOR_ID = 'creator'
+PASSWORD = 'benchpw'
+
+
+def random_selections(rng, density=0.3):
+    """A random set of dayhours, about `density` of the grid"""
+    return [dh for dh in dayhours.DAYHOURS if rng.random() < density]
+
+
+def user_id_for(n):
+    return f'u{n:05d}'
+
+
+def build_schedule(storage, schedule_id, respondents, rng):
+    """Write a schedule with `respondents` users and its aggregate"""
+    from app import rebuild_aggregate
+
+    now = datetime.now().isoformat()
+    storage.save_schedule(schedule_id, {
+        'id': schedule_id,
+        'password': PASSWORD,
+        'name': f'Benchmark {respondents}',
+        'description': '',
+        'created_at': now,
+        'creator_id': CREATOR_ID,
+        'blackouts': random_selections(rng, 0.05)
+    })
+    with storage.lock(schedule_id):
+        for n in range(respondents):
+            storage.save_user(schedule_id, user_id_for(n), {
+                'name': f'User {n}',
+                'selections': random_selections(rng),
+                'updated_at': now
+            })
+        rebuild_aggregate(schedule_id)
+
+
+def build_fixtures(storage, sizes, many_schedules=0, many_respondents=5, seed=1):
+    """Build one schedule per size in `sizes`, named r<size>, and
+    `many_schedules` small schedules named m<n>. Returns the ids by name."""
+    rng = random.Random(seed)
+    schedules = {}
+    for size in sizes:
+        schedule_id = f'r{size}'
+        build_schedule(storage, schedule_id, size, rng)
+        schedules[schedule_id] = size
+    for n in range(many_schedules):
+        schedule_id = f'm{n:05d}'
+        build_schedule(storage, schedule_id, many_respondents, rng)
+        schedules[schedule_id] = many_respondents
+    return schedules
@@ -0,0 +1,261 @@
+"""Run the route benchmarks against synthetic fixtures and collect the results.
+
+Every scenario drives the app through Flask's test client, so the numbers
+cover routing, sessions, storage and JSON encoding, but not the network or
+gunicorn.
+"""
+
+import logging
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+import dayhours
+from bench import fixtures
+
+DEFAULT_SIZES = [1, 100, 1000, 10000]
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, round(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies, elapsed):
+    """Latency percentiles in milliseconds, and requests per second"""
+    latencies = sorted(latencies)
+    ms = lambda seconds: round(seconds * 1000, 3)
+    return {
+        'requests': len(latencies),
+        'p50_ms': ms(percentile(latencies, 50)),
+        'p90_ms': ms(percentile(latencies, 90)),
+        'p99_ms': ms(percentile(latencies, 99)),
+        'mean_ms': ms(sum(latencies) / len(latencies)),
+        'max_ms': ms(latencies[-1]),
+        'rps': round(len(latencies) / elapsed, 1) if elapsed else None
+    }
+
+
+def measure(request, iterations, warmup=5):
+    """Call request(i) `iterations` times after a warmup, timing each call.
+    request() returns the response; an unexpected status stops the benchmark."""
+    for i in range(warmup):
+        request(i)
+    latencies = []
+    started = time.perf_counter()
+    for i in range(iterations):
+        t = time.perf_counter()
+        request(i)
+        latencies.append(time.perf_counter() - t)
+    return summarize(latencies, time.perf_counter() - started)
+
+
+def checked(response, *statuses):
+    if response.status_code not in (statuses or (200,)):
+        raise RuntimeError(f"{response.request.path}: unexpected status {response.status_code}")
+    return response
+
+
+def make_client(app, user_id, name=None):
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = user_id
+        if name:
+            sess['name'] = name
+    return client
+
+
+def route_scenarios(app, schedule_ids, rng):
+    """The single-request scenarios, as {name: request(i)}. Each request picks
+    a schedule from schedule_ids, so a list of many small schedules spreads
+    the load the way production traffic does."""
+    owner = make_client(app, fixtures.CREATOR_ID, 'Owner')
+    respondent = make_client(app, fixtures.user_id_for(0), 'User 0')
+    pick = lambda i: schedule_ids[i % len(schedule_ids)]
+    info_etags = {}
+    # Up to 50 schedules per combined query, the size of a coordinator's set
+    combined = lambda i: '&'.join(f'schedule={pick(i + k)}' for k in range(min(50, len(schedule_ids))))
+
+    def info_304(i):
+        schedule_id = pick(i)
+        if schedule_id not in info_etags:
+            info_etags[schedule_id] = checked(owner.get(f'/s/{schedule_id}/info')).headers['ETag']
+        return checked(owner.get(f'/s/{schedule_id}/info',
+                                 headers={'If-None-Match': info_etags[schedule_id]}), 304)
+
+    return {
+        'schedule_info': lambda i: checked(owner.get(f'/s/{pick(i)}/info')),
+        'schedule_info_304': info_304,
+        'schedule_info_bits': lambda i: checked(owner.get(f'/s/{pick(i)}/info?format=bits')),
+        'combined_info': lambda i: checked(owner.get(f'/combined/info?{combined(i)}')),
+        'schedule_page': lambda i: checked(owner.get(f'/s/{pick(i)}?pw={fixtures.PASSWORD}')),
+        'selections_get': lambda i: checked(respondent.get(
+            f'/u/{pick(i)}/{fixtures.user_id_for(0)}/selections')),
+        'selections_post': lambda i: checked(respondent.post(
+            f'/u/{pick(i)}/{fixtures.user_id_for(0)}/selections',
+            json=fixtures.random_selections(rng))),
+        'selections_patch': lambda i: checked(respondent.patch(
+            f'/u/{pick(i)}/{fixtures.user_id_for(0)}/selections',
+            json={'add': [rng.choice(dayhours.DAYHOURS)], 'remove': [rng.choice(dayhours.DAYHOURS)]})),
+        'blackouts_get': lambda i: checked(owner.get(f'/s/{pick(i)}/blackouts')),
+        'blackouts_post': lambda i: checked(owner.post(
+            f'/s/{pick(i)}/blackouts', json=fixtures.random_selections(rng, 0.05))),
+    }
+
+
+def concurrent_writers(app, schedule_id, threads, per_thread, seed):
+    """Several clients saving selections to one schedule at once. Afterwards
+    the aggregate is checked against a recount of the user responses."""
+    from app import get_aggregate_data, get_all_users_for_schedule
+
+    barrier = threading.Barrier(threads)
+    latencies = []
+    errors = []
+    guard = threading.Lock()
+
+    def writer(t):
+        rng = random.Random(seed + t)
+        client = make_client(app, f'w{t:03d}', f'Writer {t}')
+        url = f'/u/{schedule_id}/w{t:03d}/selections'
+        barrier.wait()
+        for _ in range(per_thread):
+            start = time.perf_counter()
+            try:
+                checked(client.post(url, json=fixtures.random_selections(rng)))
+            except Exception as e:
+                with guard:
+                    errors.append(str(e))
+                continue
+            with guard:
+                latencies.append(time.perf_counter() - start)
+
+    workers = [threading.Thread(target=writer, args=(t,)) for t in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+
+    users = get_all_users_for_schedule(schedule_id)
+    expected = Counter(dh for user in users for dh in set(user['selections']))
+    aggregate = get_aggregate_data(schedule_id)
+
+    result = summarize(latencies, elapsed) if latencies else {'requests': 0}
+    result.update({
+        'threads': threads,
+        'errors': len(errors),
+        'consistent': aggregate['count'] == len(users) and aggregate['dayhours'] == dict(expected)
+    })
+    return result
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(sizes=DEFAULT_SIZES, many_schedules=1000, iterations=200, backend='file',
+                   threads=8, writes_per_thread=25, seed=1, data_dir=None, scenarios=None,
+                   progress=None):
+    """Build the fixtures, run every scenario and return the results dict.
+
+    data_dir: where to build the fixtures. Defaults to a temporary directory
+    that is removed afterwards.
+    scenarios: names of the route scenarios to run, default all of them.
+    progress: called with a line of text as each result comes in.
+    """
+    from app import app, init_storage
+
+    progress = progress or (lambda line: None)
+    temporary = data_dir is None
+    data_dir = data_dir or tempfile.mkdtemp(prefix='scheduler-bench-')
+    old_config = dict(app.config)
+    # Every request comes from one client, far over the write budgets
+    app.config.update(DATA_DIR=data_dir, STORAGE_BACKEND=backend, SQLITE_PATH=None,
+                      RATE_LIMIT_NEW=None, RATE_LIMIT_USER=None, RATE_LIMIT_IP=None,
+                      RATE_LIMIT_SCHEDULE=None)
+    logging.disable(logging.INFO)
+
+    results = []
+    try:
+        storage = init_storage(app)
+        started = time.perf_counter()
+        schedules = fixtures.build_fixtures(storage, sizes, many_schedules, seed=seed)
+        progress(f"Built {len(schedules)} schedules in {time.perf_counter() - started:.1f}s")
+
+        groups = [(f'r{size}', [f'r{size}'], size) for size in sizes]
+        many_ids = [schedule_id for schedule_id in schedules if schedule_id.startswith('m')]
+        if many_ids:
+            groups.append((f'{len(many_ids)} schedules', many_ids, schedules[many_ids[0]]))
+
+        rng = random.Random(seed)
+        for label, schedule_ids, respondents in groups:
+            for name, request in route_scenarios(app, schedule_ids, rng).items():
+                if scenarios and name not in scenarios:
+                    continue
+                result = dict(scenario=name, fixture=label, schedules=len(schedule_ids),
+                              respondents=respondents, **measure(request, iterations))
+                results.append(result)
+                progress(f"{label:>16} {name:<20} p50 {result['p50_ms']:>9.3f}ms "
+                         f"p99 {result['p99_ms']:>9.3f}ms {result['rps']:>8} req/s")
+
+            if threads and (not scenarios or 'concurrent_writers' in scenarios):
+                result = dict(scenario='concurrent_writers', fixture=label,
+                              schedules=1, respondents=respondents,
+                              **concurrent_writers(app, schedule_ids[0], threads,
+                                                   writes_per_thread, seed))
+                results.append(result)
+                progress(f"{label:>16} {'concurrent_writers':<20} p50 {result.get('p50_ms')}ms "
+                         f"{result.get('rps')} req/s consistent={result['consistent']}")
+    finally:
+        logging.disable(logging.NOTSET)
+        app.config.clear()
+        app.config.update(old_config)
+        init_storage(app)
+        if temporary:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    return {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': datetime.now().isoformat(),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'backend': backend,
+            'cache_size': old_config.get('CACHE_SIZE'),
+            'iterations': iterations,
+            'seed': seed
+        },
+        'results': results
+    }
+
+
+def compare(old, new):
+    """Lines comparing two results dicts, matching scenarios by name and fixture"""
+    key = lambda result: (result['scenario'], result['fixture'])
+    previous = {key(result): result for result in old['results']}
+    lines = [f"{'fixture':>16} {'scenario':<20} {'p50 before':>11} {'p50 after':>10} {'change':>8}"]
+    for result in new['results']:
+        before = previous.get(key(result))
+        if not before or not before.get('p50_ms') or not result.get('p50_ms'):
+            continue
+        change = (result['p50_ms'] - before['p50_ms']) / before['p50_ms'] * 100
+        lines.append(f"{result['fixture']:>16} {result['scenario']:<20} {before['p50_ms']:>11.3f} "
+                     f"{result['p50_ms']:>10.3f} {change:>+7.1f}%")
+    return lines
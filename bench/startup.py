@@ -0,0 +1,195 @@
+"""Startup benchmark: python -m bench.startup --help
+
+Measures what a new gunicorn worker pays before its first request. Each run
+starts a fresh interpreter that imports app.py and reports the import time,
+the whole process time and the peak resident memory. With --gunicorn it also
+starts gunicorn with one worker and times it to the first answered request,
+reading the worker's resident memory from /proc.
+
+--app-dir runs the same measurement against another checkout ( e.g. a
+`git worktree` of an older commit ), so two trees can be compared directly.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from datetime import datetime
+
+from bench.runner import git_commit
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+
+# Runs in the child interpreter, in the app directory
+IMPORT_PROBE = '''
+import json, resource, sys, time
+started = time.perf_counter()
+import app
+elapsed = time.perf_counter() - started
+print(json.dumps({
+    'import_seconds': elapsed,
+    'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    'modules': len(sys.modules),
+    'numpy_loaded': 'numpy' in sys.modules,
+}))
+'''
+
+
+def child_env(data_dir):
+    env = dict(os.environ, DATA_DIR=data_dir, PYTHONDONTWRITEBYTECODE='1')
+    env.pop('METRICS_DIR', None)
+    return env
+
+
+def measure_import(app_dir, data_dir):
+    started = time.perf_counter()
+    output = subprocess.run([sys.executable, '-c', IMPORT_PROBE], cwd=app_dir, env=child_env(data_dir),
+                            capture_output=True, text=True, check=True).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    result['process_seconds'] = time.perf_counter() - started
+    return result
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def process_rss_kb(pid):
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    return None
+
+
+def worker_pids(master_pid):
+    try:
+        with open(f'/proc/{master_pid}/task/{master_pid}/children') as f:
+            return [int(pid) for pid in f.read().split()]
+    except OSError:
+        return []
+
+
+def measure_gunicorn(app_dir, data_dir, worker_class='sync', timeout=30):
+    """Seconds from starting gunicorn to its worker answering /, and the worker's RSS"""
+    port = free_port()
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-w', '1', '-k', worker_class, '-b', f'127.0.0.1:{port}',
+         'app:app'], cwd=app_dir, env=child_env(data_dir),
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while True:
+            try:
+                with urllib.request.urlopen(f'http://127.0.0.1:{port}/', timeout=1) as response:
+                    response.read()
+                break
+            except OSError:
+                if server.poll() is not None:
+                    raise RuntimeError('gunicorn exited before answering')
+                if time.perf_counter() - started > timeout:
+                    raise RuntimeError(f'gunicorn did not answer within {timeout}s')
+                time.sleep(0.01)
+        elapsed = time.perf_counter() - started
+        workers = worker_pids(server.pid)
+        return {'boot_seconds': elapsed,
+                'worker_rss_kb': process_rss_kb(workers[0]) if workers else None}
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+
+
+def summarize(runs):
+    """Median of each numeric measurement over the runs"""
+    return {key: statistics.median(run[key] for run in runs)
+            for key, value in runs[0].items()
+            if isinstance(value, (int, float)) and not isinstance(value, bool)
+            and all(run[key] is not None for run in runs)}
+
+
+def run_startup(app_dir, runs=10, gunicorn=False, worker_class='sync', progress=None):
+    data_dir = tempfile.mkdtemp(prefix='scheduler-startup-')
+    try:
+        imports = [measure_import(app_dir, data_dir) for _ in range(runs)]
+        results = {'import': summarize(imports), 'numpy_loaded': imports[0]['numpy_loaded']}
+        if progress:
+            progress(format_summary('import', results['import']))
+        if gunicorn:
+            boots = [measure_gunicorn(app_dir, data_dir, worker_class) for _ in range(runs)]
+            results['gunicorn'] = summarize(boots)
+            if progress:
+                progress(format_summary(f'gunicorn ({worker_class})', results['gunicorn']))
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    results['meta'] = {
+        'timestamp': datetime.now().isoformat(),
+        'commit': git_commit(),
+        'app_dir': os.path.abspath(app_dir),
+        'python': sys.version.split()[0],
+        'runs': runs,
+    }
+    return results
+
+
+def format_summary(name, summary):
+    return f"{name:>20} " + '  '.join(
+        f"{key} {value * 1000:.1f}ms" if key.endswith('_seconds') else f"{key} {value:g}"
+        for key, value in summary.items())
+
+
+def compare(old, new):
+    """Lines showing the change in each measurement"""
+    lines = [f"{'measurement':>32} {'before':>10} {'after':>10} {'change':>8}"]
+    for section in ('import', 'gunicorn'):
+        for key, after in new.get(section, {}).items():
+            before = old.get(section, {}).get(key)
+            if not before:
+                continue
+            lines.append(f"{section + ' ' + key:>32} {before:>10.6g} {after:>10.6g} "
+                         f"{(after - before) / before * 100:>+7.1f}%")
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m bench.startup', description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--app-dir', default=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        help='Checkout to measure, default this one')
+    parser.add_argument('--runs', type=int, default=10, help='Fresh processes per measurement')
+    parser.add_argument('--gunicorn', action='store_true', help='Also time gunicorn worker boot')
+    parser.add_argument('--worker-class', default='sync', help='gunicorn worker class for --gunicorn')
+    parser.add_argument('--output', help='Results file, default bench/results/startup-<time>-<commit>.json')
+    parser.add_argument('--compare', help='Earlier startup results file to compare against')
+    args = parser.parse_args(argv)
+
+    results = run_startup(args.app_dir, runs=args.runs, gunicorn=args.gunicorn,
+                          worker_class=args.worker_class, progress=print)
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = results['meta']['timestamp'][:19].replace(':', '')
+        output = os.path.join(RESULTS_DIR, f"startup-{stamp}-{results['meta']['commit'] or 'nogit'}.json")
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Wrote {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            for line in compare(json.load(f), results):
+                print(line)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,88 @@
+"""A small in-process LRU cache for parsed storage reads.
+
+Every entry carries a stamp, such as the file's inode, mtime and size. A
+lookup only hits when the caller's current stamp matches the stored one, so a
+file rewritten by another gunicorn worker is never served stale; the stat()
+that makes the stamp is much cheaper than opening and parsing the file.
+
+Entries are evicted when the cache is over its size, least recently used
+first, and expire after a TTL.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+MISSING = object()
+
+
+class LRUCache:
+
+    def __init__(self, maxsize=1024, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key, stamp):
+        """Return the value cached for key with this stamp, or MISSING"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return MISSING
+
+            entry_stamp, expires, value = entry
+            if entry_stamp != stamp:
+                del self._entries[key]
+                self.invalidations += 1
+                self.misses += 1
+                return MISSING
+            if expires < time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return MISSING
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, stamp, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (stamp, time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else None,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations
+            }
@@ -0,0 +1,91 @@
+"""Merge concurrent writes to the same record into one write.
+
+When several requests change the same record at nearly the same time ( a
+user clicking quickly through the grid ), each would normally take the lock,
+read the record, write it and fsync it in turn. A WriteCoalescer queues them
+by key instead: the first request to arrive becomes the leader, waits up to
+`window` seconds, takes the lock and writes every change queued by then in
+one go. Requests that arrive while the leader waits or writes simply wait
+for it. Every request still returns only after its change is on disk.
+
+Coalescing only happens between requests handled by the same process, so
+it helps most with gevent or threaded workers. Across processes the lock
+keeps writes correct, as it does for every other route.
+"""
+
+import threading
+import time
+from contextlib import nullcontext
+
+
+class _Pending:
+    __slots__ = ('item', 'result', 'error', 'done')
+
+    def __init__(self, item):
+        self.item = item
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class WriteCoalescer:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._queues = {}
+        self.batches = 0
+        self.items = 0
+
+    def submit(self, key, item, flush, guard=None, window=0.0):
+        """Queue item under key and return its result once it has been written.
+
+        flush(items) is called in the leader's thread with the queued items,
+        oldest first, and returns a list with one result for each.
+        guard: a function returning a context manager ( such as a storage lock )
+        that is held while the queue is taken and flushed.
+        """
+        pending = _Pending(item)
+        with self._lock:
+            queue = self._queues.get(key)
+            leader = queue is None
+            if leader:
+                queue = self._queues[key] = []
+            queue.append(pending)
+
+        if not leader:
+            pending.done.wait()
+            if pending.error is not None:
+                raise pending.error
+            return pending.result
+
+        if window > 0:
+            time.sleep(window)
+        batch = []
+        try:
+            with guard() if guard else nullcontext():
+                # Take the queue only once we hold the lock, so requests that
+                # arrived while we waited for it are written with ours
+                with self._lock:
+                    batch = self._queues.pop(key)
+                    self.batches += 1
+                    self.items += len(batch)
+                results = flush([p.item for p in batch])
+            for p, result in zip(batch, results):
+                p.result = result
+        except Exception as e:
+            if not batch:
+                with self._lock:
+                    batch = self._queues.pop(key, [pending])
+            for p in batch:
+                p.error = e
+        finally:
+            for p in batch:
+                p.done.set()
+
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def stats(self):
+        with self._lock:
+            return {'batches': self.batches, 'items': self.items}
@@ -0,0 +1,109 @@
+"""Negotiated gzip and brotli compression of responses.
+
+compress_response() is called from an after_request hook. It compresses JSON,
+HTML, CSV and NDJSON responses of at least min_size bytes with brotli when the
+client accepts it and the brotli package is installed, otherwise gzip.
+Streamed responses ( /bulk/export ) are compressed chunk by chunk as they are
+sent. Responses that are already encoded, such as the precompressed static
+assets, and event streams, which must reach the client as they are written,
+are left alone.
+"""
+
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = {
+    'application/json', 'application/x-ndjson', 'application/javascript',
+    'text/html', 'text/csv', 'text/plain', 'text/css', 'image/svg+xml',
+}
+
+# Fast settings: these responses are built per request, unlike the static
+# assets, which are compressed once at the highest levels
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def choose_encoding(accept_encodings):
+    """'br', 'gzip' or None, from the request's parsed Accept-Encoding"""
+    if brotli and accept_encodings['br']:
+        return 'br'
+    if accept_encodings['gzip']:
+        return 'gzip'
+    return None
+
+
+class Compressor:
+    """Incremental gzip or brotli, with the same interface for both"""
+
+    def __init__(self, encoding):
+        if encoding == 'br':
+            self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+            self._compress = self._compressor.process
+            self._finish = self._compressor.finish
+        else:
+            # wbits 31 writes a gzip header and trailer
+            self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+            self._compress = self._compressor.compress
+            self._finish = self._compressor.flush
+
+    def compress(self, data):
+        return self._compress(data)
+
+    def finish(self):
+        return self._finish()
+
+
+def compress(data, encoding):
+    compressor = Compressor(encoding)
+    return compressor.compress(data) + compressor.finish()
+
+
+def compress_stream(chunks, encoding):
+    """Compress an iterable of bytes as it is consumed"""
+    compressor = Compressor(encoding)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+def compressible(response):
+    return (response.mimetype in COMPRESSIBLE_TYPES
+            and 200 <= response.status_code < 300
+            and response.status_code not in (204, 206)
+            and not response.direct_passthrough
+            and 'Content-Encoding' not in response.headers
+            and 'Content-Range' not in response.headers
+            and 'no-transform' not in response.headers.get('Cache-Control', ''))
+
+
+def compress_response(response, accept_encodings, min_size=1024):
+    """Compress response in place if it is worth it and the client accepts it"""
+    if not compressible(response):
+        return response
+    if not response.is_streamed and response.calculate_content_length() < min_size:
+        return response
+
+    # Caches must keep the compressed and plain copies apart
+    response.vary.add('Accept-Encoding')
+    encoding = choose_encoding(accept_encodings)
+    if not encoding:
+        return response
+
+    if response.is_streamed:
+        response.response = compress_stream(response.iter_encoded(), encoding)
+        response.headers.pop('Content-Length', None)
+    else:
+        response.set_data(compress(response.get_data(), encoding))
+    response.headers['Content-Encoding'] = encoding
+
+    # The body is no longer byte for byte what a strong ETag promised
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
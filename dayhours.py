@@ -0,0 +1,110 @@
+"""Bitset encoding for dayhour selections.
+
+The grid is a fixed 7 days x 14 hours, so any set of dayhours ( like the
+selections of one user, or the blackouts of a schedule ) fits in a 98 bit
+integer. Bit 0 is M08, bit 13 is M21, bit 14 is T08 and so on, day by day.
+
+On disk and on the wire a mask is written as a lowercase hex string.
+"""
+
+DAYS = ['M', 'T', 'W', 'R', 'F', 'S', 'U']
+HOURS = ['08', '09', '10', '11', '12', '13', '14', '15', '16', '17', '18', '19', '20', '21']
+
+# Dayhour keys in bit order
+DAYHOURS = [day + hour for day in DAYS for hour in HOURS]
+DAYHOUR_BITS = {dh: i for i, dh in enumerate(DAYHOURS)}
+
+SLOTS = len(DAYHOURS)
+FULL_MASK = (1 << SLOTS) - 1
+
+
+def to_mask(dayhours):
+    """Convert an iterable of dayhour keys to a mask. Raises ValueError for keys
+    that are not on the grid."""
+    mask = 0
+    for dh in dayhours:
+        try:
+            mask |= 1 << DAYHOUR_BITS[dh]
+        except (KeyError, TypeError):
+            raise ValueError(f"Not a dayhour: {dh!r}")
+    return mask
+
+
+def from_mask(mask):
+    """Convert a mask to a list of dayhour keys, in grid order"""
+    return [DAYHOURS[i] for i in iter_bits(mask)]
+
+
+def iter_bits(mask):
+    """Yield the index of every set bit in a mask, lowest first"""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def encode(mask):
+    """Write a mask as a hex string"""
+    return format(mask, 'x')
+
+
+def decode(text):
+    """Read a hex string written by encode()"""
+    mask = int(text, 16)
+    if mask < 0 or mask > FULL_MASK:
+        raise ValueError(f"Mask out of range: {text!r}")
+    return mask
+
+
+def is_encodable(dayhours):
+    """True if every key in the list is on the grid, so it can be stored as a mask"""
+    return all(dh in DAYHOUR_BITS for dh in dayhours)
+
+
+def pack(dayhours):
+    """Storage form of a list of dayhours: a hex mask when every key is on the
+    grid, otherwise the list itself, so unexpected data is never lost."""
+    if isinstance(dayhours, list) and is_encodable(dayhours):
+        return encode(to_mask(dayhours))
+    return dayhours
+
+
+def unpack(value):
+    """Read a value written by pack(). Plain lists from older files pass through."""
+    if isinstance(value, str):
+        return from_mask(decode(value))
+    return value
+
+
+def count_masks(masks):
+    """Count how many masks have each bit set. Returns a list of SLOTS ints.
+
+    This works a bit-plane at a time: it keeps a binary counter whose digits
+    are masks, and adds every input mask with carries, so the work per
+    respondent is a few big-int operations instead of a loop over dayhours.
+    """
+    planes = []
+    for mask in masks:
+        carry = mask
+        for i, plane in enumerate(planes):
+            if not carry:
+                break
+            planes[i] = plane ^ carry
+            carry &= plane
+        if carry:
+            planes.append(carry)
+
+    counts = [0] * SLOTS
+    for weight, plane in enumerate(planes):
+        for i in iter_bits(plane):
+            counts[i] += 1 << weight
+    return counts
+
+
+def counts_to_mask(counts, minimum):
+    """Mask of the slots whose count is at least the minimum"""
+    mask = 0
+    for i, count in enumerate(counts):
+        if count >= minimum:
+            mask |= 1 << i
+    return mask
@@ -0,0 +1,35 @@
+# Gunicorn settings, read automatically by `gunicorn app:app` from this directory.
+#
+# The /s/<id>/events stream keeps a connection open for minutes. With the
+# default sync workers every open stream would hold a whole worker, so we use
+# gevent workers, where an idle stream is just a greenlet waiting on a sleep.
+#
+# For the ASGI mode in asgi.py, run it with uvicorn's worker class instead:
+#
+#   gunicorn asgi:application -k uvicorn.workers.UvicornWorker
+#
+# or set GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker. Each worker then
+# runs requests on ASGI_THREADS threads and serves event streams as coroutines.
+import os
+import tempfile
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('GUNICORN_WORKERS', 2))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gevent')
+
+# Open connections per gevent worker, including idle event streams
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 2000))
+
+# Sync workers are restarted when one request runs longer than this, so with
+# GUNICORN_WORKER_CLASS=sync set SSE_MAX_AGE below it. gevent workers are not
+# affected by long streams.
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+
+# Every worker writes its metrics histograms here, so whichever worker answers
+# /metrics can report all of them. Files from the last run are removed on start.
+os.environ.setdefault('METRICS_DIR', os.path.join(tempfile.gettempdir(), 'scheduler-metrics'))
+
+
+def on_starting(server):
+    import metrics
+    metrics.clear_directory(os.environ['METRICS_DIR'])
@@ -0,0 +1,218 @@
+"""Latency histograms in the Prometheus text format, and a request profiler.
+
+Each process keeps its histograms in memory. With a METRICS_DIR every
+process also writes them to <METRICS_DIR>/<pid>.json at most once per
+`flush_interval`, and /metrics adds up the files of every gunicorn worker,
+so it doesn't matter which worker answers the scrape. gunicorn.conf.py
+empties the directory when the server starts.
+
+The profiler runs cProfile on a random sample of requests and keeps the
+slowest few as .prof files ( open them with `python -m pstats` or snakeviz ).
+"""
+
+import atexit
+import bisect
+import cProfile
+import heapq
+import json
+import logging
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds, from half a millisecond to ten seconds
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+                   2.5, 5.0, 10.0)
+
+
+class Metrics:
+
+    def __init__(self, directory=None, flush_interval=1.0, buckets=DEFAULT_BUCKETS):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.buckets = tuple(buckets)
+        self.descriptions = {}
+        # (name, labels) -> counts per bucket ( the last is +Inf ), then sum and count
+        self._histograms = {}
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            atexit.register(self.flush)
+
+    def describe(self, name, text):
+        self.descriptions[name] = text
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [0] * (len(self.buckets) + 3)
+            histogram[bisect.bisect_left(self.buckets, seconds)] += 1
+            histogram[-2] += seconds
+            histogram[-1] += 1
+        if self.directory and time.monotonic() - self._last_flush > self.flush_interval:
+            self.flush()
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Time a block, or a function when used as a decorator"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def snapshot(self):
+        with self._lock:
+            return [[name, list(labels), list(histogram)]
+                    for (name, labels), histogram in self._histograms.items()]
+
+    def flush(self):
+        """Write this process's histograms to METRICS_DIR"""
+        if not self.directory:
+            return
+        self._last_flush = time.monotonic()
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.', suffix='.tmp')
+            with os.fdopen(fd, 'w') as f:
+                json.dump(self.snapshot(), f)
+            os.replace(tmp_path, os.path.join(self.directory, f'{os.getpid()}.json'))
+        except OSError as e:
+            logger.error(f"Error writing metrics: {e}")
+
+    def collect(self):
+        """Every process's histograms added together, as {(name, labels): histogram}"""
+        snapshots = [self.snapshot()]
+        if self.directory:
+            own = f'{os.getpid()}.json'
+            for filename in os.listdir(self.directory):
+                if filename.endswith('.json') and filename != own:
+                    try:
+                        with open(os.path.join(self.directory, filename)) as f:
+                            snapshots.append(json.load(f))
+                    except (OSError, ValueError):
+                        continue  # A worker that died mid-write; it has no newer data anyway
+
+        totals = {}
+        for snapshot in snapshots:
+            for name, labels, histogram in snapshot:
+                key = (name, tuple(tuple(label) for label in labels))
+                if key in totals and len(totals[key]) == len(histogram):
+                    totals[key] = [a + b for a, b in zip(totals[key], histogram)]
+                else:
+                    totals[key] = list(histogram)
+        return totals
+
+    def render(self):
+        """All the histograms in the Prometheus text exposition format"""
+        lines = []
+        by_name = {}
+        for (name, labels), histogram in sorted(self.collect().items()):
+            by_name.setdefault(name, []).append((labels, histogram))
+
+        for name, series in by_name.items():
+            if name in self.descriptions:
+                lines.append(f'# HELP {name} {self.descriptions[name]}')
+            lines.append(f'# TYPE {name} histogram')
+            for labels, histogram in series:
+                cumulative = 0
+                for bound, count in zip(self.buckets + ('+Inf',), histogram):
+                    cumulative += count
+                    le = bound if bound == '+Inf' else repr(float(bound))
+                    lines.append(f'{name}_bucket{format_labels(labels, le=le)} {cumulative}')
+                lines.append(f'{name}_sum{format_labels(labels)} {histogram[-2]}')
+                lines.append(f'{name}_count{format_labels(labels)} {histogram[-1]}')
+        return '\n'.join(lines) + '\n'
+
+
+def format_labels(labels, **extra):
+    pairs = list(labels) + list(extra.items())
+    if not pairs:
+        return ''
+    escape = lambda value: str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{key}="{escape(value)}"' for key, value in pairs) + '}'
+
+
+def clear_directory(directory):
+    """Remove the files of a previous run, so counts start from zero"""
+    if directory and os.path.isdir(directory):
+        for filename in os.listdir(directory):
+            if filename.endswith('.json') or filename.endswith('.tmp'):
+                os.unlink(os.path.join(directory, filename))
+
+
+class TimedProxy:
+    """Wraps an object and times calls to some of its methods.
+
+    kinds maps method names to a label ( such as 'read' or 'write' ); each call
+    is observed as metric{op=<method>, kind=<label>}. Everything else is passed
+    straight through.
+    """
+
+    def __init__(self, target, metrics, metric, kinds):
+        self._target = target
+        self._metrics = metrics
+        self._metric = metric
+        self._kinds = kinds
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        kind = self._kinds.get(name)
+        if kind is None or not callable(attr):
+            return attr
+
+        def timed(*args, **kwargs):
+            with self._metrics.timer(self._metric, op=name, kind=kind):
+                return attr(*args, **kwargs)
+        return timed
+
+
+class RequestProfiler:
+    """Profiles a random sample of requests, keeping the slowest `keep` per
+    process as .prof files in `directory`"""
+
+    def __init__(self, directory, sample_rate=0.0, keep=20):
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.keep = keep
+        self._slowest = []  # min-heap of (seconds, path)
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start profiling this request if it is sampled. Returns the profile or None."""
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            return None  # Another request in this thread is already being profiled
+        return profile
+
+    def finish(self, profile, seconds, label):
+        profile.disable()
+        with self._lock:
+            if len(self._slowest) >= self.keep and seconds <= self._slowest[0][0]:
+                return None
+            os.makedirs(self.directory, exist_ok=True)
+            name = re.sub(r'[^A-Za-z0-9]+', '_', label).strip('_') or 'request'
+            path = os.path.join(self.directory,
+                                f'{seconds * 1000:09.1f}ms-{name}-{os.getpid()}-{int(time.time())}.prof')
+            profile.dump_stats(path)
+            heapq.heappush(self._slowest, (seconds, path))
+            if len(self._slowest) > self.keep:
+                _, evicted = heapq.heappop(self._slowest)
+                try:
+                    os.unlink(evicted)
+                except OSError:
+                    pass
+            return path
@@ -0,0 +1,104 @@
+"""Rendered pages, kept between the writes that change them.
+
+A page is rendered once with placeholders where the values that differ
+between viewers go ( their user id, their name, their personal link ), and
+the HTML is kept under the page's key with the storage versions of the data
+it was rendered from. Serving it again is a version check, a dict lookup and
+a str.replace() per placeholder: no template, no respondent query.
+
+The versions come from storage, so a write by another worker is seen as soon
+as it lands, like the storage cache in cache.py. Saves in this worker also
+drop the schedule's pages right away, so stale pages don't hold memory. The
+cache is bounded by the total size of the pages it holds, least recently
+used out first.
+"""
+
+import secrets
+import threading
+from collections import OrderedDict
+
+from markupsafe import escape
+
+
+class PageCache:
+
+    def __init__(self, maxbytes):
+        self.maxbytes = maxbytes
+        self._entries = OrderedDict()
+        self._by_schedule = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        # Random, so page content can't contain a placeholder by accident or design
+        self._token = secrets.token_hex(8)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def placeholder(self, name):
+        """Text to render in place of a viewer's value. It is the same once HTML
+        escaped or URL quoted, so it comes out of the template as it went in."""
+        return f'pagecache-{self._token}-{name}'
+
+    def fill(self, html, values):
+        """The page for one viewer: each placeholder replaced by its value, HTML
+        escaped as the template would have"""
+        for name, value in values.items():
+            html = html.replace(self.placeholder(name), str(escape(value)))
+        return html
+
+    def get(self, schedule_id, key, version):
+        """The page cached for key at this version, or None"""
+        with self._lock:
+            entry = self._entries.get((schedule_id, key))
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self._entries.move_to_end((schedule_id, key))
+            self.hits += 1
+            return entry[1]
+
+    def set(self, schedule_id, key, version, html):
+        size = len(html)
+        if size > self.maxbytes:
+            return
+        with self._lock:
+            self._remove((schedule_id, key))
+            self._entries[(schedule_id, key)] = (version, html)
+            self._by_schedule.setdefault(schedule_id, set()).add(key)
+            self._bytes += size
+            while self._bytes > self.maxbytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, schedule_id):
+        """Drop every page of a schedule"""
+        with self._lock:
+            for key in list(self._by_schedule.get(schedule_id, ())):
+                self._remove((schedule_id, key))
+                self.invalidations += 1
+
+    def _remove(self, entry_key):
+        entry = self._entries.pop(entry_key, None)
+        if entry is None:
+            return
+        self._bytes -= len(entry[1])
+        schedule_id, key = entry_key
+        keys = self._by_schedule[schedule_id]
+        keys.discard(key)
+        if not keys:
+            del self._by_schedule[schedule_id]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'bytes': self._bytes,
+                'maxbytes': self.maxbytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else None,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations
+            }
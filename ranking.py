@@ -0,0 +1,79 @@
+"""Rank candidate meeting times from the respondents' selections.
+
+Selections are turned into a users x 98 boolean matrix ( one column per
+dayhour, in the bit order from dayhours.py ) and every step of the ranking is
+a whole-matrix NumPy operation, so the cost grows with the number of
+respondents only through a few array reductions.
+"""
+
+import numpy as np
+
+import dayhours
+
+MASK_BYTES = (dayhours.SLOTS + 7) // 8
+
+
+def availability_matrix(masks):
+    """Convert a list of dayhour masks to a (users, days, hours) boolean array"""
+    raw = b''.join(mask.to_bytes(MASK_BYTES, 'little') for mask in masks)
+    packed = np.frombuffer(raw, dtype=np.uint8).reshape(len(masks), MASK_BYTES)
+    bits = np.unpackbits(packed, axis=1, bitorder='little')[:, :dayhours.SLOTS]
+    return bits.reshape(len(masks), len(dayhours.DAYS), len(dayhours.HOURS)).astype(bool)
+
+
+def block_availability(matrix, hours):
+    """For every block of `hours` contiguous hours, whether each user is free for
+    all of it. Returns a (users, days, starts) array, where a start is an hour
+    index at which a block fits before the end of the day."""
+    # A sliding-window minimum over the hour axis. For booleans that is an AND of
+    # `hours` shifted slices, which is much faster than a strided reduction.
+    starts = matrix.shape[2] - hours + 1
+    blocks = matrix[:, :, :starts].copy()
+    for offset in range(1, hours):
+        blocks &= matrix[:, :, offset:offset + starts]
+    return blocks
+
+
+def rank_slots(masks, blackout_mask=0, hours=1, quorum=1, required=(), limit=10):
+    """Rank the blocks of `hours` contiguous hours on the grid.
+
+    masks: one selection mask per respondent.
+    blackout_mask: dayhours that no block may touch.
+    quorum: the minimum number of respondents available for the whole block.
+    required: indexes into masks of respondents who must all be available.
+
+    Returns up to `limit` dicts, best first: the most respondents available, then
+    the earliest in the week.
+    """
+    day_hours = len(dayhours.HOURS)
+    if not 1 <= hours <= day_hours:
+        raise ValueError(f"hours must be between 1 and {day_hours}")
+    if not masks:
+        return []
+
+    available = block_availability(availability_matrix(masks), hours)
+    scores = available.sum(axis=0)
+
+    blackouts = availability_matrix([blackout_mask])
+    blocked = ~block_availability(~blackouts, hours)[0]
+
+    eligible = ~blocked & (scores >= max(quorum, 1))
+    if len(required):
+        eligible &= available[list(required)].all(axis=0)
+
+    day_index, start_index = np.nonzero(eligible)
+    eligible_scores = scores[day_index, start_index]
+    # lexsort sorts by the last key first: score descending, then day, then hour
+    order = np.lexsort((start_index, day_index, -eligible_scores))[:limit]
+
+    slots = []
+    for i in order:
+        day, start = int(day_index[i]), int(start_index[i])
+        keys = [dayhours.DAYS[day] + dayhours.HOURS[h] for h in range(start, start + hours)]
+        slots.append({
+            'start': keys[0],
+            'dayhours': keys,
+            'count': int(eligible_scores[i]),
+            'ratio': round(int(eligible_scores[i]) / len(masks), 4)
+        })
+    return slots
@@ -0,0 +1,98 @@
+"""Token buckets for limiting writes, shared by every worker.
+
+A bucket holds up to `capacity` tokens and refills at `capacity` tokens per
+`period` seconds. A request takes one token from each of its buckets ( say
+the client's session, its address and the schedule ), or is refused if any
+of them has less than one, without taking from the others. A client can
+burst up to the capacity and then keeps to the refill rate.
+
+Buckets are rows in a small SQLite database in WAL mode, updated in an
+IMMEDIATE transaction, so gunicorn workers share them. A bucket that has
+refilled is the same as no bucket, so rows that are full again are deleted
+from time to time and the table only holds recently active clients.
+"""
+
+import itertools
+import threading
+import time
+
+from storage import connect_sqlite
+
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+
+# Takes between deletions of the buckets that have refilled
+PRUNE_EVERY = 1000
+
+
+def parse_budget(text):
+    """A budget like '30/minute' as (capacity, period seconds), or None for
+    an empty, '0' or 'off' budget. Raises ValueError."""
+    if text is None or text.strip().lower() in ('', '0', 'off'):
+        return None
+    try:
+        count, period = text.split('/')
+        capacity, seconds = int(count), PERIODS[period.strip().lower()]
+    except (KeyError, ValueError):
+        raise ValueError(f"Rate limits look like 30/minute, not {text!r}")
+    if capacity < 1:
+        raise ValueError(f"Rate limits look like 30/minute, not {text!r}")
+    return capacity, seconds
+
+
+class RateLimiter:
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS buckets (
+        key TEXT PRIMARY KEY,
+        tokens REAL NOT NULL,
+        updated REAL NOT NULL,
+        full_at REAL NOT NULL
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS buckets_full ON buckets (full_at);
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._takes = itertools.count(1)
+        with self.db:
+            self.db.executescript(self.SCHEMA)
+
+    @property
+    def db(self):
+        """A connection for the current thread"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = connect_sqlite(self.path)
+        return conn
+
+    def take(self, buckets, now=None):
+        """Take a token from every bucket in `buckets`, a list of (key, (capacity,
+        period)). Returns 0 if they all had one, or else the seconds until they
+        will, having taken nothing."""
+        now = time.time() if now is None else now
+        wait = 0
+        self.db.execute('BEGIN IMMEDIATE')
+        try:
+            levels = []
+            for key, (capacity, period) in buckets:
+                rate = capacity / period
+                row = self.db.execute('SELECT tokens, updated FROM buckets WHERE key = ?',
+                                      (key,)).fetchone()
+                tokens = capacity if row is None else min(capacity, row[0] + (now - row[1]) * rate)
+                if tokens < 1:
+                    wait = max(wait, (1 - tokens) / rate)
+                levels.append((key, tokens - 1, capacity, rate))
+            if not wait:
+                self.db.executemany(
+                    'INSERT OR REPLACE INTO buckets (key, tokens, updated, full_at) VALUES (?, ?, ?, ?)',
+                    [(key, tokens, now, now + (capacity - tokens) / rate)
+                     for key, tokens, capacity, rate in levels])
+            if next(self._takes) % PRUNE_EVERY == 0:
+                self.db.execute('DELETE FROM buckets WHERE full_at < ?', (now,))
+        except BaseException:
+            self.db.rollback()
+            raise
+        else:
+            self.db.commit()
+        return wait
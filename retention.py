@@ -0,0 +1,124 @@
+"""Archive stale schedules and purge abandoned ones, a batch at a time.
+
+Each run walks the schedules in id order from where the last run stopped (
+a small JSON checkpoint file ) and stops after `max_seconds`, so a store with
+millions of schedules is covered over many short runs instead of one long
+pause. When a pass reaches the last schedule the next run starts again from
+the beginning.
+
+For each schedule:
+
+* If nobody has responded, it has no name, description or blackouts, and it
+  was created before `purge_before`, it was a stray click on "New" and is
+  deleted.
+* If its last activity ( the newest of meta.json's updated_at and the
+  response files, not just the index ) is before `archive_before`, it is
+  packed into a single compressed archive. Opening it again restores it.
+
+Every decision is checked again under the schedule's lock before acting.
+"""
+
+import json
+import logging
+import os
+import tempfile
+import time
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+
+def read_checkpoint(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def write_checkpoint(path, checkpoint):
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.', suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, path)
+
+
+def is_unused(storage, schedule_id):
+    """True if a schedule was created and never filled in or answered"""
+    schedule_data = storage.get_schedule(schedule_id)
+    if not schedule_data:
+        return False
+    if any(schedule_data.get(field) for field in ('name', 'description', 'blackouts', 'blackout_intervals')):
+        return False
+    return not storage.list_users(schedule_id)
+
+
+def process_schedule(storage, summary, archive_before, purge_before, dry_run=False):
+    """Archive, purge or keep one schedule. Returns 'archived', 'purged' or None."""
+    schedule_id = summary['id']
+    if storage.is_archived(schedule_id):
+        return None
+
+    unused_candidate = not summary['respondents'] and (summary['created_at'] or '') < purge_before
+    stale_candidate = (summary['updated_at'] or '') < archive_before
+    if not (unused_candidate or stale_candidate):
+        return None
+
+    with storage.lock(schedule_id):
+        if unused_candidate and is_unused(storage, schedule_id):
+            if not dry_run:
+                storage.delete_schedule(schedule_id)
+            return 'purged'
+
+        last_activity = storage.last_activity(schedule_id)
+        if last_activity and last_activity < archive_before:
+            if not dry_run:
+                storage.archive_schedule(schedule_id)
+            return 'archived'
+    return None
+
+
+def run_retention(storage, archive_before, purge_before, checkpoint_path, batch_size=500,
+                  max_seconds=60, dry_run=False):
+    """Work through the schedules from the checkpoint for up to max_seconds.
+
+    archive_before and purge_before are ISO times. Returns counts of what was
+    done, and whether the pass over every schedule finished.
+    """
+    checkpoint = read_checkpoint(checkpoint_path)
+    after_id = checkpoint.get('after_id')
+    stats = {'scanned': 0, 'archived': 0, 'purged': 0, 'errors': 0, 'finished': False}
+    started = time.monotonic()
+
+    # At least one batch per run, so every run makes progress
+    while True:
+        batch = storage.scan_schedules(after_id, batch_size)
+        if not batch:
+            stats['finished'] = True
+            after_id = None
+            break
+
+        for summary in batch:
+            try:
+                action = process_schedule(storage, summary, archive_before, purge_before, dry_run)
+            except Exception as e:
+                logger.error(f"Error in retention for {summary['id']}: {e}")
+                stats['errors'] += 1
+                action = None
+            if action:
+                stats[action] += 1
+            stats['scanned'] += 1
+            after_id = summary['id']
+
+        # Checkpoint after every batch, so a killed run loses at most one batch
+        if not dry_run:
+            write_checkpoint(checkpoint_path, {'after_id': after_id,
+                                               'updated_at': datetime.now().isoformat()})
+        if time.monotonic() - started >= max_seconds:
+            break
+
+    if not dry_run:
+        write_checkpoint(checkpoint_path, {'after_id': after_id,
+                                           'updated_at': datetime.now().isoformat()})
+    return stats
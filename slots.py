@@ -0,0 +1,262 @@
+"""Date-range schedules: a calendar of time slots, and availability as intervals.
+
+A weekly schedule is the fixed grid in dayhours.py. A date-range schedule has
+a calendar instead: every day from start to end ( inclusive ), each cut into
+slots of slot_minutes from day_start to day_end. Slots are numbered day by
+day, so slot i is on day i // slots_per_day, and their keys are local
+datetimes like '2025-01-06T09:30'.
+
+A set of slots is stored as a sorted list of [start, end) intervals of slot
+numbers, so a week of mornings is a handful of pairs rather than hundreds of
+keys. Counts across respondents are runs, [start, end, count], built by
+sweeping over every respondent's interval boundaries at once; a ten week
+schedule costs as much to aggregate as its respondents have intervals, not
+slots.
+"""
+
+from datetime import date, datetime, timedelta
+
+# Slot lengths a calendar may use, and the longest range it may cover
+SLOT_MINUTES = (15, 20, 30, 60, 120)
+MAX_DAYS = 366
+
+
+def parse_time(text):
+    """Minutes after midnight of an 'HH:MM' string; '24:00' is the end of the day"""
+    try:
+        hours, minutes = (int(part) for part in text.split(':'))
+    except (AttributeError, ValueError):
+        raise ValueError(f"Not a time: {text!r}")
+    if not (0 <= hours <= 24 and 0 <= minutes < 60) or hours * 60 + minutes > 24 * 60:
+        raise ValueError(f"Not a time: {text!r}")
+    return hours * 60 + minutes
+
+
+def format_time(minutes):
+    return f'{minutes // 60:02d}:{minutes % 60:02d}'
+
+
+class Calendar:
+    """The slots of a date-range schedule. Raises ValueError for a bad range."""
+
+    def __init__(self, start, end, day_start='08:00', day_end='22:00', slot_minutes=60):
+        try:
+            self.start = date.fromisoformat(start) if isinstance(start, str) else start
+            self.end = date.fromisoformat(end) if isinstance(end, str) else end
+        except ValueError:
+            raise ValueError(f"Dates must be YYYY-MM-DD: {start!r}, {end!r}")
+        self.day_start = parse_time(day_start)
+        self.day_end = parse_time(day_end)
+        self.slot_minutes = int(slot_minutes)
+
+        self.days = (self.end - self.start).days + 1
+        if self.days < 1:
+            raise ValueError('The end date is before the start date')
+        if self.days > MAX_DAYS:
+            raise ValueError(f'A schedule can cover at most {MAX_DAYS} days')
+        if self.slot_minutes not in SLOT_MINUTES:
+            raise ValueError(f"Slots must be one of {', '.join(map(str, SLOT_MINUTES))} minutes")
+        if self.day_end <= self.day_start or (self.day_end - self.day_start) % self.slot_minutes:
+            raise ValueError('The day must end after it starts, a whole number of slots later')
+
+        self.slots_per_day = (self.day_end - self.day_start) // self.slot_minutes
+        self.size = self.days * self.slots_per_day
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['start'], data['end'], data.get('day_start', '08:00'),
+                   data.get('day_end', '22:00'), data.get('slot_minutes', 60))
+
+    def to_dict(self):
+        return {'start': self.start.isoformat(), 'end': self.end.isoformat(),
+                'day_start': format_time(self.day_start), 'day_end': format_time(self.day_end),
+                'slot_minutes': self.slot_minutes}
+
+    def key(self, index):
+        """The key of slot number index"""
+        day, slot = divmod(index, self.slots_per_day)
+        minutes = self.day_start + slot * self.slot_minutes
+        return f'{(self.start + timedelta(days=day)).isoformat()}T{format_time(minutes)}'
+
+    def index(self, key):
+        """The slot number of a key. Raises ValueError for keys not on the calendar."""
+        try:
+            when = datetime.fromisoformat(key)
+        except (TypeError, ValueError):
+            raise ValueError(f"Not a slot: {key!r}")
+        day = (when.date() - self.start).days
+        offset = when.hour * 60 + when.minute - self.day_start
+        slot, remainder = divmod(offset, self.slot_minutes)
+        if not 0 <= day < self.days or not 0 <= slot < self.slots_per_day or remainder \
+                or when.second or when.microsecond:
+            raise ValueError(f"Not a slot: {key!r}")
+        return day * self.slots_per_day + slot
+
+    def keys(self, intervals):
+        """The keys of every slot in a list of intervals, in order"""
+        return [self.key(i) for i in iter_indexes(intervals)]
+
+    def intervals(self, keys):
+        """Intervals for a list of keys. Raises ValueError for keys not on the calendar."""
+        return from_indexes(self.index(key) for key in keys)
+
+    def day_intervals(self, intervals):
+        """Split intervals at day boundaries, so no interval spans two days"""
+        split = []
+        for start, end in intervals:
+            while start < end:
+                day_end = (start // self.slots_per_day + 1) * self.slots_per_day
+                split.append([start, min(end, day_end)])
+                start = day_end
+        return split
+
+
+def from_indexes(indexes):
+    """Sorted, merged intervals covering a collection of slot numbers"""
+    intervals = []
+    for i in sorted(set(indexes)):
+        if intervals and intervals[-1][1] == i:
+            intervals[-1][1] = i + 1
+        else:
+            intervals.append([i, i + 1])
+    return intervals
+
+
+def iter_indexes(intervals):
+    for start, end in intervals:
+        yield from range(start, end)
+
+
+def normalize(intervals, size):
+    """Validate intervals from a client or a file against a calendar of `size`
+    slots, and sort and merge them. Raises ValueError."""
+    if not isinstance(intervals, list):
+        raise ValueError('Intervals must be a list of [start, end] pairs')
+    pairs = []
+    for pair in intervals:
+        if not (isinstance(pair, (list, tuple)) and len(pair) == 2 and
+                all(isinstance(i, int) and not isinstance(i, bool) for i in pair)):
+            raise ValueError(f"Not an interval: {pair!r}")
+        start, end = pair
+        if not 0 <= start < end <= size:
+            raise ValueError(f"Interval out of range: {pair!r}")
+        pairs.append([start, end])
+    return union(sorted(pairs), [])
+
+
+def sweep(edges):
+    """Runs [start, end, count] from (position, change) edges, skipping zero counts.
+    Neighbouring runs with the same count are merged."""
+    runs = []
+    count = 0
+    previous = None
+    for position, change in sorted(edges):
+        if position != previous and count and previous is not None:
+            if runs and runs[-1][1] == previous and runs[-1][2] == count:
+                runs[-1][1] = position
+            else:
+                runs.append([previous, position, count])
+        count += change
+        previous = position
+    return runs
+
+
+def edges(intervals, weight=1):
+    for start, end in intervals:
+        yield start, weight
+        yield end, -weight
+
+
+def union(a, b):
+    merged = []
+    # Runs of different counts can touch; the union doesn't care how many cover a slot
+    for start, end, _ in sweep([*edges(a), *edges(b)]):
+        if merged and merged[-1][1] == start:
+            merged[-1][1] = end
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def difference(a, b):
+    """The slots in a that are not in b"""
+    # a counts 1 and b counts -2 wherever they overlap, so only a alone stays positive
+    return [[start, end] for start, end, count in sweep([*edges(union(a, [])), *edges(union(b, []), -2)])
+            if count > 0]
+
+
+def intersection(a, b):
+    return [[start, end] for start, end, count in sweep([*edges(union(a, [])), *edges(union(b, []))])
+            if count == 2]
+
+
+def count_runs(interval_lists):
+    """How many of the interval lists cover each slot, as runs"""
+    return sweep([edge for intervals in interval_lists for edge in edges(intervals)])
+
+
+def apply_change(runs, old, new):
+    """Runs with one respondent's intervals changed from old to new"""
+    return sweep([*((s, c) for s, _, c in runs), *((e, -c) for _, e, c in runs),
+                  *edges(old, -1), *edges(new)])
+
+
+def rank_blocks(calendar, interval_lists, blackouts=(), length=1, quorum=1, required=(), limit=10):
+    """Rank the blocks of `length` contiguous slots within a day, like
+    ranking.rank_slots() does for the weekly grid.
+
+    interval_lists: one list of intervals per respondent.
+    required: indexes into interval_lists of respondents who must all be free.
+
+    Each respondent's free time adds one to every block start that fits inside
+    it, through a difference array over the calendar, so the cost is the number
+    of intervals plus the number of slots.
+    """
+    if not 1 <= length <= calendar.slots_per_day:
+        raise ValueError(f"A block must be between 1 and {calendar.slots_per_day} slots")
+    if not interval_lists:
+        return []
+
+    def block_starts(lists):
+        """Per slot, how many of the interval lists have a block starting there"""
+        diff = [0] * (calendar.size + 1)
+        for intervals in lists:
+            for start, end in calendar.day_intervals(intervals):
+                if end - start >= length:
+                    diff[start] += 1
+                    diff[end - length + 1] -= 1
+        counts, running = [], 0
+        for change in diff[:-1]:
+            running += change
+            counts.append(running)
+        return counts
+
+    scores = block_starts(interval_lists)
+    required_free = block_starts([interval_lists[i] for i in required]) if required else None
+    # A block is out if any of its slots is blacked out
+    blocked = [0] * (calendar.size + 1)
+    for start, end in blackouts:
+        blocked[max(start - length + 1, 0)] += 1
+        blocked[end] -= 1
+
+    candidates = []
+    running = 0
+    for i, score in enumerate(scores):
+        running += blocked[i]
+        if score < max(quorum, 1) or running or i % calendar.slots_per_day > calendar.slots_per_day - length:
+            continue
+        if required_free is not None and required_free[i] < len(required):
+            continue
+        candidates.append((-score, i))
+    candidates.sort()
+
+    ranked = []
+    for negative_score, start in candidates[:limit]:
+        keys = [calendar.key(i) for i in range(start, start + length)]
+        ranked.append({
+            'start': keys[0],
+            'dayhours': keys,
+            'count': -negative_score,
+            'ratio': round(-negative_score / len(interval_lists), 4)
+        })
+    return ranked
@@ -9,36 +9,205 @@ const HOUR_LABELS = [
 ];
 
 let selected = new Set();
+// The selections as last loaded or saved, and their version on the server,
+// so a save only sends what changed
+let savedSelections = new Set();
+let selectionsVersion = null;
 let blackouts = new Set();
 let info = {};
 let isReadOnly = false;
 let isOwner = window.isOwner || false; // Default to false if not set
 let scheduleId = '';
 let userId = '';
+let eventSource = null;
+let blackoutsDirty = false;
+// A date-range schedule's calendar from /info ( null for a weekly schedule ),
+// and the first day of the week the grid shows
+let calendar = null;
+let calendarWeek = 0;
+
+// Last response and ETag for each API URL, so a refetch of unchanged data is a 304
+const responseCache = {};
+
+// GET JSON from the server, sending the ETag we have for the URL. Resolves with
+// the parsed data ( the cached copy on a 304 ) or rejects with the server's error.
+// With options.withHeaders it resolves with { data, headers } instead, the
+// headers being the cached response's on a 304.
+function fetchJSON(url, options = {}) {
+    const { withHeaders, ...fetchOptions } = options;
+    const cached = responseCache[url];
+    const headers = Object.assign({
+        'Accept': 'application/json',
+        'X-Requested-With': 'XMLHttpRequest'
+    }, fetchOptions.headers || {});
+    if (cached) {
+        headers['If-None-Match'] = cached.etag;
+    }
+    
+    return fetch(url, Object.assign({}, fetchOptions, { headers: headers, cache: 'no-store' }))
+        .then(response => {
+            if (response.status === 304 && cached) {
+                const data = structuredClone(cached.data);
+                return withHeaders ? { data: data, headers: cached.headers } : data;
+            }
+            
+            // Check content type
+            const contentType = response.headers.get('content-type');
+            if (!contentType || !contentType.includes('application/json')) {
+                // If not JSON, read as text to see what we got
+                return response.text().then(text => {
+                    console.log('Non-JSON response:', text.substring(0, 200) + '...');
+                    throw new Error(`Server returned a non-JSON response from ${url}`);
+                });
+            }
+            
+            return response.json().then(data => {
+                if (!response.ok) {
+                    throw new Error(data.error || `Server error: ${response.status}`);
+                }
+                const etag = response.headers.get('ETag');
+                if (etag) {
+                    responseCache[url] = {
+                        etag: etag, data: structuredClone(data), headers: response.headers
+                    };
+                }
+                return withHeaders ? { data: data, headers: response.headers } : data;
+            });
+        });
+}
 
 function dayhourKey(day, hour) {
-    return day + hour;
+    // Date-range keys are local datetimes like '2025-01-06T09:30'
+    return calendar ? day + 'T' + hour : day + hour;
+}
+
+// --- Date-range schedules ---
+// The grid shows a week of the calendar at a time: DAYS and HOURS are swapped
+// for that week's dates and the day's slot times, so the rest of the page
+// works the same as for a weekly schedule.
+
+function parseMinutes(time) {
+    const [hours, minutes] = time.split(':').map(Number);
+    return hours * 60 + minutes;
+}
+
+function formatMinutes(minutes) {
+    return String(Math.floor(minutes / 60)).padStart(2, '0') + ':' + String(minutes % 60).padStart(2, '0');
+}
+
+function calendarDate(day) {
+    // UTC, so daylight saving changes don't shift the dates
+    const date = new Date(calendar.start + 'T00:00:00Z');
+    date.setUTCDate(date.getUTCDate() + day);
+    return date;
+}
+
+function setupCalendar(config) {
+    const start = new Date(config.start + 'T00:00:00Z');
+    const end = new Date(config.end + 'T00:00:00Z');
+    const dayStart = parseMinutes(config.day_start);
+    calendar = Object.assign({}, config, {
+        days: Math.round((end - start) / 86400000) + 1,
+        dayStart: dayStart,
+        slotsPerDay: (parseMinutes(config.day_end) - dayStart) / config.slot_minutes
+    });
+    const times = [];
+    for (let i = 0; i < calendar.slotsPerDay; i++) {
+        times.push(formatMinutes(dayStart + i * config.slot_minutes));
+    }
+    HOURS.splice(0, HOURS.length, ...times);
+    HOUR_LABELS.splice(0, HOUR_LABELS.length, ...times);
+    showCalendarWeek(Math.min(calendarWeek, calendar.days - 1));
+}
+
+function showCalendarWeek(firstDay) {
+    calendarWeek = Math.max(0, firstDay);
+    const dates = [];
+    const labels = [];
+    for (let d = calendarWeek; d < Math.min(calendarWeek + 7, calendar.days); d++) {
+        const date = calendarDate(d);
+        dates.push(date.toISOString().slice(0, 10));
+        labels.push(date.toLocaleDateString(undefined, { weekday: 'short', month: 'short', day: 'numeric', timeZone: 'UTC' }));
+    }
+    DAYS.splice(0, DAYS.length, ...dates);
+    DAY_LABELS.splice(0, DAY_LABELS.length, ...labels);
+}
+
+function slotKey(index) {
+    const day = Math.floor(index / calendar.slotsPerDay);
+    const minutes = calendar.dayStart + (index % calendar.slotsPerDay) * calendar.slot_minutes;
+    return calendarDate(day).toISOString().slice(0, 10) + 'T' + formatMinutes(minutes);
+}
+
+// [[start, end, value], ...] runs of slot numbers to a map of keys to values
+function expandRuns(runs) {
+    const values = {};
+    for (const [start, end, value] of runs || []) {
+        for (let i = start; i < end; i++) {
+            values[slotKey(i)] = value;
+        }
+    }
+    return values;
+}
+
+function intervalKeys(intervals) {
+    return Object.keys(expandRuns((intervals || []).map(([start, end]) => [start, end, true])));
+}
+
+// Prev and next buttons above the grid, when the calendar is longer than a week
+function renderWeekNav(grid) {
+    let nav = document.getElementById('week-nav');
+    if (!calendar || calendar.days <= 7) {
+        if (nav) nav.remove();
+        return;
+    }
+    if (!nav) {
+        nav = document.createElement('div');
+        nav.id = 'week-nav';
+        nav.className = 'd-flex justify-content-between align-items-center mb-2';
+        grid.parentNode.insertBefore(nav, grid);
+    }
+    nav.innerHTML = '';
+    const button = (text, firstDay, disabled) => {
+        const btn = document.createElement('button');
+        btn.className = 'btn btn-sm btn-outline-secondary';
+        btn.textContent = text;
+        btn.disabled = disabled;
+        btn.onclick = function() {
+            showCalendarWeek(firstDay);
+            renderGrid();
+            renderSummaryGrid();
+        };
+        return btn;
+    };
+    nav.appendChild(button('← Previous week', calendarWeek - 7, calendarWeek === 0));
+    const label = document.createElement('span');
+    label.textContent = `${DAY_LABELS[0]} – ${DAY_LABELS[DAY_LABELS.length - 1]}`;
+    nav.appendChild(label);
+    nav.appendChild(button('Next week →', calendarWeek + 7, calendarWeek + 7 >= calendar.days));
+}
+
+// Turn a date-range /info into the same shape as a weekly one
+function expandCalendarInfo(data) {
+    if (!data.calendar) return data;
+    setupCalendar(data.calendar);
+    data.dayhours = expandRuns(data.runs);
+    data.tiers = expandRuns(data.tiers);
+    data.blackouts = intervalKeys(data.blackouts);
+    return data;
 }
 
 function getCellColor(dayhour) {
-    // Check if this is a blackout cell
+    // Check if this is a blackout cell. The owner's unsaved blackout edits are
+    // only in the local set, so it wins over the server's tiers.
     if (blackouts.has(dayhour)) {
         return 'bg-blackout';
     }
     
-    if (!info.dayhours || !info.count) return 'bg-white';
-    const count = info.dayhours[dayhour] || 0;
-    if (count === 0) return 'bg-white';
-    // Build sorted unique list of counts
-    const counts = Object.values(info.dayhours).filter(x => x > 0);
-    const uniqueSorted = Array.from(new Set(counts)).sort((a, b) => b - a);
-    if (uniqueSorted.length === 0) return 'bg-white';
-    if (count === info.count) return 'bg-100'; // 100% of users
-    if (count === uniqueSorted[0]) return 'bg-1st'; // 1st most common (not 100%)
-    if (uniqueSorted[1] !== undefined && count === uniqueSorted[1]) return 'bg-2nd';
-    if (uniqueSorted[2] !== undefined && count === uniqueSorted[2]) return 'bg-3rd';
-    if (info.count && count / info.count < 0.7) return 'bg-red';
-    return 'bg-white';
+    // The server assigns the tiers ( see heatmap_tiers() in app.py )
+    const tier = info.tiers && info.tiers[dayhour];
+    if (!tier || tier === 'blackout') return 'bg-white';
+    return 'bg-' + tier;
 }
 
 function renderGrid() {
@@ -46,6 +215,9 @@ function renderGrid() {
     if (!grid) return; // Exit if grid doesn't exist (e.g., on schedule page)
     
     grid.innerHTML = '';
+    // The last week of a date range may be short
+    grid.style.gridTemplateColumns = calendar ? `45px repeat(${DAYS.length}, 1fr)` : '';
+    renderWeekNav(grid);
     
     // Top-left empty
     grid.appendChild(cell('schedule-header', ''));
@@ -440,45 +612,17 @@ function fetchScheduleInfo() {
     const controller = new AbortController();
     const timeoutId = setTimeout(() => controller.abort(), 10000); // 10 second timeout
     
-    fetch(`/s/${currentScheduleId}/info`, {
-        method: 'GET',
-        headers: {
-            'Accept': 'application/json',
-            'X-Requested-With': 'XMLHttpRequest'
-        },
-        signal: controller.signal
-    })
-    .then(response => {
+    fetchJSON(`/s/${currentScheduleId}/info`, { signal: controller.signal })
+    .then(data => {
         clearTimeout(timeoutId);
-        console.log('Response status:', response.status);
-        console.log('Response headers:', response.headers);
-        
-        // Check content type
-        const contentType = response.headers.get('content-type');
-        console.log('Content-Type:', contentType);
-        
-        if (!contentType || !contentType.includes('application/json')) {
-            // If not JSON, read as text to see what we got
-            return response.text().then(text => {
-                console.log('Non-JSON response:', text.substring(0, 200) + '...');
-                throw new Error(`Server returned a non-JSON response from /s/${scheduleId}/info`);
-            });
-        }
-        
-        if (!response.ok) {
-            return response.json().then(data => {
-                throw new Error(data.error || `Server error: ${response.status}`);
-            });
-        }
-        
-        return response.json();
+        return data;
     })
     .then(data => {
         console.log('Received data:', data);
         if (data.error) {
             throw new Error(data.error);
         }
-        info = data;
+        info = expandCalendarInfo(data);
         
         // Set owner status from response
         isOwner = data.is_owner || false;
@@ -495,6 +639,7 @@ function fetchScheduleInfo() {
         if (typeof setupBlackoutSaveButton === 'function') {
             setupBlackoutSaveButton();
         }
+        startLiveUpdates();
     })
     .catch(error => {
         
@@ -512,6 +657,63 @@ function fetchScheduleInfo() {
     });
 }
 
+// Listen for changes pushed by the server, so other people's saves show up
+// without reloading or polling /info
+function startLiveUpdates() {
+    const currentScheduleId = window.scheduleId || scheduleId;
+    if (eventSource || !currentScheduleId || !window.EventSource) return;
+    
+    eventSource = new EventSource(`/s/${currentScheduleId}/events`);
+    
+    eventSource.addEventListener('selections', function(e) {
+        const event = JSON.parse(e.data);
+        // Our copy of /info already has this change ( e.g. our own save )
+        if (event.version <= info.version) return;
+        if (event.version !== info.version + 1) {
+            // We missed a change, so get the whole aggregate again
+            fetchScheduleInfo();
+            return;
+        }
+        
+        info.dayhours = info.dayhours || {};
+        if (event.runs) {
+            // Date-range schedules send all the counts, as runs
+            info.dayhours = expandRuns(event.runs);
+            event.tiers = expandRuns(event.tiers);
+        } else {
+            Object.entries(event.delta).forEach(([key, change]) => {
+                const count = (info.dayhours[key] || 0) + change;
+                if (count > 0) {
+                    info.dayhours[key] = count;
+                } else {
+                    delete info.dayhours[key];
+                }
+            });
+        }
+        info.count = event.count;
+        info.version = event.version;
+        info.tiers = event.tiers;
+        
+        renderGrid();
+        renderSummaryGrid();
+    });
+    
+    eventSource.addEventListener('blackouts', function(e) {
+        // Don't throw away the owner's unsaved blackout edits
+        if (blackoutsDirty) return;
+        
+        info.blackouts = JSON.parse(e.data).blackouts;
+        if (calendar) {
+            info.blackouts = intervalKeys(info.blackouts);
+        }
+        blackouts = new Set(info.blackouts);
+        renderGrid();
+        renderSummaryGrid();
+        // Cells that are no longer blacked out need their tiers from the server
+        fetchScheduleInfo();
+    });
+}
+
 function setupSaveButton() {
     const saveBtn = document.getElementById('save-btn');
     if (!saveBtn || isReadOnly) return;
@@ -584,26 +786,12 @@ function saveSelections() {
         }) : 
         Promise.resolve();
     
-    savePromise.then(() => {
-        return fetch(`/u/${currentScheduleId}/${currentUserId}/selections`, {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-                'X-Requested-With': 'XMLHttpRequest'
-            },
-            body: JSON.stringify(Array.from(selected))
-        });
-    })
-    .then(response => {
-        if (response.status === 403) {
-            // Name required
-            window.location.href = '/set_name?next=' + encodeURIComponent(window.location.pathname);
-            return null;
-        }
-        return response.json();
-    })
+    savePromise.then(() => patchSelections(`/u/${currentScheduleId}/${currentUserId}/selections`, true))
     .then(data => {
         if (!data) return; // Redirect happened
+        if (data.error) {
+            throw new Error(data.error);
+        }
         
         saveBtn.disabled = false;
         saveBtn.classList.remove('btn-warning');
@@ -627,6 +815,50 @@ function saveSelections() {
     });
 }
 
+// Send the cells toggled since the last save. If someone else saved in the
+// meantime ( another tab ), the server answers 409 with its selections; our
+// changes are applied on top of those and sent once more.
+function patchSelections(url, retry) {
+    const sending = new Set(selected);
+    const body = {
+        add: Array.from(sending).filter(key => !savedSelections.has(key)),
+        remove: Array.from(savedSelections).filter(key => !sending.has(key)),
+        selections_version: selectionsVersion
+    };
+    
+    return fetch(url, {
+        method: 'PATCH',
+        headers: {
+            'Content-Type': 'application/json',
+            'X-Requested-With': 'XMLHttpRequest'
+        },
+        body: JSON.stringify(body)
+    })
+    .then(response => {
+        if (response.status === 403) {
+            // Name required
+            window.location.href = '/set_name?next=' + encodeURIComponent(window.location.pathname);
+            return null;
+        }
+        return response.json().then(data => {
+            if (response.status === 409 && retry) {
+                savedSelections = new Set(data.selections);
+                selectionsVersion = data.selections_version;
+                selected = new Set(data.selections);
+                body.remove.forEach(key => selected.delete(key));
+                body.add.forEach(key => selected.add(key));
+                renderGrid();
+                return patchSelections(url, false);
+            }
+            if (response.ok) {
+                savedSelections = sending;
+                selectionsVersion = data.selections_version;
+            }
+            return data;
+        });
+    });
+}
+
 function loadUserSelections() {
     // Make sure we're using window variables if available
     const currentScheduleId = window.scheduleId || scheduleId;
@@ -647,20 +879,13 @@ function loadUserSelections() {
     
     console.log(`Loading selections for schedule: ${currentScheduleId}, user: ${currentUserId}`);
     
-    fetch(`/u/${currentScheduleId}/${currentUserId}/selections`, {
-        headers: {
-            'Accept': 'application/json',
-            'X-Requested-With': 'XMLHttpRequest'
-        }
-    })
-    .then(response => {
-        if (!response.ok) {
-            throw new Error(`Server returned ${response.status}: ${response.statusText}`);
-        }
-        return response.json();
-    })
-    .then(data => {
+    fetchJSON(`/u/${currentScheduleId}/${currentUserId}/selections`, { withHeaders: true })
+    .then(({ data, headers }) => {
         selected = new Set(data);
+        savedSelections = new Set(data);
+        // The version the first PATCH is checked against
+        const version = headers.get('X-Selections-Version');
+        selectionsVersion = version === null ? null : parseInt(version, 10);
         fetchScheduleInfo();
     })
     .catch(error => console.error('Error loading selections:', error));
@@ -685,6 +910,8 @@ function renderSummaryGrid() {
     
     grid.innerHTML = '';
     
+    grid.style.gridTemplateColumns = calendar ? `repeat(${DAYS.length + 1}, 1fr)` : '';
+    
     // Top-left empty
     const emptyHeader = document.createElement('div');
     emptyHeader.className = 'summary-schedule-header';
@@ -775,6 +1002,7 @@ function toggleBlackout(cell) {
 }
 
 function markBlackoutDirty() {
+    blackoutsDirty = true;
     // Show save button as dirty for blackouts
     const saveBtn = document.getElementById('save-blackout-btn');
     if (saveBtn) {
@@ -823,6 +1051,7 @@ function saveBlackouts() {
         if (data.error) {
             saveStatus.textContent = 'Error: ' + data.error;
         } else {
+            blackoutsDirty = false;
             saveBtn.classList.remove('btn-warning');
             saveBtn.classList.add('btn-success');
             saveStatus.textContent = 'Blackouts saved!';
@@ -853,18 +1082,7 @@ function loadBlackouts() {
         return;
     }
     
-    fetch(`/s/${currentScheduleId}/blackouts`, {
-        headers: {
-            'Accept': 'application/json',
-            'X-Requested-With': 'XMLHttpRequest'
-        }
-    })
-    .then(response => {
-        if (!response.ok) {
-            throw new Error(`Server returned ${response.status}: ${response.statusText}`);
-        }
-        return response.json();
-    })
+    fetchJSON(`/s/${currentScheduleId}/blackouts`)
     .then(data => {
         blackouts = new Set(data);
         renderGrid();
@@ -873,4 +1091,72 @@ function loadBlackouts() {
     .catch(error => console.error('Error loading blackouts:', error));
 }
 
+function dayhourLabel(key) {
+    return DAY_LABELS[DAYS.indexOf(key[0])] + ' ' + HOUR_LABELS[HOURS.indexOf(key.slice(1))];
+}
+
+// The combined view of several schedules ( /combined?schedule=... ): a
+// read-only grid of the merged counts, and the best times for everyone
+function fetchCombinedInfo() {
+    isReadOnly = true;
+    fetchJSON('/combined/info' + window.location.search)
+    .then(data => {
+        info = data;
+        blackouts = new Set(data.blackouts || []);
+        renderGrid();
+        renderCombinedDetails(data);
+    })
+    .catch(error => {
+        console.error('Error fetching combined info:', error);
+        const grid = document.getElementById('schedule-grid');
+        if (grid) {
+            grid.innerHTML = `<div class="alert alert-danger">
+                <strong>Error loading the schedules</strong>
+                <p><small>${error.message}</small></p>
+            </div>`;
+        }
+    });
+}
+
+function renderCombinedDetails(data) {
+    const summary = document.getElementById('combined-summary');
+    if (summary) {
+        summary.textContent = `${data.count} people ( ${data.responses} responses ) across ${data.schedules.length} schedules`;
+    }
+    
+    const schedules = document.getElementById('combined-schedules');
+    if (schedules) {
+        schedules.innerHTML = '';
+        for (const schedule of data.schedules) {
+            const item = document.createElement('a');
+            item.className = 'list-group-item list-group-item-action d-flex justify-content-between';
+            item.href = `/s/${schedule.id}`;
+            item.textContent = schedule.name || schedule.id;
+            const badge = document.createElement('span');
+            badge.className = 'badge bg-secondary rounded-pill';
+            badge.textContent = schedule.count;
+            item.appendChild(badge);
+            schedules.appendChild(item);
+        }
+    }
+    
+    const best = document.getElementById('best-slots');
+    if (best) {
+        best.innerHTML = '';
+        if (!data.slots.length) {
+            best.innerHTML = '<li class="list-group-item">No time works for anyone yet.</li>';
+        }
+        for (const slot of data.slots) {
+            const item = document.createElement('li');
+            item.className = 'list-group-item d-flex justify-content-between';
+            item.textContent = dayhourLabel(slot.start) + (slot.dayhours.length > 1 ? ` ( ${slot.dayhours.length} hours )` : '');
+            const badge = document.createElement('span');
+            badge.className = 'badge bg-success rounded-pill';
+            badge.textContent = `${slot.count} / ${data.count}`;
+            item.appendChild(badge);
+            best.appendChild(item);
+        }
+    }
+}
+
 // Schedule initialization will be done in the individual pages' script sections
@@ -0,0 +1,1424 @@
+"""Storage backends for schedules, user responses and aggregates.
+
+The app talks to one Storage object ( see get_storage() in app.py ), picked
+with the STORAGE_BACKEND environment variable:
+
+* file ( the default ): one directory per schedule, with a meta.json, an
+  aggregate.json, one <user_id>.json file per respondent, and the journal (
+  journal.log and snapshot.<seq> files ). Directories are
+  sharded by a hash of the id, DATA_DIR/ab/cd/<id>, so no one directory grows
+  huge; schedules from before that stay at DATA_DIR/<id>. An index of the
+  schedules ( creator, dates and respondent count ) and of respondents' names
+  is kept in DATA_DIR/index.sqlite3.
+* sqlite: a single SQLite database in WAL mode, at SQLITE_PATH ( default
+  DATA_DIR/scheduler.sqlite3 ), with indexed tables for schedules, responses
+  and aggregates.
+
+Both backends store selections and blackouts as dayhour bitsets and hand
+back lists of dayhour keys, so callers never see the encoding.
+
+Writes are safe with several gunicorn workers: files are written to a
+temporary file and renamed into place, so readers never see a half written
+file, and read-modify-write sequences hold the schedule's lock().
+"""
+
+import copy
+import glob
+import hashlib
+import logging
+import os
+import shutil
+import sqlite3
+import string
+import sys
+import tarfile
+import tempfile
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+try:
+    import fcntl
+except ImportError:  # Windows; locks then only cover one process
+    fcntl = None
+
+import dayhours
+import jsoncodec
+from cache import MISSING, LRUCache
+
+logger = logging.getLogger(__name__)
+
+# Files in a schedule directory that are not user responses
+RESERVED_FILES = {'meta.json', 'aggregate.json'}
+
+# Where the file backend keeps archived schedules, in DATA_DIR. Ids are
+# base-62, so this can't be a schedule directory.
+ARCHIVE_DIR = '_archive'
+
+# The change log is cut back to its newer half when it grows past this size
+EVENT_LOG_MAX_BYTES = 256 * 1024
+
+# Journal snapshots kept per schedule. The journal is kept back to the oldest
+# of them, so views as of any time since then can be rebuilt.
+SNAPSHOTS_KEPT = 10
+SNAPSHOT_PREFIX = 'snapshot.'
+
+# Directory mtimes can be coarser than the time between two writes, so a
+# listing is only cached once its directory has been quiet for this long
+RACY_WINDOW = 1.0
+
+# The file backend's schedule index, in DATA_DIR, and how stale its record of
+# a schedule's last activity may get before a response save refreshes it
+INDEX_FILE = 'index.sqlite3'
+ACTIVITY_RESOLUTION = timedelta(hours=1)
+
+# list_respondents() orders, by name or by the last response, newest first.
+# The user id breaks ties so pages don't overlap.
+RESPONDENT_SORTS = {
+    'name': 'name COLLATE NOCASE, user_id',
+    'updated': 'updated_at DESC, user_id',
+}
+
+
+def shard_path(schedule_id):
+    """Relative path of a schedule directory in the sharded layout: two levels
+    named by the first hex digits of a hash of the id, ab/cd/<id>"""
+    digest = hashlib.sha1(schedule_id.encode()).hexdigest()
+    return os.path.join(digest[:2], digest[2:4], schedule_id)
+
+
+def is_shard_name(name):
+    return len(name) == 2 and all(c in '0123456789abcdef' for c in name)
+
+
+# Ids from outside ( such as bulk imports ) are checked with is_valid_id()
+# before they are used as file names
+MAX_ID_LENGTH = 32
+ID_CHARS = frozenset(string.ascii_letters + string.digits)
+
+
+def is_valid_id(value):
+    """Whether value can be a schedule or user id: base-62 like the generated
+    ids, at most MAX_ID_LENGTH long, and not a name the file backend uses for
+    something else ( meta, aggregate, a shard directory )"""
+    return (isinstance(value, str) and 0 < len(value) <= MAX_ID_LENGTH and set(value) <= ID_CHARS
+            and value + '.json' not in RESERVED_FILES and not is_shard_name(value))
+
+
+def connect_sqlite(path):
+    """Open a SQLite database in WAL mode, so readers don't block the writer"""
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    return conn
+
+
+class Storage:
+    """Interface for the storage backends"""
+
+    name = None
+
+    def schedule_exists(self, schedule_id):
+        raise NotImplementedError
+
+    def get_schedule(self, schedule_id):
+        """Return the schedule's metadata dict, or None"""
+        raise NotImplementedError
+
+    def save_schedule(self, schedule_id, data):
+        """Save the schedule's metadata. Returns True on success."""
+        raise NotImplementedError
+
+    def get_user(self, schedule_id, user_id):
+        """Return a user's response dict, or None"""
+        raise NotImplementedError
+
+    def save_user(self, schedule_id, user_id, data):
+        """Save a user's response. Returns True on success."""
+        raise NotImplementedError
+
+    def list_users(self, schedule_id):
+        """Return (user_id, data) for every response to a schedule"""
+        raise NotImplementedError
+
+    def list_respondents(self, schedule_id, sort='name', search=None, offset=0, limit=50):
+        """Return (respondents, total): one page of the users who have given a
+        name, as dicts with id, name and updated_at, and how many match in all.
+        
+        sort is a key of RESPONDENT_SORTS, and search keeps names containing it,
+        ignoring case. Unlike list_users() this never reads the selections. This
+        version does, and the backends replace it with an indexed query.
+        """
+        respondents = [{'id': user_id, 'name': data['name'], 'updated_at': data.get('updated_at')}
+                       for user_id, data in self.list_users(schedule_id) if 'name' in data]
+        if search:
+            respondents = [r for r in respondents if search.lower() in r['name'].lower()]
+        respondents.sort(key=lambda r: r['id'])
+        if sort == 'updated':
+            respondents.sort(key=lambda r: r['updated_at'] or '', reverse=True)
+        else:
+            respondents.sort(key=lambda r: r['name'].lower())
+        return respondents[offset:offset + limit], len(respondents)
+
+    def get_aggregate(self, schedule_id):
+        """Return the schedule's stored aggregate, or None if there isn't one"""
+        raise NotImplementedError
+
+    def save_aggregate(self, schedule_id, data):
+        raise NotImplementedError
+
+    def list_schedule_ids(self):
+        """Return the ids of all stored schedules"""
+        raise NotImplementedError
+
+    def list_schedules(self, creator_id=None, created_before=None, updated_before=None,
+                       limit=None):
+        """Return summaries of the schedules matching the filters, newest first.
+
+        Each is a dict with id, name, creator_id, created_at, updated_at ( the
+        last change to the schedule or any response ) and respondents. Dates
+        are ISO strings and compare as such.
+        """
+        raise NotImplementedError
+
+    def scan_schedules(self, after_id=None, limit=1000):
+        """Return summaries ( as list_schedules() ) of up to `limit` schedules
+        with ids after after_id, in id order, for jobs that walk every schedule
+        a batch at a time"""
+        raise NotImplementedError
+
+    def last_activity(self, schedule_id):
+        """ISO time of the last change to the schedule or any of its responses,
+        from the data itself rather than the index"""
+        raise NotImplementedError
+
+    def delete_schedule(self, schedule_id):
+        """Remove a schedule and everything in it"""
+        raise NotImplementedError
+
+    # Archived schedules are packed into one compressed record and restored the
+    # next time they are opened ( see restore_archived_schedule() in app.py ).
+    # Call archive_schedule() and restore_schedule() holding the schedule's lock.
+
+    def archive_schedule(self, schedule_id):
+        raise NotImplementedError
+
+    def restore_schedule(self, schedule_id):
+        raise NotImplementedError
+
+    def is_archived(self, schedule_id):
+        raise NotImplementedError
+
+    @contextmanager
+    def unarchived(self, schedule_id):
+        """Read an archived schedule without restoring it for good: it is unpacked
+        under its lock for the block and packed again after. Other schedules are
+        read as they are."""
+        if not self.is_archived(schedule_id):
+            yield
+            return
+        with self.lock(schedule_id):
+            restored = self.restore_schedule(schedule_id)
+            try:
+                yield
+            finally:
+                if restored:
+                    self.archive_schedule(schedule_id)
+
+    # The change log is a per-schedule sequence of small JSON events, appended
+    # by every write and read by the /s/<id>/events stream in every worker
+
+    def append_event(self, schedule_id, event):
+        """Add an event to the schedule's change log and return its sequence
+        number. Call it while holding the schedule's lock()."""
+        raise NotImplementedError
+
+    def read_events(self, schedule_id, after_seq, cursor=None):
+        """Return ([(seq, event), ...], cursor) for the events after after_seq.
+        Pass the returned cursor back in to make the next read cheap."""
+        raise NotImplementedError
+
+    def last_event_seq(self, schedule_id):
+        """Sequence number of the newest event, or 0"""
+        raise NotImplementedError
+
+    # The journal is a per-schedule, append-only record of every change to a
+    # response or to the blackouts, with the whole new value. Snapshots fold
+    # it up to a sequence number into the responses, blackouts and aggregate
+    # at that point ( see journal_view() in app.py ).
+
+    def append_journal(self, schedule_id, entry):
+        """Add an entry to the schedule's journal and return its sequence
+        number. Call it while holding the schedule's lock()."""
+        raise NotImplementedError
+
+    def read_journal(self, schedule_id, after_seq=0):
+        """Return [(seq, entry), ...] for the journal entries after after_seq, in order"""
+        raise NotImplementedError
+
+    def get_snapshot(self, schedule_id, as_of=None):
+        """Return the newest snapshot, or the newest taken at or before the ISO
+        time as_of, or None. A snapshot is a dict with 'seq' ( the last entry
+        folded into it ), 'at', 'responses' by user id, the blackouts and the
+        'aggregate'."""
+        raise NotImplementedError
+
+    def save_snapshot(self, schedule_id, snapshot):
+        """Save a snapshot, keep the newest SNAPSHOTS_KEPT and drop the journal
+        entries the oldest of those covers. Call it while holding the schedule's lock()."""
+        raise NotImplementedError
+
+    def lock(self, schedule_id):
+        """Context manager that holds an exclusive lock on one schedule, across
+        threads and worker processes. Hold it around any read-modify-write of a
+        schedule's data. It is re-entrant within a thread."""
+        raise NotImplementedError
+
+    def cache_stats(self):
+        """Counters for the read cache, or None if the backend doesn't cache"""
+        return None
+
+    # Versions are short strings that change whenever the data changes. They are
+    # cheap to get ( a stat() or one small query, never a scan of the user
+    # responses ) and are used for ETags. None means the data doesn't exist.
+
+    def schedule_version(self, schedule_id):
+        raise NotImplementedError
+
+    def aggregate_version(self, schedule_id):
+        raise NotImplementedError
+
+    def user_version(self, schedule_id, user_id):
+        raise NotImplementedError
+
+    # The bitset encoding is the same for every backend
+
+    @staticmethod
+    def pack_schedule(data):
+        if 'blackouts' in data:
+            data = dict(data, blackouts=dayhours.pack(data['blackouts']))
+        return data
+
+    @staticmethod
+    def unpack_schedule(data):
+        if data and 'blackouts' in data:
+            data['blackouts'] = dayhours.unpack(data['blackouts'])
+        return data
+
+    @staticmethod
+    def pack_user(data):
+        if 'selections' in data:
+            data = dict(data, selections=dayhours.pack(data['selections']))
+        return data
+
+    @staticmethod
+    def unpack_user(data):
+        if data and 'selections' in data:
+            data['selections'] = dayhours.unpack(data['selections'])
+        return data
+
+    # Journal entries are a response or a schedule change
+
+    @classmethod
+    def pack_entry(cls, entry):
+        return cls.pack_user(cls.pack_schedule(entry))
+
+    @classmethod
+    def unpack_entry(cls, entry):
+        return cls.unpack_user(cls.unpack_schedule(entry))
+
+    @classmethod
+    def pack_snapshot(cls, snapshot):
+        return dict(cls.pack_schedule(snapshot), responses={
+            user_id: cls.pack_user(response) for user_id, response in snapshot['responses'].items()})
+
+    @classmethod
+    def unpack_snapshot(cls, snapshot):
+        if snapshot:
+            cls.unpack_schedule(snapshot)
+            for response in snapshot['responses'].values():
+                cls.unpack_user(response)
+        return snapshot
+
+
+class ScheduleIndex:
+    """A small SQLite table with a row per schedule, so the file backend can list
+    schedules by creator or age without walking DATA_DIR, and one with a row
+    per respondent, so it can page through names without reading every
+    response.
+
+    Rows are updated by FileStorage.save_schedule(), save_user() and
+    save_aggregate(). The index can be rebuilt from the schedule directories
+    with reindex().
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS schedules (
+        id TEXT PRIMARY KEY,
+        name TEXT,
+        creator_id TEXT,
+        created_at TEXT,
+        updated_at TEXT,
+        respondents INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE INDEX IF NOT EXISTS schedules_creator ON schedules (creator_id, created_at);
+    CREATE INDEX IF NOT EXISTS schedules_created ON schedules (created_at);
+    CREATE INDEX IF NOT EXISTS schedules_updated ON schedules (updated_at);
+
+    CREATE TABLE IF NOT EXISTS respondents (
+        schedule_id TEXT NOT NULL,
+        user_id TEXT NOT NULL,
+        name TEXT NOT NULL,
+        updated_at TEXT,
+        PRIMARY KEY (schedule_id, user_id)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS respondents_name ON respondents (schedule_id, name COLLATE NOCASE);
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        with self.db:
+            self.db.executescript(self.SCHEMA)
+
+    @property
+    def db(self):
+        """A connection for the current thread"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = connect_sqlite(self.path)
+        return conn
+
+    def update_schedule(self, schedule_id, data, respondents=None):
+        now = datetime.now().isoformat()
+        with self.db:
+            self.db.execute(
+                'INSERT INTO schedules (id, name, creator_id, created_at, updated_at) '
+                'VALUES (?, ?, ?, ?, ?) ON CONFLICT (id) DO UPDATE SET name = excluded.name, '
+                'creator_id = excluded.creator_id, created_at = excluded.created_at, '
+                'updated_at = excluded.updated_at',
+                (schedule_id, data.get('name'), data.get('creator_id'),
+                 data.get('created_at'), data.get('updated_at') or data.get('created_at') or now))
+            if respondents is not None:
+                self.db.execute('UPDATE schedules SET respondents = ? WHERE id = ?',
+                                (respondents, schedule_id))
+
+    def update_respondents(self, schedule_id, respondents):
+        """Record a change to the responses: the new count, and now as updated_at"""
+        now = datetime.now()
+        # Most saves change neither the count nor the hour of the last activity,
+        # and a read is much cheaper than a write transaction
+        row = self.db.execute('SELECT respondents, updated_at FROM schedules WHERE id = ?',
+                              (schedule_id,)).fetchone()
+        if row and row[0] == respondents and row[1] and \
+                row[1] >= (now - ACTIVITY_RESOLUTION).isoformat():
+            return
+        with self.db:
+            self.db.execute('UPDATE schedules SET respondents = ?, updated_at = ? WHERE id = ?',
+                            (respondents, now.isoformat(), schedule_id))
+
+    def update_respondent(self, schedule_id, user_id, data):
+        """Record a user's name and the time of their response"""
+        name, updated_at = data.get('name'), data.get('updated_at')
+        row = self.db.execute('SELECT name, updated_at FROM respondents '
+                              'WHERE schedule_id = ? AND user_id = ?', (schedule_id, user_id)).fetchone()
+        # Like update_respondents(), skip the write when only the time moved,
+        # and by less than ACTIVITY_RESOLUTION
+        if row and row[0] == name and recent_enough(row[1], updated_at):
+            return
+        if not row and name is None:
+            return
+        with self.db:
+            if name is not None:
+                self.db.execute('INSERT OR REPLACE INTO respondents (schedule_id, user_id, name, '
+                                'updated_at) VALUES (?, ?, ?, ?)', (schedule_id, user_id, name, updated_at))
+            else:
+                self.db.execute('DELETE FROM respondents WHERE schedule_id = ? AND user_id = ?',
+                                (schedule_id, user_id))
+
+    def replace_respondents(self, schedule_id, respondents):
+        """Replace a schedule's respondents with (user_id, data) pairs"""
+        with self.db:
+            self.db.execute('DELETE FROM respondents WHERE schedule_id = ?', (schedule_id,))
+            self.db.executemany(
+                'INSERT INTO respondents (schedule_id, user_id, name, updated_at) VALUES (?, ?, ?, ?)',
+                [(schedule_id, user_id, data['name'], data.get('updated_at'))
+                 for user_id, data in respondents if 'name' in data])
+
+    def respondents_current(self, schedule_id):
+        """True if the schedule has as many respondent rows as its respondent count"""
+        row = self.db.execute(
+            'SELECT respondents, (SELECT COUNT(*) FROM respondents WHERE schedule_id = schedules.id) '
+            'FROM schedules WHERE id = ?', (schedule_id,)).fetchone()
+        return row is not None and row[0] == row[1]
+
+    def respondents(self, schedule_id, sort, search, offset, limit):
+        return respondent_query(self.db, 'respondents', 'schedule_id = ?', (schedule_id,),
+                                sort, search, offset, limit)
+
+    def remove(self, schedule_id):
+        with self.db:
+            self.db.execute('DELETE FROM schedules WHERE id = ?', (schedule_id,))
+            self.db.execute('DELETE FROM respondents WHERE schedule_id = ?', (schedule_id,))
+
+    def query(self, creator_id=None, created_before=None, updated_before=None, limit=None):
+        sql, params = schedule_query(
+            'SELECT id, name, creator_id, created_at, updated_at, respondents FROM schedules',
+            creator_id, created_before, updated_before, limit)
+        return [schedule_summary(row) for row in self.db.execute(sql, params)]
+
+    def scan(self, after_id, limit):
+        rows = self.db.execute(
+            'SELECT id, name, creator_id, created_at, updated_at, respondents FROM schedules '
+            'WHERE id > ? ORDER BY id LIMIT ?', (after_id or '', limit))
+        return [schedule_summary(row) for row in rows]
+
+
+def schedule_query(select, creator_id, created_before, updated_before, limit):
+    """Add the list_schedules() filters to a query on a table of schedules"""
+    where, params = [], []
+    for column, value in (('creator_id = ?', creator_id), ('created_at < ?', created_before),
+                          ('updated_at < ?', updated_before)):
+        if value is not None:
+            where.append(column)
+            params.append(value)
+    sql = select + (' WHERE ' + ' AND '.join(where) if where else '') + ' ORDER BY created_at DESC'
+    if limit is not None:
+        sql += ' LIMIT ?'
+        params.append(limit)
+    return sql, params
+
+
+def recent_enough(stored, updated_at):
+    """True if updated_at is no more than ACTIVITY_RESOLUTION after the stored time"""
+    try:
+        return stored >= (datetime.fromisoformat(updated_at) - ACTIVITY_RESOLUTION).isoformat()
+    except (TypeError, ValueError):
+        return stored == updated_at
+
+
+def respondent_query(db, table, where, params, sort, search, offset, limit):
+    """Run list_respondents() on a table with user_id, name and updated_at columns"""
+    where += ' AND name IS NOT NULL'
+    if search:
+        where += " AND name LIKE ? ESCAPE '\\'"
+        escaped = search.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        params += (f'%{escaped}%',)
+    total = db.execute(f'SELECT COUNT(*) FROM {table} WHERE {where}', params).fetchone()[0]
+    rows = db.execute(f'SELECT user_id, name, updated_at FROM {table} WHERE {where} '
+                      f'ORDER BY {RESPONDENT_SORTS.get(sort, RESPONDENT_SORTS["name"])} LIMIT ? OFFSET ?',
+                      params + (limit, offset))
+    return [{'id': user_id, 'name': name, 'updated_at': updated_at}
+            for user_id, name, updated_at in rows], total
+
+
+def schedule_summary(row):
+    schedule_id, name, creator_id, created_at, updated_at, respondents = row
+    return {'id': schedule_id, 'name': name, 'creator_id': creator_id, 'created_at': created_at,
+            'updated_at': updated_at, 'respondents': respondents or 0}
+
+
+class FileStorage(Storage):
+    """One directory per schedule, one JSON file per user.
+    
+    Parsed files and respondent listings are kept in an LRUCache, checked
+    against the file's or directory's stat() on every read. list_users() reads
+    the user files on up to read_threads threads at once, so a scan of a big
+    schedule on a slow volume waits for the slowest read, not the sum of them.
+    """
+
+    name = 'file'
+
+    def __init__(self, data_dir, cache=None, read_threads=0):
+        self.data_dir = data_dir
+        self.cache = cache
+        self._read_pool = ThreadPoolExecutor(
+            max_workers=read_threads, thread_name_prefix='storage-read') if read_threads > 1 else None
+        self._local = threading.local()
+        self._thread_locks = {}
+        self._thread_locks_guard = threading.Lock()
+        os.makedirs(data_dir, exist_ok=True)
+        self.index = ScheduleIndex(os.path.join(data_dir, INDEX_FILE))
+
+    def schedule_directory(self, schedule_id):
+        """Get the directory path for a schedule: DATA_DIR/ab/cd/<id>, or
+        DATA_DIR/<id> for a schedule created before the sharded layout"""
+        flat = os.path.join(self.data_dir, schedule_id)
+        if os.path.isdir(flat):
+            return flat
+        return os.path.join(self.data_dir, shard_path(schedule_id))
+
+    def meta_path(self, schedule_id):
+        """Get the path for a schedule's meta file"""
+        return os.path.join(self.schedule_directory(schedule_id), "meta.json")
+
+    def user_path(self, schedule_id, user_id):
+        """Get the path for a user's data file"""
+        return os.path.join(self.schedule_directory(schedule_id), f"{user_id}.json")
+
+    def aggregate_path(self, schedule_id):
+        """Get the path for a schedule's aggregate file"""
+        return os.path.join(self.schedule_directory(schedule_id), "aggregate.json")
+
+    def events_path(self, schedule_id):
+        """Get the path for a schedule's change log"""
+        return os.path.join(self.schedule_directory(schedule_id), "events.log")
+
+    def journal_path(self, schedule_id):
+        """Get the path for a schedule's journal"""
+        return os.path.join(self.schedule_directory(schedule_id), "journal.log")
+
+    def snapshot_path(self, schedule_id, seq):
+        """Get the path for the journal snapshot at seq. No .json suffix, so
+        list_users() passes over it."""
+        return os.path.join(self.schedule_directory(schedule_id), f"{SNAPSHOT_PREFIX}{seq}")
+
+    def _read_json(self, file_path, what):
+        if not os.path.exists(file_path):
+            return None
+
+        try:
+            with open(file_path, 'rb') as f:
+                return jsoncodec.loads(f.read())
+        except Exception as e:
+            logger.error(f"Error reading {what} data: {e}")
+            return None
+
+    @staticmethod
+    def _stamp(file_path):
+        """Identify a version of a file or directory, or None if it doesn't exist"""
+        try:
+            st = os.stat(file_path)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def _read_cached(self, file_path, what):
+        """Read a JSON file through the cache. Returns a copy the caller may change."""
+        stamp = self._stamp(file_path)
+        if stamp is None:
+            return None
+        if self.cache is None:
+            return self._read_json(file_path, what)
+
+        data = self.cache.get(file_path, stamp)
+        if data is MISSING:
+            data = self._read_json(file_path, what)
+            if data is None:
+                return None
+            self.cache.set(file_path, stamp, data)
+        return copy.deepcopy(data)
+
+    def _write_json(self, schedule_id, file_path, data, what):
+        # Ensure the schedule directory exists
+        schedule_dir = self.schedule_directory(schedule_id)
+        os.makedirs(schedule_dir, exist_ok=True)
+
+        # Write a temporary file and rename it over the target, so a concurrent
+        # reader sees either the old file or the new one, never a partial one.
+        # The .tmp suffix keeps it out of list_users().
+        fd, tmp_path = tempfile.mkstemp(dir=schedule_dir, prefix='.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(jsoncodec.dumpb(data))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, file_path)
+            if self.cache is not None:
+                self.cache.invalidate(file_path)
+                self.cache.invalidate(schedule_dir)
+            return True
+        except Exception as e:
+            logger.error(f"Error saving {what} data: {e}")
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            return False
+
+    def schedule_exists(self, schedule_id):
+        return os.path.exists(self.meta_path(schedule_id))
+
+    def get_schedule(self, schedule_id):
+        return self.unpack_schedule(self._read_cached(self.meta_path(schedule_id), 'schedule'))
+
+    def save_schedule(self, schedule_id, data):
+        saved = self._write_json(schedule_id, self.meta_path(schedule_id),
+                                 self.pack_schedule(data), 'schedule')
+        if saved:
+            self._update_index(self.index.update_schedule, schedule_id, data)
+        return saved
+
+    def _update_index(self, method, *args):
+        # The files are the real data and the index can be rebuilt from them,
+        # so a failed index update doesn't fail the save
+        try:
+            method(*args)
+        except sqlite3.Error as e:
+            logger.error(f"Error updating schedule index: {e}")
+
+    def get_user(self, schedule_id, user_id):
+        return self.unpack_user(self._read_cached(self.user_path(schedule_id, user_id), 'user'))
+
+    def save_user(self, schedule_id, user_id, data):
+        saved = self._write_json(schedule_id, self.user_path(schedule_id, user_id),
+                                 self.pack_user(data), 'user')
+        if saved:
+            self._update_index(self.index.update_respondent, schedule_id, user_id, data)
+        return saved
+
+    def list_respondents(self, schedule_id, sort='name', search=None, offset=0, limit=50):
+        try:
+            # Responses saved before the respondent index existed, or written
+            # while it was unavailable, show up as a count that doesn't match
+            if not self.index.respondents_current(schedule_id):
+                self._reindex_respondents(schedule_id)
+            return self.index.respondents(schedule_id, sort, search, offset, limit)
+        except sqlite3.Error as e:
+            logger.error(f"Error reading respondent index: {e}")
+            return super().list_respondents(schedule_id, sort, search, offset, limit)
+
+    def _reindex_respondents(self, schedule_id):
+        users = self.list_users(schedule_id)
+        self.index.replace_respondents(schedule_id, users)
+        schedule_data = self.get_schedule(schedule_id)
+        if schedule_data:
+            self.index.update_schedule(schedule_id, schedule_data,
+                                       sum(1 for _, data in users if 'name' in data))
+
+    def list_users(self, schedule_id):
+        schedule_dir = self.schedule_directory(schedule_id)
+        stamp = self._stamp(schedule_dir)
+        if stamp is None:
+            return []
+
+        # Every save renames a file into the directory, which changes its mtime
+        if self.cache is not None:
+            users = self.cache.get(schedule_dir, stamp)
+            if users is not MISSING:
+                return copy.deepcopy(users)
+
+        user_ids = [filename[:-5] for filename in os.listdir(schedule_dir)  # Remove .json extension
+                    if filename.endswith('.json') and filename not in RESERVED_FILES]
+        read = self._read_pool.map if self._parallel_reads() and len(user_ids) > 1 else map
+        loaded = read(lambda user_id: self.get_user(schedule_id, user_id), user_ids)
+        users = [(user_id, user_data) for user_id, user_data in zip(user_ids, loaded) if user_data]
+
+        if self.cache is not None and time.time() - stamp[1] / 1e9 > RACY_WINDOW:
+            self.cache.set(schedule_dir, stamp, copy.deepcopy(users))
+        return users
+
+    def _parallel_reads(self):
+        """Whether list_users() may read on the pool. Not while this thread holds
+        a schedule lock, and not under gevent: the pool's threads are greenlets
+        there, and waiting on them lets another greenlet block the worker in
+        flock() on the lock this one holds."""
+        if self._read_pool is None or self._local.__dict__.get('held'):
+            return False
+        monkey = sys.modules.get('gevent.monkey')
+        return monkey is None or not monkey.is_module_patched('threading')
+
+    def get_aggregate(self, schedule_id):
+        return self._read_cached(self.aggregate_path(schedule_id), 'aggregate')
+
+    def save_aggregate(self, schedule_id, data):
+        saved = self._write_json(schedule_id, self.aggregate_path(schedule_id), data, 'aggregate')
+        if saved:
+            self._update_index(self.index.update_respondents, schedule_id, data.get('count', 0))
+        return saved
+
+    def list_schedule_ids(self):
+        # Walks every shard; use list_schedules() to find schedules quickly
+        ids = []
+        for name in os.listdir(self.data_dir):
+            path = os.path.join(self.data_dir, name)
+            if not os.path.isdir(path):
+                continue
+            if name == ARCHIVE_DIR:
+                ids.extend(self._archived_ids())
+                continue
+            if not is_shard_name(name):
+                ids.append(name)  # A schedule from before sharding
+                continue
+            for inner in os.listdir(path):
+                inner_path = os.path.join(path, inner)
+                if is_shard_name(inner) and os.path.isdir(inner_path):
+                    ids.extend(entry for entry in os.listdir(inner_path)
+                               if os.path.isdir(os.path.join(inner_path, entry)))
+        return ids
+
+    def _archived_ids(self):
+        archive_dir = os.path.join(self.data_dir, ARCHIVE_DIR)
+        for shard in glob.glob(os.path.join(archive_dir, '*', '*', '*.tar.gz')):
+            yield os.path.basename(shard)[:-len('.tar.gz')]
+
+    def list_schedules(self, creator_id=None, created_before=None, updated_before=None,
+                       limit=None):
+        return self.index.query(creator_id, created_before, updated_before, limit)
+
+    def reindex(self, move_flat=False):
+        """Rebuild the schedule index from the schedule directories, and with
+        move_flat move schedules from before sharding into the sharded layout.
+        Run it with the app stopped. Returns the number of schedules indexed."""
+        indexed = 0
+        for schedule_id in self.list_schedule_ids():
+            flat = os.path.join(self.data_dir, schedule_id)
+            if move_flat and os.path.isdir(flat):
+                sharded = os.path.join(self.data_dir, shard_path(schedule_id))
+                os.makedirs(os.path.dirname(sharded), exist_ok=True)
+                os.rename(flat, sharded)
+
+            if not self.schedule_exists(schedule_id):
+                continue
+            self._reindex_respondents(schedule_id)
+            indexed += 1
+        return indexed
+
+    def scan_schedules(self, after_id=None, limit=1000):
+        return self.index.scan(after_id, limit)
+
+    def last_activity(self, schedule_id):
+        schedule_dir = self.schedule_directory(schedule_id)
+        latest = 0
+        try:
+            for entry in os.scandir(schedule_dir):
+                if entry.is_file() and entry.name != '.lock':
+                    latest = max(latest, entry.stat().st_mtime)
+        except FileNotFoundError:
+            return None
+        schedule_data = self.get_schedule(schedule_id) or {}
+        return max(filter(None, [datetime.fromtimestamp(latest).isoformat() if latest else None,
+                                 schedule_data.get('updated_at'), schedule_data.get('created_at')]),
+                   default=None)
+
+    def delete_schedule(self, schedule_id):
+        shutil.rmtree(self.schedule_directory(schedule_id), ignore_errors=True)
+        self._update_index(self.index.remove, schedule_id)
+
+    def archive_path(self, schedule_id):
+        """Get the path of a schedule's archive"""
+        return os.path.join(self.data_dir, ARCHIVE_DIR, shard_path(schedule_id) + '.tar.gz')
+
+    def is_archived(self, schedule_id):
+        return os.path.exists(self.archive_path(schedule_id))
+
+    def archive_schedule(self, schedule_id):
+        """Pack the schedule directory into one .tar.gz and remove the directory.
+        Its index entry stays, so it is still listed."""
+        schedule_dir = self.schedule_directory(schedule_id)
+        archive_path = self.archive_path(schedule_id)
+        os.makedirs(os.path.dirname(archive_path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(archive_path), prefix='.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                with tarfile.open(fileobj=f, mode='w:gz') as tar:
+                    for entry in sorted(os.scandir(schedule_dir), key=lambda e: e.name):
+                        if entry.is_file() and not entry.name.startswith('.'):
+                            tar.add(entry.path, arcname=entry.name)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, archive_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        # The lock file goes too. A request waiting on it would recreate the
+        # directory, but nothing has touched an archived schedule for months.
+        shutil.rmtree(schedule_dir, ignore_errors=True)
+
+    def restore_schedule(self, schedule_id):
+        """Unpack an archived schedule. Returns False if it isn't archived."""
+        archive_path = self.archive_path(schedule_id)
+        if not os.path.exists(archive_path):
+            return False
+        schedule_dir = self.schedule_directory(schedule_id)
+        os.makedirs(schedule_dir, exist_ok=True)
+        with tarfile.open(archive_path, 'r:gz') as tar:
+            # meta.json last, so the schedule only exists once it is complete
+            members = sorted(tar.getmembers(), key=lambda m: m.name == 'meta.json')
+            tar.extractall(schedule_dir, members=members, filter='data')
+        # Opening it again counts as activity, so it isn't archived straight back
+        os.utime(self.meta_path(schedule_id))
+        os.unlink(archive_path)
+        return True
+
+    @staticmethod
+    def _last_seq(path):
+        """The seq of the last complete line of a log of JSON lines, or 0"""
+        try:
+            with open(path, 'rb') as f:
+                end = f.seek(0, os.SEEK_END)
+                window = 4096
+                while True:
+                    # The first line read is usually cut off, so a line longer
+                    # than the window means reading further back
+                    f.seek(max(0, end - window))
+                    for line in reversed(f.read().splitlines()):
+                        try:
+                            return jsoncodec.loads(line)['seq']
+                        except (ValueError, KeyError, TypeError):
+                            continue
+                    if window >= end:
+                        return 0
+                    window *= 8
+        except FileNotFoundError:
+            return 0
+
+    def last_event_seq(self, schedule_id):
+        return self._last_seq(self.events_path(schedule_id))
+
+    def append_event(self, schedule_id, event):
+        path = self.events_path(schedule_id)
+        seq = self.last_event_seq(schedule_id) + 1
+        line = jsoncodec.dumpb(dict(event, seq=seq)) + b'\n'
+        with open(path, 'ab') as f:
+            f.write(line)
+            size = f.tell()
+
+        if size > EVENT_LOG_MAX_BYTES:
+            # Keep the newer half. Streams notice the file got shorter and find
+            # their place again by sequence number.
+            with open(path, 'rb') as f:
+                f.seek(size // 2)
+                f.readline()
+                tail = f.read()
+            fd, tmp_path = tempfile.mkstemp(dir=self.schedule_directory(schedule_id),
+                                            prefix='.', suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(tail)
+            os.replace(tmp_path, path)
+        return seq
+
+    def read_events(self, schedule_id, after_seq, cursor=None):
+        # The cursor is a byte offset into the log, and the log's inode, so a
+        # poll with nothing new is a single stat()
+        path = self.events_path(schedule_id)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return [], None
+        if cursor and cursor[1] == st.st_ino and cursor[0] == st.st_size:
+            return [], cursor
+        offset = cursor[0] if cursor and cursor[1] == st.st_ino else 0
+
+        events = []
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break  # Still being written; read it next time
+                offset += len(line)
+                event = jsoncodec.loads(line)
+                if event['seq'] > after_seq:
+                    events.append((event['seq'], event))
+        return events, (offset, st.st_ino)
+
+    def _snapshot_seqs(self, schedule_id):
+        """The seqs of the schedule's snapshots, newest first"""
+        try:
+            names = os.listdir(self.schedule_directory(schedule_id))
+        except FileNotFoundError:
+            return []
+        return sorted((int(name[len(SNAPSHOT_PREFIX):]) for name in names
+                       if name.startswith(SNAPSHOT_PREFIX) and name[len(SNAPSHOT_PREFIX):].isdigit()),
+                      reverse=True)
+
+    def append_journal(self, schedule_id, entry):
+        seqs = self._snapshot_seqs(schedule_id)
+        # The journal may have been trimmed right up to the newest snapshot
+        seq = max(self._last_seq(self.journal_path(schedule_id)), seqs[0] if seqs else 0) + 1
+        os.makedirs(self.schedule_directory(schedule_id), exist_ok=True)
+        line = jsoncodec.dumpb(dict(self.pack_entry(entry), seq=seq)) + b'\n'
+        with open(self.journal_path(schedule_id), 'a+b') as f:
+            # A line cut off by a crash would run into this one, so end it first
+            if f.seek(0, os.SEEK_END):
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b'\n':
+                    line = b'\n' + line
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+        return seq
+
+    @staticmethod
+    def _journal_entry(line):
+        """A journal line as a dict, or None for one cut off by a crash: that
+        change never happened"""
+        if not line.endswith(b'\n'):
+            return None
+        try:
+            entry = jsoncodec.loads(line)
+        except ValueError:
+            return None
+        return entry if isinstance(entry, dict) and 'seq' in entry else None
+
+    def read_journal(self, schedule_id, after_seq=0):
+        entries = []
+        try:
+            with open(self.journal_path(schedule_id), 'rb') as f:
+                for line in f:
+                    entry = self._journal_entry(line)
+                    if entry and entry['seq'] > after_seq:
+                        entries.append((entry['seq'], self.unpack_entry(entry)))
+        except FileNotFoundError:
+            pass
+        return entries
+
+    def get_snapshot(self, schedule_id, as_of=None):
+        for seq in self._snapshot_seqs(schedule_id):
+            snapshot = self._read_cached(self.snapshot_path(schedule_id, seq), 'snapshot')
+            if snapshot and (as_of is None or snapshot['at'] <= as_of):
+                return self.unpack_snapshot(snapshot)
+        return None
+
+    def save_snapshot(self, schedule_id, snapshot):
+        if not self._write_json(schedule_id, self.snapshot_path(schedule_id, snapshot['seq']),
+                                self.pack_snapshot(snapshot), 'snapshot'):
+            return False
+        seqs = self._snapshot_seqs(schedule_id)
+        for seq in seqs[SNAPSHOTS_KEPT:]:
+            os.unlink(self.snapshot_path(schedule_id, seq))
+        oldest = seqs[:SNAPSHOTS_KEPT][-1]
+
+        # Rewrite the journal without what the oldest snapshot covers
+        path = self.journal_path(schedule_id)
+        try:
+            with open(path, 'rb') as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return True
+        kept = [line for line in lines if (self._journal_entry(line) or {'seq': 0})['seq'] > oldest]
+        if len(kept) < len(lines):
+            fd, tmp_path = tempfile.mkstemp(dir=self.schedule_directory(schedule_id),
+                                            prefix='.', suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.writelines(kept)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        return True
+
+    def cache_stats(self):
+        return self.cache.stats() if self.cache is not None else None
+
+    def _version(self, file_path):
+        stamp = self._stamp(file_path)
+        return '.'.join(format(part, 'x') for part in stamp) if stamp else None
+
+    def schedule_version(self, schedule_id):
+        return self._version(self.meta_path(schedule_id))
+
+    def aggregate_version(self, schedule_id):
+        return self._version(self.aggregate_path(schedule_id))
+
+    def user_version(self, schedule_id, user_id):
+        return self._version(self.user_path(schedule_id, user_id))
+
+    @contextmanager
+    def lock(self, schedule_id):
+        held = self._local.__dict__.setdefault('held', set())
+        if schedule_id in held:
+            yield
+            return
+
+        # flock() conflicts between separate open() calls, so this covers other
+        # threads as well as other workers. Without fcntl, fall back to a lock
+        # that only covers this process.
+        if fcntl is None:
+            with self._thread_locks_guard:
+                thread_lock = self._thread_locks.setdefault(schedule_id, threading.Lock())
+            with thread_lock:
+                held.add(schedule_id)
+                try:
+                    yield
+                finally:
+                    held.discard(schedule_id)
+            return
+
+        schedule_dir = self.schedule_directory(schedule_id)
+        os.makedirs(schedule_dir, exist_ok=True)
+        with open(os.path.join(schedule_dir, '.lock'), 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            held.add(schedule_id)
+            try:
+                yield
+            finally:
+                held.discard(schedule_id)
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class SQLiteStorage(Storage):
+    """Everything in one SQLite database, in WAL mode so readers don't block the writer"""
+
+    name = 'sqlite'
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS schedules (
+        id TEXT PRIMARY KEY,
+        data TEXT NOT NULL,
+        creator_id TEXT,
+        created_at TEXT,
+        updated_at TEXT
+    );
+    CREATE INDEX IF NOT EXISTS schedules_creator ON schedules (creator_id);
+    CREATE INDEX IF NOT EXISTS schedules_updated ON schedules (updated_at);
+
+    CREATE TABLE IF NOT EXISTS responses (
+        schedule_id TEXT NOT NULL,
+        user_id TEXT NOT NULL,
+        name TEXT,
+        data TEXT NOT NULL,
+        updated_at TEXT,
+        PRIMARY KEY (schedule_id, user_id)
+    ) WITHOUT ROWID;
+
+    CREATE INDEX IF NOT EXISTS responses_name ON responses (schedule_id, name COLLATE NOCASE);
+
+    CREATE TABLE IF NOT EXISTS aggregates (
+        schedule_id TEXT PRIMARY KEY,
+        data TEXT NOT NULL
+    );
+
+    CREATE TABLE IF NOT EXISTS events (
+        schedule_id TEXT NOT NULL,
+        seq INTEGER NOT NULL,
+        data TEXT NOT NULL,
+        PRIMARY KEY (schedule_id, seq)
+    ) WITHOUT ROWID;
+
+    CREATE TABLE IF NOT EXISTS journal (
+        schedule_id TEXT NOT NULL,
+        seq INTEGER NOT NULL,
+        data TEXT NOT NULL,
+        PRIMARY KEY (schedule_id, seq)
+    ) WITHOUT ROWID;
+
+    CREATE TABLE IF NOT EXISTS snapshots (
+        schedule_id TEXT NOT NULL,
+        seq INTEGER NOT NULL,
+        at TEXT NOT NULL,
+        data TEXT NOT NULL,
+        PRIMARY KEY (schedule_id, seq)
+    ) WITHOUT ROWID;
+
+    CREATE TABLE IF NOT EXISTS archives (
+        schedule_id TEXT PRIMARY KEY,
+        data BLOB NOT NULL
+    );
+    """
+
+    # Events kept per schedule; older ones are deleted as new ones arrive
+    EVENTS_KEPT = 1000
+
+    def __init__(self, path):
+        self.path = str(path)
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._local = threading.local()
+        with self.db:
+            self.db.executescript(self.SCHEMA)
+
+    @property
+    def db(self):
+        """A connection for the current thread"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = connect_sqlite(self.path)
+        return conn
+
+    def _write(self, sql, params, what):
+        try:
+            if getattr(self._local, 'locked', False):
+                # Part of the transaction opened by lock(), which commits it
+                self.db.execute(sql, params)
+            else:
+                with self.db:
+                    self.db.execute(sql, params)
+            return True
+        except Exception as e:
+            logger.error(f"Error saving {what} data: {e}")
+            return False
+
+    def schedule_exists(self, schedule_id):
+        row = self.db.execute('SELECT 1 FROM schedules WHERE id = ?', (schedule_id,)).fetchone()
+        return row is not None
+
+    def get_schedule(self, schedule_id):
+        row = self.db.execute('SELECT data FROM schedules WHERE id = ?', (schedule_id,)).fetchone()
+        return self.unpack_schedule(jsoncodec.loads(row[0])) if row else None
+
+    def save_schedule(self, schedule_id, data):
+        return self._write(
+            'INSERT OR REPLACE INTO schedules (id, data, creator_id, created_at, updated_at) '
+            'VALUES (?, ?, ?, ?, ?)',
+            (schedule_id, jsoncodec.dumps(self.pack_schedule(data)), data.get('creator_id'),
+             data.get('created_at'), data.get('updated_at') or data.get('created_at')),
+            'schedule')
+
+    def get_user(self, schedule_id, user_id):
+        row = self.db.execute('SELECT data FROM responses WHERE schedule_id = ? AND user_id = ?',
+                              (schedule_id, user_id)).fetchone()
+        return self.unpack_user(jsoncodec.loads(row[0])) if row else None
+
+    def save_user(self, schedule_id, user_id, data):
+        return self._write(
+            'INSERT OR REPLACE INTO responses (schedule_id, user_id, name, data, updated_at) '
+            'VALUES (?, ?, ?, ?, ?)',
+            (schedule_id, user_id, data.get('name'), jsoncodec.dumps(self.pack_user(data)),
+             data.get('updated_at')),
+            'user')
+
+    def list_users(self, schedule_id):
+        rows = self.db.execute('SELECT user_id, data FROM responses WHERE schedule_id = ?',
+                               (schedule_id,))
+        return [(user_id, self.unpack_user(jsoncodec.loads(data))) for user_id, data in rows]
+
+    def list_respondents(self, schedule_id, sort='name', search=None, offset=0, limit=50):
+        return respondent_query(self.db, 'responses', 'schedule_id = ?', (schedule_id,),
+                                sort, search, offset, limit)
+
+    def get_aggregate(self, schedule_id):
+        row = self.db.execute('SELECT data FROM aggregates WHERE schedule_id = ?',
+                              (schedule_id,)).fetchone()
+        return jsoncodec.loads(row[0]) if row else None
+
+    def save_aggregate(self, schedule_id, data):
+        # The aggregate changes with every response, so this is when the
+        # schedule was last active
+        return self._write('INSERT OR REPLACE INTO aggregates (schedule_id, data) VALUES (?, ?)',
+                           (schedule_id, jsoncodec.dumps(data)), 'aggregate') and self._write(
+            'UPDATE schedules SET updated_at = ? WHERE id = ?',
+            (datetime.now().isoformat(), schedule_id), 'schedule')
+
+    def list_schedule_ids(self):
+        return [row[0] for row in self.db.execute('SELECT id FROM schedules')]
+
+    def list_schedules(self, creator_id=None, created_before=None, updated_before=None,
+                       limit=None):
+        sql, params = schedule_query(
+            "SELECT id, json_extract(s.data, '$.name'), creator_id, created_at, updated_at, "
+            "json_extract(a.data, '$.count') FROM schedules s "
+            "LEFT JOIN aggregates a ON a.schedule_id = s.id",
+            creator_id, created_before, updated_before, limit)
+        return [schedule_summary(row) for row in self.db.execute(sql, params)]
+
+    def scan_schedules(self, after_id=None, limit=1000):
+        rows = self.db.execute(
+            "SELECT id, json_extract(s.data, '$.name'), creator_id, created_at, updated_at, "
+            "json_extract(a.data, '$.count') FROM schedules s "
+            "LEFT JOIN aggregates a ON a.schedule_id = s.id WHERE id > ? ORDER BY id LIMIT ?",
+            (after_id or '', limit))
+        return [schedule_summary(row) for row in rows]
+
+    def last_activity(self, schedule_id):
+        row = self.db.execute(
+            'SELECT MAX(COALESCE(s.updated_at, s.created_at), '
+            'COALESCE((SELECT MAX(updated_at) FROM responses WHERE schedule_id = s.id), \'\')) '
+            'FROM schedules s WHERE id = ?', (schedule_id,)).fetchone()
+        return row[0] if row else None
+
+    def delete_schedule(self, schedule_id):
+        with self.lock(schedule_id):
+            for table, column in (('schedules', 'id'), ('responses', 'schedule_id'),
+                                  ('aggregates', 'schedule_id'), ('events', 'schedule_id'),
+                                  ('journal', 'schedule_id'), ('snapshots', 'schedule_id'),
+                                  ('archives', 'schedule_id')):
+                self.db.execute(f'DELETE FROM {table} WHERE {column} = ?', (schedule_id,))
+
+    def is_archived(self, schedule_id):
+        row = self.db.execute('SELECT 1 FROM archives WHERE schedule_id = ?',
+                              (schedule_id,)).fetchone()
+        return row is not None
+
+    def archive_schedule(self, schedule_id):
+        """Move the responses and aggregate into one compressed row. The schedule
+        row stays, so it is still listed."""
+        with self.lock(schedule_id):
+            responses = self.db.execute(
+                'SELECT user_id, name, data, updated_at FROM responses WHERE schedule_id = ?',
+                (schedule_id,)).fetchall()
+            aggregate = self.db.execute('SELECT data FROM aggregates WHERE schedule_id = ?',
+                                        (schedule_id,)).fetchone()
+            bundle = {'responses': responses, 'aggregate': aggregate[0] if aggregate else None}
+            bundle['journal'] = self.db.execute(
+                'SELECT seq, data FROM journal WHERE schedule_id = ?', (schedule_id,)).fetchall()
+            bundle['snapshots'] = self.db.execute(
+                'SELECT seq, at, data FROM snapshots WHERE schedule_id = ?', (schedule_id,)).fetchall()
+            self.db.execute('INSERT OR REPLACE INTO archives (schedule_id, data) VALUES (?, ?)',
+                            (schedule_id, zlib.compress(jsoncodec.dumpb(bundle))))
+            for table in ('responses', 'aggregates', 'events', 'journal', 'snapshots'):
+                self.db.execute(f'DELETE FROM {table} WHERE schedule_id = ?', (schedule_id,))
+
+    def restore_schedule(self, schedule_id):
+        with self.lock(schedule_id):
+            row = self.db.execute('SELECT data FROM archives WHERE schedule_id = ?',
+                                  (schedule_id,)).fetchone()
+            if row is None:
+                return False
+            bundle = jsoncodec.loads(zlib.decompress(row[0]))
+            self.db.executemany(
+                'INSERT OR REPLACE INTO responses (schedule_id, user_id, name, data, updated_at) '
+                'VALUES (?, ?, ?, ?, ?)',
+                [(schedule_id, *response) for response in bundle['responses']])
+            if bundle['aggregate']:
+                self.db.execute('INSERT OR REPLACE INTO aggregates (schedule_id, data) VALUES (?, ?)',
+                                (schedule_id, bundle['aggregate']))
+            # Archives from before the journal don't have one
+            self.db.executemany('INSERT OR REPLACE INTO journal (schedule_id, seq, data) VALUES (?, ?, ?)',
+                                [(schedule_id, *entry) for entry in bundle.get('journal', [])])
+            self.db.executemany(
+                'INSERT OR REPLACE INTO snapshots (schedule_id, seq, at, data) VALUES (?, ?, ?, ?)',
+                [(schedule_id, *snapshot) for snapshot in bundle.get('snapshots', [])])
+            self.db.execute('DELETE FROM archives WHERE schedule_id = ?', (schedule_id,))
+            # Opening it again counts as activity, so it isn't archived straight back
+            self.db.execute('UPDATE schedules SET updated_at = ? WHERE id = ?',
+                            (datetime.now().isoformat(), schedule_id))
+            return True
+
+    def last_event_seq(self, schedule_id):
+        row = self.db.execute('SELECT MAX(seq) FROM events WHERE schedule_id = ?',
+                              (schedule_id,)).fetchone()
+        return row[0] or 0
+
+    def append_event(self, schedule_id, event):
+        seq = self.last_event_seq(schedule_id) + 1
+        self._write('INSERT INTO events (schedule_id, seq, data) VALUES (?, ?, ?)',
+                    (schedule_id, seq, jsoncodec.dumps(dict(event, seq=seq))), 'event')
+        if seq > self.EVENTS_KEPT:
+            self._write('DELETE FROM events WHERE schedule_id = ? AND seq <= ?',
+                        (schedule_id, seq - self.EVENTS_KEPT), 'event')
+        return seq
+
+    def read_events(self, schedule_id, after_seq, cursor=None):
+        rows = self.db.execute(
+            'SELECT seq, data FROM events WHERE schedule_id = ? AND seq > ? ORDER BY seq',
+            (schedule_id, after_seq))
+        return [(seq, jsoncodec.loads(data)) for seq, data in rows], None
+
+    def append_journal(self, schedule_id, entry):
+        # The journal may have been trimmed right up to the newest snapshot
+        row = self.db.execute(
+            'SELECT MAX(COALESCE((SELECT MAX(seq) FROM journal WHERE schedule_id = ?), 0), '
+            'COALESCE((SELECT MAX(seq) FROM snapshots WHERE schedule_id = ?), 0))',
+            (schedule_id, schedule_id)).fetchone()
+        seq = row[0] + 1
+        if not self._write('INSERT INTO journal (schedule_id, seq, data) VALUES (?, ?, ?)',
+                           (schedule_id, seq, jsoncodec.dumps(self.pack_entry(entry))), 'journal'):
+            raise IOError('Failed to append to the journal')
+        return seq
+
+    def read_journal(self, schedule_id, after_seq=0):
+        rows = self.db.execute(
+            'SELECT seq, data FROM journal WHERE schedule_id = ? AND seq > ? ORDER BY seq',
+            (schedule_id, after_seq))
+        return [(seq, self.unpack_entry(jsoncodec.loads(data))) for seq, data in rows]
+
+    def get_snapshot(self, schedule_id, as_of=None):
+        sql, params = 'SELECT data FROM snapshots WHERE schedule_id = ?', [schedule_id]
+        if as_of is not None:
+            sql, params = sql + ' AND at <= ?', params + [as_of]
+        row = self.db.execute(sql + ' ORDER BY seq DESC LIMIT 1', params).fetchone()
+        return self.unpack_snapshot(jsoncodec.loads(row[0])) if row else None
+
+    def save_snapshot(self, schedule_id, snapshot):
+        with self.lock(schedule_id):
+            self.db.execute(
+                'INSERT OR REPLACE INTO snapshots (schedule_id, seq, at, data) VALUES (?, ?, ?, ?)',
+                (schedule_id, snapshot['seq'], snapshot['at'],
+                 jsoncodec.dumps(self.pack_snapshot(snapshot))))
+            self.db.execute(
+                'DELETE FROM snapshots WHERE schedule_id = ? AND seq NOT IN '
+                '(SELECT seq FROM snapshots WHERE schedule_id = ? ORDER BY seq DESC LIMIT ?)',
+                (schedule_id, schedule_id, SNAPSHOTS_KEPT))
+            self.db.execute(
+                'DELETE FROM journal WHERE schedule_id = ? AND seq <= '
+                '(SELECT MIN(seq) FROM snapshots WHERE schedule_id = ?)', (schedule_id, schedule_id))
+        return True
+
+    def _version(self, sql, params):
+        row = self.db.execute(sql, params).fetchone()
+        return hashlib.sha1(row[0].encode()).hexdigest()[:16] if row else None
+
+    def schedule_version(self, schedule_id):
+        return self._version('SELECT data FROM schedules WHERE id = ?', (schedule_id,))
+
+    def aggregate_version(self, schedule_id):
+        return self._version('SELECT data FROM aggregates WHERE schedule_id = ?', (schedule_id,))
+
+    def user_version(self, schedule_id, user_id):
+        return self._version('SELECT data FROM responses WHERE schedule_id = ? AND user_id = ?',
+                             (schedule_id, user_id))
+
+    @contextmanager
+    def lock(self, schedule_id):
+        # SQLite only has one writer at a time anyway, so an IMMEDIATE
+        # transaction ( which takes the write lock up front ) is the lock. Reads
+        # inside it see a consistent snapshot and writes commit together.
+        if getattr(self._local, 'locked', False):
+            yield
+            return
+
+        self.db.execute('BEGIN IMMEDIATE')
+        self._local.locked = True
+        try:
+            yield
+        except BaseException:
+            self.db.rollback()
+            raise
+        else:
+            self.db.commit()
+        finally:
+            self._local.locked = False
+
+
+def create_storage(config):
+    """Create the storage backend selected by the app config"""
+    backend = config.get('STORAGE_BACKEND') or 'file'
+    if backend == 'file':
+        cache = None
+        if config.get('CACHE_SIZE', 0) > 0:
+            cache = LRUCache(config['CACHE_SIZE'], config.get('CACHE_TTL', 300))
+        return FileStorage(config['DATA_DIR'], cache, config.get('STORAGE_READ_THREADS', 0))
+    if backend == 'sqlite':
+        path = config.get('SQLITE_PATH') or os.path.join(config['DATA_DIR'], 'scheduler.sqlite3')
+        return SQLiteStorage(path)
+    raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
+
+
+def migrate(source, destination):
+    """Copy every schedule, response and aggregate, and the journal since its
+    newest snapshot, from one backend to another. Archived schedules are
+    archived in the destination too.
+    Returns (schedules, responses) copied."""
+    schedules = responses = 0
+    for schedule_id in source.list_schedule_ids():
+        archived = source.is_archived(schedule_id)
+        with source.unarchived(schedule_id):
+            schedule_data = source.get_schedule(schedule_id)
+            if not schedule_data:
+                logger.warning(f"Skipping {schedule_id}: no schedule metadata")
+                continue
+
+            destination.save_schedule(schedule_id, schedule_data)
+            for user_id, user_data in source.list_users(schedule_id):
+                destination.save_user(schedule_id, user_id, user_data)
+                responses += 1
+
+            # Without an aggregate the destination rebuilds one when it's first needed
+            aggregate = source.get_aggregate(schedule_id)
+            if aggregate:
+                destination.save_aggregate(schedule_id, aggregate)
+
+            # The history goes back to the newest snapshot
+            snapshot = source.get_snapshot(schedule_id)
+            with destination.lock(schedule_id):
+                if snapshot:
+                    destination.save_snapshot(schedule_id, snapshot)
+                    for _, entry in source.read_journal(schedule_id, snapshot['seq']):
+                        destination.append_journal(schedule_id, entry)
+                if archived:
+                    destination.archive_schedule(schedule_id)
+        schedules += 1
+
+    return schedules, responses
@@ -0,0 +1,53 @@
+"""Shared setup for the tests that run the app"""
+
+import shutil
+import tempfile
+import unittest
+
+from app import app, init_storage
+
+
+class AppTestCase(unittest.TestCase):
+    """Runs the app on an empty, temporary DATA_DIR with the `backend` storage
+    and any other `config`, and creates a schedule: self.schedule_id and
+    self.password, owned by the self.owner client. Set create_schedule to
+    False to start with none."""
+
+    backend = 'file'
+    config = {}
+    create_schedule = True
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.old_config = dict(app.config)
+        app.config.update(DATA_DIR=self.data_dir, STORAGE_BACKEND=self.backend, SQLITE_PATH=None,
+                          **self.config)
+        self.storage = init_storage(app)
+        self.owner = app.test_client()
+        if self.create_schedule:
+            self.schedule_id, self.password = self.new_schedule(self.owner)
+
+    def tearDown(self):
+        app.config.update(self.old_config)
+        init_storage(app)
+        shutil.rmtree(self.data_dir, ignore_errors=True)
+
+    def new_schedule(self, client, **args):
+        """Create a schedule with GET /new and return its (id, password)"""
+        location = client.get('/new', query_string=args).headers['Location']
+        return location.split('/s/')[1].split('?')[0], location.split('pw=')[1]
+
+    def client_for(self, user_id, name=None):
+        """A client whose session is user_id's, named name ( default user_id.title() )"""
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['user_id'] = user_id
+            sess['name'] = name or user_id.title()
+        return client
+
+    def respond(self, user_id, selections, schedule_id=None, name=None):
+        """Save user_id's selections, to self.schedule_id by default, and return the response"""
+        response = self.client_for(user_id, name).post(
+            f'/u/{schedule_id or self.schedule_id}/{user_id}/selections', json=selections)
+        self.assertEqual(response.status_code, 200)
+        return response
@@ -0,0 +1,68 @@
+import json
+import os
+import unittest
+
+from app import get_storage, heatmap_tiers
+from test.base import AppTestCase
+
+
+class AggregateTest(AppTestCase):
+    """The per-schedule aggregate served by /s/<id>/info"""
+
+    def info(self):
+        return self.owner.get(f'/s/{self.schedule_id}/info').get_json()
+
+    def test_counts_follow_saves(self):
+        self.respond('alice', ['M08', 'T09'])
+        self.respond('bob', ['M08'])
+
+        info = self.info()
+        self.assertEqual(info['count'], 2)
+        self.assertEqual(info['dayhours'], {'M08': 2, 'T09': 1})
+
+        # Re-saving only applies the difference and doesn't add a respondent
+        self.respond('alice', ['T09', 'W10'])
+        info = self.info()
+        self.assertEqual(info['count'], 2)
+        self.assertEqual(info['dayhours'], {'M08': 1, 'T09': 1, 'W10': 1})
+
+    def test_version_increases(self):
+        first = self.respond('alice', ['M08']).get_json()['version']
+        second = self.respond('alice', ['M09']).get_json()['version']
+        self.assertGreater(second, first)
+        self.assertEqual(self.info()['version'], second)
+
+    def test_tiers(self):
+        counts = {'M08': 4, 'M09': 3, 'M10': 2, 'M11': 1, 'M12': 3}
+        self.assertEqual(heatmap_tiers(counts, 4),
+                         {'M08': '100', 'M09': '2nd', 'M12': '2nd', 'M10': '3rd', 'M11': 'red'})
+        self.assertEqual(heatmap_tiers({'M08': 5, 'M09': 4}, 5), {'M08': '100', 'M09': '2nd'})
+        self.assertEqual(heatmap_tiers({}, 0), {})
+
+    def test_info_tiers(self):
+        self.respond('alice', ['M08', 'T09', 'U21'])
+        self.respond('bob', ['M08'])
+        # self.owner made the schedule, so it can set blackouts
+        self.owner.post(f'/s/{self.schedule_id}/blackouts', json=['U21', 'W10'])
+
+        info = self.info()
+        self.assertEqual(info['tiers'], {'M08': '100', 'T09': '2nd', 'U21': 'blackout', 'W10': 'blackout'})
+        compact = self.owner.get(f'/s/{self.schedule_id}/info?format=bits').get_json()
+        self.assertEqual(compact['tiers']['100'], '1')
+
+    def test_missing_aggregate_is_rebuilt(self):
+        # A schedule from before aggregates existed
+        schedule_dir = get_storage().schedule_directory(self.schedule_id)
+        os.remove(os.path.join(schedule_dir, 'aggregate.json'))
+        for user_id, selections in (('aaaaaa', ['M08', 'R12']), ('bbbbbb', ['R12'])):
+            with open(os.path.join(schedule_dir, f'{user_id}.json'), 'w') as f:
+                json.dump({'name': user_id, 'selections': selections}, f)
+
+        info = self.info()
+        self.assertEqual(info['count'], 2)
+        self.assertEqual(info['dayhours'], {'M08': 1, 'R12': 2})
+        self.assertTrue(os.path.exists(os.path.join(schedule_dir, 'aggregate.json')))
+
+
+if __name__ == '__main__':
+    unittest.main()
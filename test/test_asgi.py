@@ -0,0 +1,121 @@
+import asyncio
+import json
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import storage
+from app import app, get_storage
+from asgi import Application, application
+from test.base import AppTestCase
+
+
+def call(method, path, query=b'', headers=(), body=b''):
+    """Run one request through the ASGI application.
+    Returns (status, headers, body)."""
+    scope = {'type': 'http', 'http_version': '1.1', 'method': method, 'scheme': 'http',
+             'path': path, 'root_path': '', 'query_string': query,
+             'headers': [(name.encode(), value.encode()) for name, value in headers],
+             'server': ('testserver', 80), 'client': ('127.0.0.1', 1234)}
+    incoming = [{'type': 'http.request', 'body': body[:10], 'more_body': True},
+                {'type': 'http.request', 'body': body[10:], 'more_body': False}]
+    messages = []
+
+    async def receive():
+        if incoming:
+            return incoming.pop(0)
+        # The client stays connected
+        await asyncio.Event().wait()
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(application(scope, receive, send))
+    start = messages[0]
+    response_headers = {name.decode(): value.decode() for name, value in start['headers']}
+    return start['status'], response_headers, b''.join(m.get('body', b'') for m in messages[1:])
+
+
+class ASGITest(AppTestCase):
+
+    config = {'SSE_POLL_INTERVAL': 0.01, 'SSE_MAX_AGE': 0.2}
+
+    def session_cookie(self, user_id):
+        return f"session={self.client_for(user_id).get_cookie('session').value}"
+
+    def test_routes_match_wsgi(self):
+        status, headers, body = call('GET', f'/s/{self.schedule_id}/info')
+        self.assertEqual(status, 200)
+        self.assertEqual(headers['content-type'], 'application/json')
+        self.assertEqual(json.loads(body), app.test_client().get(f'/s/{self.schedule_id}/info').get_json())
+
+        status, _, _ = call('GET', '/s/nosuch/info')
+        self.assertEqual(status, 404)
+
+    def test_post_body(self):
+        cookie = self.session_cookie('alice')
+        body = json.dumps(['M08', 'M09', 'T10']).encode()
+        status, _, _ = call('POST', f'/u/{self.schedule_id}/alice/selections',
+                            headers=[('Content-Type', 'application/json'),
+                                     ('Content-Length', str(len(body))), ('Cookie', cookie)],
+                            body=body)
+        self.assertEqual(status, 200)
+        self.assertEqual(get_storage().get_user(self.schedule_id, 'alice')['selections'],
+                         ['M08', 'M09', 'T10'])
+
+    def test_events_stream(self):
+        get_storage().append_event(self.schedule_id, {'type': 'blackouts', 'blackouts': ['M08']})
+        status, headers, body = call('GET', f'/s/{self.schedule_id}/events', query=b'after=0')
+        self.assertEqual(status, 200)
+        self.assertTrue(headers['content-type'].startswith('text/event-stream'))
+        self.assertEqual(headers['cache-control'], 'no-cache')
+        text = body.decode()
+        self.assertTrue(text.startswith('retry: '))
+        self.assertIn('id: 1\nevent: blackouts\n', text)
+
+        # Unknown schedules are left to Flask
+        status, _, _ = call('GET', '/s/nosuch/events')
+        self.assertEqual(status, 404)
+
+    def test_lifespan(self):
+        incoming = [{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}]
+        sent = []
+
+        async def receive():
+            return incoming.pop(0)
+
+        async def send(message):
+            sent.append(message['type'])
+
+        # A separate application, since shutdown stops its threads
+        asyncio.run(Application(app, 2)({'type': 'lifespan'}, receive, send))
+        self.assertEqual(sent, ['lifespan.startup.complete', 'lifespan.shutdown.complete'])
+
+
+class ReadThreadsTest(unittest.TestCase):
+
+    def test_list_users_on_threads(self):
+        data_dir = tempfile.mkdtemp()
+        try:
+            threaded = storage.FileStorage(data_dir, read_threads=4)
+            threaded.save_schedule('abc123', {'id': 'abc123'})
+            for n in range(20):
+                threaded.save_user('abc123', f'u{n}', {'name': f'User {n}', 'selections': ['M08']})
+            sequential = storage.FileStorage(data_dir)
+            self.assertEqual(sorted(threaded.list_users('abc123')), sorted(sequential.list_users('abc123')))
+            self.assertEqual(len(threaded.list_users('abc123')), 20)
+
+            # Not while holding the lock, nor under gevent
+            with mock.patch.object(threaded._read_pool, 'map', side_effect=AssertionError):
+                with threaded.lock('abc123'):
+                    self.assertEqual(len(threaded.list_users('abc123')), 20)
+                monkey = mock.Mock(**{'is_module_patched.return_value': True})
+                with mock.patch.dict('sys.modules', {'gevent.monkey': monkey}):
+                    self.assertEqual(len(threaded.list_users('abc123')), 20)
+        finally:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
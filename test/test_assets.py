@@ -0,0 +1,103 @@
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+
+import assets
+from app import app, load_assets, vendor_url
+
+
+class AssetsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.static_dir = tempfile.mkdtemp()
+        self.write('app.js', 'console.log("hello");\n' * 50)
+        self.write('style.css', 'body { background: url("img/bg.png?v=1") } '
+                                '.x { background: url(data:image/png;base64,AAAA) }\n' * 20)
+        self.write('img/bg.png', 'not really a png')
+
+    def tearDown(self):
+        shutil.rmtree(self.static_dir, ignore_errors=True)
+
+    def write(self, path, text):
+        path = os.path.join(self.static_dir, path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(text)
+
+    def read(self, path):
+        with open(os.path.join(self.static_dir, path), 'rb') as f:
+            return f.read()
+
+
+class BuildAssetsTest(AssetsTestCase):
+
+    def test_build(self):
+        manifest = assets.build_assets(self.static_dir)
+        self.assertEqual(sorted(manifest), ['app.js', 'img/bg.png', 'style.css'])
+        self.assertRegex(manifest['app.js'], r'^dist/app\.[0-9a-f]{12}\.js$')
+        self.assertEqual(assets.load_manifest(self.static_dir), manifest)
+
+        # The stylesheet points at the hashed image, and keeps data: URLs
+        css = self.read(manifest['style.css']).decode()
+        self.assertIn(f'url("{manifest["img/bg.png"][5:]}?v=1")', css)
+        self.assertIn('url(data:image/png;base64,AAAA)', css)
+
+        self.assertEqual(gzip.decompress(self.read(manifest['app.js'] + '.gz')), self.read('app.js'))
+        self.assertFalse(os.path.exists(os.path.join(self.static_dir, manifest['img/bg.png'] + '.gz')))
+
+        # A changed file gets a new name, and the old one stays for pages that still use it
+        self.write('app.js', 'console.log("changed");\n')
+        rebuilt = assets.build_assets(self.static_dir)
+        self.assertNotEqual(rebuilt['app.js'], manifest['app.js'])
+        self.assertTrue(os.path.exists(os.path.join(self.static_dir, manifest['app.js'])))
+        self.assertEqual(rebuilt['img/bg.png'], manifest['img/bg.png'])
+
+
+class ServeAssetsTest(AssetsTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.old_static_folder = app.static_folder
+        app.static_folder = self.static_dir
+        self.manifest = assets.build_assets(self.static_dir)
+        load_assets(app)
+        self.client = app.test_client()
+
+    def tearDown(self):
+        app.static_folder = self.old_static_folder
+        load_assets(app)
+        super().tearDown()
+
+    def test_fingerprinted_urls(self):
+        with app.test_request_context():
+            from flask import url_for
+            self.assertEqual(url_for('static', filename='app.js'), f"/static/{self.manifest['app.js']}")
+            # Not built: the CDN
+            self.assertTrue(vendor_url('vendor/bootstrap/bootstrap.min.css').startswith('https://'))
+            self.write('vendor/bootstrap/bootstrap.min.css', '')
+            self.assertEqual(vendor_url('vendor/bootstrap/bootstrap.min.css'),
+                             '/static/vendor/bootstrap/bootstrap.min.css')
+
+    def test_serve(self):
+        url = f"/static/{self.manifest['app.js']}"
+        response = self.client.get(url, headers={'Accept-Encoding': 'gzip, deflate'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertIn('javascript', response.headers['Content-Type'])
+        self.assertIn('immutable', response.headers['Cache-Control'])
+        self.assertIn('max-age=31536000', response.headers['Cache-Control'])
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+        self.assertEqual(gzip.decompress(response.data), self.read('app.js'))
+
+        plain = self.client.get(url)
+        self.assertNotIn('Content-Encoding', plain.headers)
+        self.assertEqual(plain.data, self.read('app.js'))
+
+        self.assertEqual(self.client.get('/static/dist/../app.js').status_code, 404)
+        self.assertEqual(self.client.get('/static/dist/nosuch.js').status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
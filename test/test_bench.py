@@ -0,0 +1,41 @@
+import os
+import unittest
+
+from bench import startup
+from bench.runner import compare, percentile, run_benchmarks
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class BenchTest(unittest.TestCase):
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([7], 90), 7)
+
+    def test_small_run(self):
+        for backend in ('file', 'sqlite'):
+            with self.subTest(backend=backend):
+                results = run_benchmarks(sizes=[1, 3], many_schedules=2, iterations=2, threads=2,
+                                         writes_per_thread=2, backend=backend)
+                scenarios = {(r['fixture'], r['scenario']) for r in results['results']}
+                self.assertIn(('r3', 'schedule_info'), scenarios)
+                self.assertIn(('2 schedules', 'selections_post'), scenarios)
+                writers = [r for r in results['results'] if r['scenario'] == 'concurrent_writers']
+                self.assertEqual(len(writers), 3)
+                self.assertTrue(all(r['consistent'] and r['errors'] == 0 for r in writers))
+                self.assertEqual(len(compare(results, results)), len(results['results']) + 1)
+
+    def test_startup(self):
+        results = startup.run_startup(APP_DIR, runs=1)
+        self.assertGreater(results['import']['import_seconds'], 0)
+        self.assertGreater(results['import']['max_rss_kb'], 0)
+        # numpy is only imported by the ranking route
+        self.assertFalse(results['numpy_loaded'])
+        self.assertEqual(len(startup.compare(results, results)), len(results['import']) + 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
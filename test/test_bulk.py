@@ -0,0 +1,120 @@
+import csv
+import io
+import json
+import os
+import unittest
+
+from app import app, get_storage
+from test.base import AppTestCase
+
+TOKEN = 'test-token'
+
+
+def ndjson(*records):
+    return ''.join(json.dumps(record) + '\n' for record in records)
+
+
+class BulkTest(AppTestCase):
+
+    config = {'BULK_API_TOKEN': TOKEN}
+    create_schedule = False
+
+    def setUp(self):
+        super().setUp()
+        self.auth = {'Authorization': f'Bearer {TOKEN}'}
+
+    def bulk_import(self, body):
+        return self.owner.post('/bulk/import', data=body, headers=self.auth,
+                                content_type='application/x-ndjson')
+
+    def test_import(self):
+        response = self.bulk_import(ndjson(
+            {'type': 'schedule', 'name': 'Onboarding', 'blackouts': ['U21']},
+            {'type': 'response', 'user_id': 'aaaaaa', 'name': 'Ann', 'selections': ['M08', 'T09']},
+            {'type': 'response', 'user_id': 'bbbbbb', 'name': 'Bob', 'bits': '1'},
+            {'type': 'response', 'schedule_id': 'nothere', 'name': 'Cy'},
+        ) + 'not json\n')
+        self.assertEqual(response.status_code, 200)
+        summary = response.get_json()
+        self.assertEqual((summary['schedules'], summary['responses']), (1, 2))
+        self.assertEqual([error['line'] for error in summary['errors']], [4, 5])
+
+        schedule_id = summary['created'][0]['id']
+        info = self.owner.get(f'/s/{schedule_id}/info').get_json()
+        self.assertEqual(info['count'], 2)
+        self.assertEqual(info['dayhours'], {'M08': 2, 'T09': 1})
+        self.assertEqual(info['blackouts'], ['U21'])
+        # All the responses of one schedule are one aggregate update
+        self.assertEqual(info['version'], 2)
+
+        # Importing again updates responses instead of adding respondents
+        self.bulk_import(ndjson({'type': 'response', 'schedule_id': schedule_id,
+                                 'user_id': 'aaaaaa', 'name': 'Ann', 'selections': ['W10']}))
+        info = self.owner.get(f'/s/{schedule_id}/info').get_json()
+        self.assertEqual(info['count'], 2)
+        self.assertEqual(info['dayhours'], {'M08': 1, 'W10': 1})
+
+    def test_bad_ids_rejected(self):
+        summary = self.bulk_import(ndjson(
+            {'type': 'schedule', 'id': '../../../tmp/escape', 'name': 'Evil'},
+            {'type': 'response', 'user_id': 'aaaaaa', 'name': 'Ann', 'selections': ['M08']},
+            {'type': 'schedule', 'id': 'sched1', 'name': 'One'},
+            {'type': 'response', 'user_id': 'meta', 'name': 'Evil', 'selections': ['M08']},
+            {'type': 'response', 'user_id': 'aggregate', 'name': 'Evil'},
+            {'type': 'response', 'schedule_id': 'ab', 'user_id': 'bbbbbb', 'name': 'Bob'},
+            {'type': 'schedule', 'id': '_archive'},
+        )).get_json()
+        self.assertEqual([error['line'] for error in summary['errors']], [1, 2, 4, 5, 6, 7])
+        self.assertEqual((summary['schedules'], summary['responses']), (1, 0))
+        # Where DATA_DIR/ab/cd/../../../tmp/escape would have been
+        self.assertFalse(os.path.exists(os.path.join(os.path.dirname(self.data_dir), 'tmp', 'escape')))
+
+        schedule = get_storage().get_schedule('sched1')
+        self.assertEqual(schedule['name'], 'One')
+        self.assertNotIn('selections', schedule)
+        self.assertEqual(get_storage().get_aggregate('sched1')['count'], 0)
+        self.assertEqual(get_storage().list_schedule_ids(), ['sched1'])
+
+    def test_export_round_trip(self):
+        summary = self.bulk_import(ndjson(
+            {'type': 'schedule', 'id': 'sched1', 'name': 'One'},
+            {'type': 'response', 'user_id': 'aaaaaa', 'name': 'Ann', 'selections': ['M08']},
+            {'type': 'schedule', 'id': 'sched2', 'name': 'Two'},
+        )).get_json()
+        self.assertEqual(summary['schedules'], 2)
+
+        response = self.owner.get('/bulk/export?schedule=sched1', headers=self.auth)
+        records = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        self.assertEqual([record['type'] for record in records], ['schedule', 'response'])
+        self.assertEqual(records[1]['selections'], ['M08'])
+
+        response = self.owner.get('/bulk/export?format=csv', headers=self.auth)
+        rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+        self.assertEqual([(row['schedule_name'], row['name'], row['selections']) for row in rows],
+                         [('One', 'Ann', 'M08')])
+
+    def test_export_command(self):
+        self.bulk_import(ndjson(
+            {'type': 'schedule', 'id': 'sched1', 'name': 'One'},
+            {'type': 'response', 'user_id': 'aaaaaa', 'name': 'Ann', 'selections': ['M08']},
+        ))
+        runner = app.test_cli_runner()
+        result = runner.invoke(args=['export-data'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        records = [json.loads(line) for line in result.output.splitlines()]
+        self.assertEqual([record['type'] for record in records], ['schedule', 'response'])
+
+        result = runner.invoke(args=['export-data', '--format', 'csv', '--schedule', 'sched1'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        rows = list(csv.DictReader(io.StringIO(result.output)))
+        self.assertEqual([(row['name'], row['selections']) for row in rows], [('Ann', 'M08')])
+
+    def test_token_required(self):
+        self.assertEqual(self.owner.get('/bulk/export').status_code, 401)
+        self.assertEqual(self.owner.get('/bulk/export', headers={'Authorization': 'Bearer nope'}).status_code, 401)
+        app.config['BULK_API_TOKEN'] = None
+        self.assertEqual(self.owner.get('/bulk/export', headers=self.auth).status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
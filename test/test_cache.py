@@ -0,0 +1,94 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from app import app
+from test.base import AppTestCase
+from cache import MISSING, LRUCache
+from storage import FileStorage
+
+
+class LRUCacheTest(unittest.TestCase):
+
+    def test_stamp_must_match(self):
+        cache = LRUCache()
+        cache.set('k', 1, 'value')
+        self.assertEqual(cache.get('k', 1), 'value')
+        self.assertIs(cache.get('k', 2), MISSING)
+        self.assertIs(cache.get('k', 1), MISSING)
+        self.assertEqual(cache.stats()['invalidations'], 1)
+
+    def test_size_eviction(self):
+        cache = LRUCache(maxsize=2)
+        cache.set('a', 0, 1)
+        cache.set('b', 0, 2)
+        cache.get('a', 0)
+        cache.set('c', 0, 3)
+        self.assertIs(cache.get('b', 0), MISSING)
+        self.assertEqual(cache.get('a', 0), 1)
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_ttl(self):
+        cache = LRUCache(ttl=10)
+        cache.set('a', 0, 1)
+        with mock.patch('cache.time.monotonic', return_value=time.monotonic() + 11):
+            self.assertIs(cache.get('a', 0), MISSING)
+        self.assertEqual(cache.stats()['expirations'], 1)
+
+
+class FileStorageCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.storage = FileStorage(self.data_dir, LRUCache())
+        self.storage.save_schedule('abc123', {'id': 'abc123', 'name': 'one'})
+
+    def tearDown(self):
+        shutil.rmtree(self.data_dir, ignore_errors=True)
+
+    def test_hits_return_copies(self):
+        self.storage.get_schedule('abc123')['name'] = 'changed by caller'
+        self.assertEqual(self.storage.get_schedule('abc123')['name'], 'one')
+        self.assertEqual(self.storage.cache_stats()['hits'], 1)
+
+    def test_rewrite_by_another_worker_is_seen(self):
+        self.storage.get_schedule('abc123')
+        # Another process with its own cache saves the file
+        FileStorage(self.data_dir).save_schedule('abc123', {'id': 'abc123', 'name': 'two'})
+        self.assertEqual(self.storage.get_schedule('abc123')['name'], 'two')
+
+    def test_respondent_listing_cached_once_quiet(self):
+        self.storage.save_user('abc123', 'u1', {'name': 'Ann', 'selections': ['M08']})
+        schedule_dir = self.storage.schedule_directory('abc123')
+        past = time.time() - 60
+        os.utime(schedule_dir, (past, past))
+
+        self.storage.list_users('abc123')
+        hits = self.storage.cache_stats()['hits']
+        self.assertEqual(self.storage.list_users('abc123')[0][1]['selections'], ['M08'])
+        self.assertEqual(self.storage.cache_stats()['hits'], hits + 1)
+
+        # A new respondent changes the directory
+        with open(os.path.join(schedule_dir, 'u2.json'), 'w') as f:
+            json.dump({'name': 'Bo', 'selections': []}, f)
+        self.assertEqual(len(self.storage.list_users('abc123')), 2)
+
+
+
+class CacheStatsRouteTest(AppTestCase):
+
+    create_schedule = False
+
+    def test_metrics_allow(self):
+        app.config['METRICS_ALLOW'] = '10.0.0.0/8'
+        self.assertEqual(self.owner.get('/_stats/cache').status_code, 403)
+        app.config['METRICS_ALLOW'] = '127.0.0.0/8'
+        self.assertIn('hits', self.owner.get('/_stats/cache').get_json()['pages'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import time
+import unittest
+
+from app import app
+from test.base import AppTestCase
+
+
+class CombinedTest(AppTestCase):
+
+    create_schedule = False
+
+    def setUp(self):
+        super().setUp()
+        self.owners = {}
+        for _ in range(3):
+            owner = app.test_client()
+            self.owners[self.new_schedule(owner)[0]] = owner
+        self.schedule_ids = list(self.owners)
+
+    def combined(self, schedule_ids, **args):
+        query = '&'.join([f'schedule={i}' for i in schedule_ids] + [f'{k}={v}' for k, v in args.items()])
+        return app.test_client().get(f'/combined/info?{query}')
+
+    def test_people_counted_once(self):
+        a, b, c = self.schedule_ids
+        self.respond('ann', ['M08', 'M09'], a)
+        self.respond('bob', ['M08', 'T10'], b)
+        self.respond('cat', ['M08'], c)
+        # Ann answered b later, and only her latest answer counts
+        time.sleep(0.01)
+        self.respond('ann', ['M08', 'T10'], b)
+
+        data = self.combined([a, b, c]).get_json()
+        self.assertEqual(data['count'], 3)
+        self.assertEqual(data['responses'], 4)
+        self.assertEqual(data['dayhours'], {'M08': 3, 'T10': 2})
+        self.assertEqual(data['tiers']['M08'], '100')
+        self.assertEqual([s['count'] for s in data['schedules']], [1, 2, 1])
+        self.assertEqual(data['slots'][0], {'start': 'M08', 'dayhours': ['M08'], 'count': 3, 'ratio': 1.0})
+
+    def test_blackouts_and_hours(self):
+        a, b, _ = self.schedule_ids
+        self.respond('ann', ['M08', 'M09', 'T08', 'T09'], a)
+        self.respond('bob', ['M08', 'M09', 'T08', 'T09'], b)
+        self.assertEqual(self.owners[b].post(f'/s/{b}/blackouts', json=['M09']).status_code, 200)
+        # Comma separated ids work too
+        data = self.combined([f'{a},{b}'], hours=2).get_json()
+        self.assertEqual(data['blackouts'], ['M09'])
+        self.assertEqual(data['tiers']['M09'], 'blackout')
+        self.assertEqual([slot['start'] for slot in data['slots']], ['T08'])
+        # limit is kept to 1..MAX_BEST_SLOTS, as for /best
+        self.assertEqual(len(self.combined([a, b], limit=-1).get_json()['slots']), 1)
+
+    def test_errors(self):
+        self.assertEqual(self.combined([]).status_code, 400)
+        response = self.combined([self.schedule_ids[0], 'nosuch'])
+        self.assertEqual(response.status_code, 404)
+        self.assertIn('nosuch', response.get_json()['error'])
+        self.assertEqual(self.combined(self.schedule_ids, hours=20).status_code, 400)
+
+    def test_page(self):
+        response = app.test_client().get(f'/combined?schedule={self.schedule_ids[0]}')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'fetchCombinedInfo', response.data)
+
+
+if __name__ == '__main__':
+    unittest.main()
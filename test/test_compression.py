@@ -0,0 +1,94 @@
+import gzip
+import json
+import unittest
+from unittest import mock
+
+import compression
+import jsoncodec
+from app import app
+from test.base import AppTestCase
+
+TOKEN = 'test-token'
+
+
+class JSONCodecTest(unittest.TestCase):
+
+    def check_round_trip(self):
+        value = {'name': 'Zoë', 'dayhours': {'M08': 2}, 'blackouts': [], 'ok': True, 'n': None}
+        self.assertEqual(jsoncodec.loads(jsoncodec.dumpb(value)), value)
+        self.assertEqual(jsoncodec.loads(jsoncodec.dumps(value)), value)
+        self.assertEqual(json.loads(jsoncodec.dumps(value)), value)
+        self.assertNotIn(' ', jsoncodec.dumps({'a': [1, 2]}))
+        with self.assertRaises(ValueError):
+            jsoncodec.loads(b'{not json')
+
+    def test_round_trip(self):
+        self.check_round_trip()
+
+    def test_without_orjson(self):
+        with mock.patch.object(jsoncodec, 'orjson', None):
+            self.check_round_trip()
+
+
+class CompressionTest(AppTestCase):
+
+    config = {'BULK_API_TOKEN': TOKEN, 'COMPRESS_MIN_SIZE': 0}
+
+    def setUp(self):
+        super().setUp()
+        self.url = f'/s/{self.schedule_id}/info'
+
+    def test_gzip(self):
+        response = self.owner.get(self.url, headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+        self.assertEqual(json.loads(gzip.decompress(response.get_data()))['id'], self.schedule_id)
+
+        plain = self.owner.get(self.url)
+        self.assertNotIn('Content-Encoding', plain.headers)
+        self.assertEqual(plain.get_json()['id'], self.schedule_id)
+
+    @unittest.skipUnless(compression.brotli, 'brotli is not installed')
+    def test_brotli(self):
+        response = self.owner.get(self.url, headers={'Accept-Encoding': 'gzip, br'})
+        self.assertEqual(response.headers['Content-Encoding'], 'br')
+        data = compression.brotli.decompress(response.get_data())
+        self.assertEqual(json.loads(data)['id'], self.schedule_id)
+
+    def test_min_size(self):
+        app.config['COMPRESS_MIN_SIZE'] = 100000
+        response = self.owner.get(self.url, headers={'Accept-Encoding': 'gzip'})
+        self.assertNotIn('Content-Encoding', response.headers)
+        app.config['COMPRESS_MIN_SIZE'] = -1
+        response = self.owner.get(self.url, headers={'Accept-Encoding': 'gzip'})
+        self.assertNotIn('Content-Encoding', response.headers)
+
+    def test_weak_etag_revalidates(self):
+        first = self.owner.get(self.url, headers={'Accept-Encoding': 'gzip'})
+        etag = first.headers['ETag']
+        self.assertTrue(etag.startswith('W/'))
+        second = self.owner.get(self.url, headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+        self.assertEqual(second.status_code, 304)
+
+    def test_streamed_export(self):
+        self.owner.post(f'/s/{self.schedule_id}/update?pw={self.password}',
+                         json={'name': 'Exported', 'pw': self.password})
+        response = self.owner.get(f'/bulk/export?schedule={self.schedule_id}',
+                                   headers={'Authorization': f'Bearer {TOKEN}', 'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertNotIn('Content-Length', response.headers)
+        record = json.loads(gzip.decompress(response.get_data()).splitlines()[0])
+        self.assertEqual(record['name'], 'Exported')
+
+    def test_update_does_not_echo_schedule(self):
+        response = self.owner.post(f'/s/{self.schedule_id}/update',
+                                    json={'name': 'Renamed', 'pw': self.password})
+        data = response.get_json()
+        self.assertEqual(data['status'], 'ok')
+        self.assertIn('updated_at', data)
+        self.assertNotIn('schedule', data)
+        self.assertNotIn(self.password, response.get_data(as_text=True))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import os
+import threading
+import unittest
+
+from app import get_schedule_data, get_storage
+from test.base import AppTestCase
+
+
+class ConcurrentWriteTest(AppTestCase):
+    """Saves racing on one schedule must not lose each other's changes"""
+
+    def run_threads(self, targets):
+        threads = [threading.Thread(target=target) for target in targets]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def test_parallel_responses(self):
+        def respond(n):
+            for selections in (['M08'], ['M08', 'T09']):
+                self.respond(f'user{n:02d}', selections, name=f'user{n}')
+
+        self.run_threads([lambda n=n: respond(n) for n in range(12)])
+
+        info = self.owner.get(f'/s/{self.schedule_id}/info').get_json()
+        self.assertEqual(info['count'], 12)
+        self.assertEqual(info['dayhours'], {'M08': 12, 'T09': 12})
+        self.assertEqual(info['version'], 25)
+
+    def test_metadata_and_blackouts_both_kept(self):
+        def update_name():
+            self.owner.post(f'/s/{self.schedule_id}/update', json={'name': 'Standup'})
+
+        def update_blackouts():
+            self.owner.post(f'/s/{self.schedule_id}/blackouts', json=['M08'])
+
+        self.run_threads([update_name, update_blackouts] * 4)
+
+        schedule = get_schedule_data(self.schedule_id)
+        self.assertEqual(schedule['name'], 'Standup')
+        self.assertEqual(schedule['blackouts'], ['M08'])
+
+        if self.backend == 'file':
+            leftovers = [f for f in os.listdir(get_storage().schedule_directory(self.schedule_id))
+                         if f.endswith('.tmp')]
+            self.assertEqual(leftovers, [])
+
+
+class SQLiteConcurrentWriteTest(ConcurrentWriteTest):
+    backend = 'sqlite'
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import json
+import os
+import random
+import unittest
+
+import dayhours
+from app import app, get_storage, get_user_data, save_user_data
+from test.base import AppTestCase
+
+
+class DayhourMaskTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        selections = ['M08', 'R12', 'U21']
+        mask = dayhours.to_mask(selections)
+        self.assertEqual(dayhours.from_mask(dayhours.decode(dayhours.encode(mask))), selections)
+
+    def test_bit_order(self):
+        self.assertEqual(dayhours.to_mask(['M08']), 1)
+        self.assertEqual(dayhours.to_mask(['T08']), 1 << 14)
+        self.assertEqual(dayhours.to_mask(dayhours.DAYHOURS), dayhours.FULL_MASK)
+
+    def test_unknown_key(self):
+        with self.assertRaises(ValueError):
+            dayhours.to_mask(['M07'])
+        # pack() keeps data it can't encode
+        self.assertEqual(dayhours.pack(['M07']), ['M07'])
+
+    def test_count_masks(self):
+        rng = random.Random(1)
+        masks = [rng.getrandbits(dayhours.SLOTS) for _ in range(37)]
+        expected = [sum(mask >> i & 1 for mask in masks) for i in range(dayhours.SLOTS)]
+        self.assertEqual(dayhours.count_masks(masks), expected)
+
+
+class BitsetStorageTest(AppTestCase):
+
+    def setUp(self):
+        super().setUp()
+        with self.owner.session_transaction() as sess:
+            sess['name'] = 'alice'
+            self.user_id = sess['user_id']
+
+    def user_file(self, user_id):
+        return get_storage().user_path(self.schedule_id, user_id)
+
+    def test_selections_stored_as_mask(self):
+        with app.app_context():
+            save_user_data(self.schedule_id, self.user_id, {'name': 'alice', 'selections': ['M08', 'T08']})
+            with open(self.user_file(self.user_id)) as f:
+                self.assertEqual(json.load(f)['selections'], '4001')
+            self.assertEqual(get_user_data(self.schedule_id, self.user_id)['selections'], ['M08', 'T08'])
+
+    def test_old_list_files_still_read(self):
+        os.remove(get_storage().aggregate_path(self.schedule_id))
+        with open(self.user_file('oldusr'), 'w') as f:
+            json.dump({'name': 'old', 'selections': ['W10', 'M08']}, f)
+        with app.app_context():
+            self.assertEqual(get_user_data(self.schedule_id, 'oldusr')['selections'], ['W10', 'M08'])
+        self.assertEqual(self.owner.get(f'/s/{self.schedule_id}/info').get_json()['dayhours'],
+                         {'W10': 1, 'M08': 1})
+
+    def test_bits_wire_format(self):
+        url = f'/u/{self.schedule_id}/{self.user_id}/selections'
+        self.assertEqual(self.owner.post(url, json={'bits': '3'}).status_code, 200)
+        self.assertEqual(self.owner.get(url).get_json(), ['M08', 'M09'])
+        self.assertEqual(self.owner.get(url + '?format=bits').get_json(), {'bits': '3'})
+        self.assertEqual(self.owner.post(url, json={'bits': 'zz'}).status_code, 400)
+
+        info = self.owner.get(f'/s/{self.schedule_id}/info?format=bits').get_json()
+        self.assertEqual(info['mask'], '3')
+        self.assertEqual(info['counts'], [1, 1])
+        self.assertEqual(info['full'], '3')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import unittest
+from unittest import mock
+
+from app import app
+from test.base import AppTestCase
+
+
+class ConditionalGetTest(AppTestCase):
+
+    def setUp(self):
+        super().setUp()
+        with self.owner.session_transaction() as sess:
+            sess['name'] = 'Ann'
+            self.user_id = sess['user_id']
+
+    def revalidate(self, url):
+        first = self.owner.get(url)
+        self.assertEqual(first.status_code, 200)
+        etag = first.headers['ETag']
+        return etag, self.owner.get(url, headers={'If-None-Match': etag})
+
+    def test_info(self):
+        url = f'/s/{self.schedule_id}/info'
+        etag, second = self.revalidate(url)
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(second.headers['ETag'], etag)
+
+        self.owner.post(f'/u/{self.schedule_id}/{self.user_id}/selections', json=['M08'])
+        third = self.owner.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(third.status_code, 200)
+        self.assertEqual(third.get_json()['dayhours'], {'M08': 1})
+
+    def test_unchanged_info_reads_nothing(self):
+        url = f'/s/{self.schedule_id}/info'
+        etag = self.owner.get(url).headers['ETag']
+        with mock.patch('app.get_schedule_data') as get_schedule, \
+                mock.patch('app.get_aggregate_data') as get_aggregate:
+            self.assertEqual(self.owner.get(url, headers={'If-None-Match': etag}).status_code, 304)
+        get_schedule.assert_not_called()
+        get_aggregate.assert_not_called()
+
+    def test_info_depends_on_viewer(self):
+        url = f'/s/{self.schedule_id}/info'
+        etag = self.owner.get(url).headers['ETag']
+        other = app.test_client()
+        self.assertEqual(other.get(url, headers={'If-None-Match': etag}).status_code, 200)
+
+    def test_blackouts(self):
+        url = f'/s/{self.schedule_id}/blackouts'
+        etag, second = self.revalidate(url)
+        self.assertEqual(second.status_code, 304)
+
+        self.owner.post(url, json=['T09'])
+        third = self.owner.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(third.status_code, 200)
+        self.assertEqual(third.get_json(), ['T09'])
+        self.assertEqual(self.owner.get('/s/nothere/blackouts').status_code, 404)
+
+    def test_selections(self):
+        url = f'/u/{self.schedule_id}/{self.user_id}/selections'
+        etag, second = self.revalidate(url)
+        self.assertEqual(second.status_code, 304)
+
+        self.owner.post(url, json=['W10'])
+        third = self.owner.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(third.status_code, 200)
+        self.assertEqual(third.get_json(), ['W10'])
+
+
+class SQLiteConditionalGetTest(ConditionalGetTest):
+    backend = 'sqlite'
+
+
+if __name__ == '__main__':
+    unittest.main()
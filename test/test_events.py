@@ -0,0 +1,104 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import storage
+from storage import FileStorage, SQLiteStorage
+from test.base import AppTestCase
+
+
+def parse_stream(body):
+    """Split a text/event-stream body into (id, event, data) tuples"""
+    events = []
+    for block in body.strip().split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in block.split('\n') if not line.startswith(':'))
+        if 'data' in fields:
+            events.append((int(fields['id']), fields['event'], json.loads(fields['data'])))
+    return events
+
+
+class ChangeLogTest(unittest.TestCase):
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.data_dir, ignore_errors=True)
+
+    def backends(self):
+        yield FileStorage(os.path.join(self.data_dir, 'files'))
+        yield SQLiteStorage(os.path.join(self.data_dir, 'db.sqlite3'))
+
+    def test_append_and_read(self):
+        for backend in self.backends():
+            with self.subTest(backend=type(backend).__name__):
+                backend.save_schedule('abc123', {'name': 'Events'})
+                self.assertEqual(backend.last_event_seq('abc123'), 0)
+                self.assertEqual(backend.read_events('abc123', 0)[0], [])
+
+                with backend.lock('abc123'):
+                    self.assertEqual(backend.append_event('abc123', {'type': 'a'}), 1)
+                    self.assertEqual(backend.append_event('abc123', {'type': 'b'}), 2)
+
+                events, cursor = backend.read_events('abc123', 0)
+                self.assertEqual([(seq, event['type']) for seq, event in events], [(1, 'a'), (2, 'b')])
+                self.assertEqual(backend.read_events('abc123', 2, cursor)[0], [])
+
+                with backend.lock('abc123'):
+                    backend.append_event('abc123', {'type': 'c'})
+                self.assertEqual([seq for seq, _ in backend.read_events('abc123', 2, cursor)[0]], [3])
+                self.assertEqual([seq for seq, _ in backend.read_events('abc123', 1)[0]], [2, 3])
+
+    def test_file_log_is_trimmed(self):
+        backend = FileStorage(self.data_dir)
+        backend.save_schedule('abc123', {'name': 'Trim'})
+        _, cursor = backend.read_events('abc123', 0)
+        with mock.patch.object(storage, 'EVENT_LOG_MAX_BYTES', 2000):
+            for n in range(100):
+                backend.append_event('abc123', {'type': 'x', 'padding': '-' * 20})
+        self.assertLess(os.path.getsize(backend.events_path('abc123')), 2000)
+        self.assertEqual(backend.last_event_seq('abc123'), 100)
+        # A stream positioned before the trim still gets the newest events
+        events, _ = backend.read_events('abc123', 98, cursor)
+        self.assertEqual([seq for seq, _ in events], [99, 100])
+
+
+class EventStreamTest(AppTestCase):
+
+    config = {'SSE_POLL_INTERVAL': 0.01, 'SSE_MAX_AGE': 0.05}
+
+    def setUp(self):
+        super().setUp()
+        with self.owner.session_transaction() as sess:
+            sess['name'] = 'Ann'
+            self.user_id = sess['user_id']
+
+    def test_stream_replays_after_last_event_id(self):
+        url = f'/u/{self.schedule_id}/{self.user_id}/selections'
+        self.owner.post(url, json=['M08', 'T09'])
+        self.owner.post(url, json=['T09', 'W10'])
+        self.owner.post(f'/s/{self.schedule_id}/blackouts', json=['U21'])
+
+        response = self.owner.get(f'/s/{self.schedule_id}/events', headers={'Last-Event-ID': '1'})
+        self.assertEqual(response.mimetype, 'text/event-stream')
+        events = parse_stream(response.get_data(as_text=True))
+
+        self.assertEqual([(seq, kind) for seq, kind, _ in events], [(2, 'selections'), (3, 'blackouts')])
+        self.assertEqual(events[0][2]['delta'], {'M08': -1, 'W10': 1})
+        self.assertEqual(events[0][2]['count'], 1)
+        self.assertEqual(events[1][2]['blackouts'], ['U21'])
+
+    def test_new_client_starts_at_the_end(self):
+        self.owner.post(f'/u/{self.schedule_id}/{self.user_id}/selections', json=['M08'])
+        response = self.owner.get(f'/s/{self.schedule_id}/events')
+        self.assertEqual(parse_stream(response.get_data(as_text=True)), [])
+
+    def test_missing_schedule(self):
+        self.assertEqual(self.owner.get('/s/nothere/events').status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,162 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import storage
+from app import get_storage, journal_view, rebuild_aggregate
+from test.base import AppTestCase
+
+
+class JournalTest(AppTestCase):
+
+    config = {'JOURNAL_SNAPSHOT_EVERY': 4}
+
+    def info(self, **args):
+        return self.owner.get(f'/s/{self.schedule_id}/info', query_string=args)
+
+    def entry_times(self):
+        return [entry['at'] for _, entry in get_storage().read_journal(self.schedule_id)]
+
+    def test_as_of(self):
+        self.respond('ann', ['M08', 'M09'])
+        self.respond('bob', ['M09'])
+        first = self.entry_times()
+        self.respond('ann', ['T10'])
+        self.owner.post(f'/s/{self.schedule_id}/blackouts', json=['T10'])
+
+        then = self.info(as_of=first[-1]).get_json()
+        self.assertEqual(then['dayhours'], {'M08': 1, 'M09': 2})
+        self.assertEqual(then['count'], 2)
+        self.assertEqual(then['blackouts'], [])
+        self.assertEqual(then['tiers']['M09'], '100')
+
+        now = self.info(as_of='2999-01-01T00:00:00').get_json()
+        self.assertEqual(now['dayhours'], self.info().get_json()['dayhours'])
+        self.assertEqual(now['blackouts'], ['T10'])
+
+        self.assertEqual(self.info(as_of='2000-01-01').status_code, 404)
+        self.assertEqual(self.info(as_of='yesterday').status_code, 400)
+
+    def test_snapshots_compact_the_journal(self):
+        for i in range(11):
+            self.respond(f'user{i % 3}', ['M08'] if i % 2 else ['W12', 'R13'])
+        snapshot = get_storage().get_snapshot(self.schedule_id)
+        self.assertEqual(snapshot['seq'], 8)
+        self.assertEqual(len(get_storage().read_journal(self.schedule_id, snapshot['seq'])), 3)
+
+        view = journal_view(self.schedule_id)
+        aggregate = get_storage().get_aggregate(self.schedule_id)
+        self.assertEqual(view['aggregate']['dayhours'], aggregate['dayhours'])
+        self.assertEqual(view['aggregate']['count'], 3)
+        self.assertEqual({user_id: response['selections'] for user_id, response in view['responses'].items()},
+                         {user_id: data['selections'] for user_id, data in get_storage().list_users(self.schedule_id)})
+
+    def test_old_snapshots_and_entries_dropped(self):
+        with mock.patch.object(storage, 'SNAPSHOTS_KEPT', 2):
+            for i in range(13):
+                self.respond('ann', ['M08'] if i % 2 else ['T09'])
+        seqs = [seq for seq, _ in get_storage().read_journal(self.schedule_id)]
+        # Snapshots at 8 and 12 are kept, so the journal starts after 8
+        self.assertEqual(seqs, [9, 10, 11, 12, 13])
+        self.assertEqual(journal_view(self.schedule_id)['responses']['ann']['selections'], ['T09'])
+
+    def test_rebuild_from_journal(self):
+        self.respond('ann', ['M08'])
+        self.respond('bob', ['M08', 'U21'])
+        expected = get_storage().get_aggregate(self.schedule_id)
+        self.assertEqual(rebuild_aggregate(self.schedule_id)['dayhours'], expected['dayhours'])
+        self.assertEqual(self.info().get_json()['count'], 2)
+
+    def test_existing_responses_become_the_first_snapshot(self):
+        # As if saved before the journal existed
+        get_storage().save_user(self.schedule_id, 'old', {'name': 'Old', 'selections': ['F15']})
+        self.respond('ann', ['F15'])
+        snapshot = get_storage().get_snapshot(self.schedule_id, self.entry_times()[0])
+        self.assertEqual(snapshot['seq'], 0)
+        # Taken before the first change is written, so history starts just before it
+        self.assertEqual(sorted(snapshot['responses']), ['old'])
+        self.assertEqual(self.info(as_of=snapshot['at']).get_json()['count'], 1)
+        self.assertEqual(journal_view(self.schedule_id)['aggregate']['dayhours'], {'F15': 2})
+
+    def test_history_starts_when_created(self):
+        created_at = get_storage().get_schedule(self.schedule_id)['created_at']
+        self.respond('ann', ['M08'])
+        self.owner.post(f'/s/{self.schedule_id}/blackouts', json=['T10'])
+        then = self.info(as_of=created_at)
+        self.assertEqual(then.status_code, 200)
+        self.assertEqual(then.get_json()['count'], 0)
+        self.assertEqual(then.get_json()['blackouts'], [])
+
+    def test_cut_off_entry_is_ignored(self):
+        if self.backend != 'file':
+            self.skipTest('Only the file backend can be cut off mid line')
+        self.respond('ann', ['M08'])
+        with open(get_storage().journal_path(self.schedule_id), 'ab') as f:
+            f.write(b'{"type":"response","user_id":"bob"')
+        self.assertEqual(len(get_storage().read_journal(self.schedule_id)), 1)
+
+        # Writes after it carry on, through the next snapshot
+        for user_id in ('bob', 'cat', 'dan', 'eve'):
+            self.respond(user_id, ['M08'])
+        self.assertEqual([seq for seq, _ in get_storage().read_journal(self.schedule_id)], [1, 2, 3, 4, 5])
+        self.assertEqual(get_storage().get_snapshot(self.schedule_id)['seq'], 4)
+        self.assertEqual(self.owner.get(f'/s/{self.schedule_id}/best').get_json()['count'], 5)
+        self.respond('fay', ['M08'])
+        self.assertEqual(journal_view(self.schedule_id)['aggregate']['count'], 6)
+
+    def test_failed_save_not_journaled(self):
+        self.respond('ann', ['M08'])
+        with mock.patch.object(get_storage(), 'save_user', return_value=False):
+            response = self.client_for('ann').post(f'/u/{self.schedule_id}/ann/selections', json=['T10'])
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(journal_view(self.schedule_id)['responses']['ann']['selections'], ['M08'])
+
+    def test_failed_append_starts_over(self):
+        self.respond('ann', ['M08'])
+        with mock.patch.object(get_storage(), 'append_journal', side_effect=OSError('disk full')):
+            with self.assertLogs('scheduler', 'ERROR'):
+                self.respond('bob', ['M08', 'T10'])
+        snapshot = get_storage().get_snapshot(self.schedule_id)
+        self.assertEqual(snapshot['seq'], 2)
+        self.assertEqual(sorted(snapshot['responses']), ['ann', 'bob'])
+        self.respond('cat', ['T10'])
+        self.assertEqual(journal_view(self.schedule_id)['aggregate']['dayhours'], {'M08': 2, 'T10': 2})
+        self.assertEqual([seq for seq, _ in get_storage().read_journal(self.schedule_id, 2)], [3])
+
+    def test_archive_keeps_history(self):
+        self.respond('ann', ['M08'])
+        at = self.entry_times()[-1]
+        self.respond('ann', ['M09'])
+        with get_storage().lock(self.schedule_id):
+            get_storage().archive_schedule(self.schedule_id)
+        self.assertEqual(self.info(as_of=at).get_json()['dayhours'], {'M08': 1})
+
+
+class SQLiteJournalTest(JournalTest):
+    backend = 'sqlite'
+
+
+class MigrateJournalTest(unittest.TestCase):
+
+    def test_migrate_copies_history(self):
+        data_dir = tempfile.mkdtemp()
+        try:
+            source = storage.FileStorage(os.path.join(data_dir, 'files'))
+            source.save_schedule('abc123', {'id': 'abc123'})
+            with source.lock('abc123'):
+                source.save_snapshot('abc123', {'seq': 0, 'at': '2025-01-01T00:00:00', 'responses': {},
+                                                'blackouts': [], 'aggregate': {'version': 1, 'count': 0}})
+                source.append_journal('abc123', {'type': 'response', 'user_id': 'u1', 'name': 'Ann',
+                                                 'selections': ['M08'], 'at': '2025-01-02T00:00:00'})
+            destination = storage.SQLiteStorage(os.path.join(data_dir, 'db.sqlite3'))
+            storage.migrate(source, destination)
+            self.assertEqual(destination.get_snapshot('abc123')['at'], '2025-01-01T00:00:00')
+            self.assertEqual(destination.read_journal('abc123'), source.read_journal('abc123'))
+        finally:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
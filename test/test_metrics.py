@@ -0,0 +1,98 @@
+import atexit
+import json
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+
+from app import app
+from metrics import Metrics, RequestProfiler
+from test.base import AppTestCase
+
+
+class MetricsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.metrics_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.metrics_dir, ignore_errors=True)
+
+    def test_histogram_render(self):
+        metrics = Metrics(buckets=(0.1, 1.0))
+        metrics.describe('t_seconds', 'A test.')
+        for seconds in (0.05, 0.5, 5):
+            metrics.observe('t_seconds', seconds, route='/x')
+        text = metrics.render()
+        self.assertIn('# HELP t_seconds A test.', text)
+        self.assertIn('# TYPE t_seconds histogram', text)
+        self.assertIn('t_seconds_bucket{route="/x",le="0.1"} 1', text)
+        self.assertIn('t_seconds_bucket{route="/x",le="1.0"} 2', text)
+        self.assertIn('t_seconds_bucket{route="/x",le="+Inf"} 3', text)
+        self.assertIn('t_seconds_count{route="/x"} 3', text)
+
+    def test_workers_are_added_up(self):
+        ours = Metrics(self.metrics_dir, buckets=(1.0,))
+        atexit.unregister(ours.flush)
+        other = Metrics(buckets=(1.0,))
+        ours.observe('t_seconds', 0.5, route='/x')
+        other.observe('t_seconds', 0.5, route='/x')
+        other.observe('t_seconds', 2, route='/y')
+        # Another worker's file, as written by its flush()
+        with open(os.path.join(self.metrics_dir, '99999.json'), 'w') as f:
+            json.dump(other.snapshot(), f)
+
+        totals = ours.collect()
+        self.assertEqual(totals[('t_seconds', (('route', '/x'),))], [2, 0, 1.0, 2])
+        self.assertEqual(totals[('t_seconds', (('route', '/y'),))], [0, 1, 2, 1])
+
+        # Our own file is never counted on top of what's in memory
+        ours.flush()
+        self.assertEqual(ours.collect()[('t_seconds', (('route', '/x'),))][-1], 2)
+
+    def test_profiler_keeps_slowest(self):
+        profiler = RequestProfiler(self.metrics_dir, sample_rate=1.0, keep=1)
+        for seconds in (0.2, 0.1, 0.3):
+            profile = profiler.start()
+            self.assertIsNotNone(profile)
+            profiler.finish(profile, seconds, 'GET /s/<schedule_id>')
+        self.assertEqual([f[:9] for f in os.listdir(self.metrics_dir)], ['0000300.0'])
+        self.assertIsNone(RequestProfiler(self.metrics_dir).start())
+
+    def test_profiles_kept_out_of_data_dir(self):
+        # The file backend would list a directory in DATA_DIR as a schedule
+        profile_dir = os.path.abspath(app.config['PROFILE_DIR'])
+        data_dir = os.path.abspath(app.config['DATA_DIR'])
+        self.assertNotEqual(os.path.commonpath([profile_dir, data_dir]), data_dir)
+
+
+class MetricsRouteTest(AppTestCase):
+
+    def test_metrics(self):
+        self.owner.get(f'/s/{self.schedule_id}/info')
+        self.owner.get(f'/s/{self.schedule_id}?pw={self.password}')
+        self.owner.get(f'/s/{self.schedule_id}/best')
+        text = self.owner.get('/metrics').get_data(as_text=True)
+        self.assertRegex(text, r'scheduler_request_seconds_count\{method="GET",'
+                               r'route="/s/<schedule_id>/info",status="200"\} [1-9]')
+        self.assertRegex(text, r'scheduler_storage_seconds_count\{kind="read",op="get_aggregate"\} [1-9]')
+        self.assertRegex(text, r'scheduler_storage_seconds_count\{kind="write",op="save_schedule"\} [1-9]')
+        self.assertRegex(text, r'scheduler_section_seconds_count\{section="respondent_scan"\} [1-9]')
+        self.assertRegex(text, r'scheduler_template_seconds_count\{template="schedule.html"\} [1-9]')
+
+    def test_metrics_allow(self):
+        app.config['METRICS_ALLOW'] = '10.0.0.0/8'
+        self.assertEqual(self.owner.get('/metrics').status_code, 403)
+        app.config['METRICS_ALLOW'] = '10.0.0.0/8, 127.0.0.0/8'
+        self.assertEqual(self.owner.get('/metrics').status_code, 200)
+
+    def test_password_not_logged(self):
+        with self.assertLogs(level=logging.DEBUG) as logs:
+            logging.getLogger().debug('start')
+            self.owner.get(f'/s/{self.schedule_id}?pw={self.password}')
+        self.assertFalse([line for line in logs.output if self.password in line])
+
+
+if __name__ == '__main__':
+    unittest.main()
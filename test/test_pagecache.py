@@ -0,0 +1,90 @@
+import unittest
+
+from app import get_storage, page_cache
+from pagecache import PageCache
+from test.base import AppTestCase
+
+
+class PageCacheTest(unittest.TestCase):
+
+    def test_versions_and_placeholders(self):
+        cache = PageCache(1000)
+        html = f"<p>{cache.placeholder('name')}</p>"
+        cache.set('abc', 'page', ('v1',), html)
+        self.assertIsNone(cache.get('abc', 'page', ('v2',)))
+        self.assertEqual(cache.fill(cache.get('abc', 'page', ('v1',)), {'name': '<Ann & Bob>'}),
+                         '<p>&lt;Ann &amp; Bob&gt;</p>')
+
+    def test_bounded_by_size(self):
+        cache = PageCache(25)
+        for key in ('a', 'b', 'c'):
+            cache.set('abc', key, 1, key * 10)
+        self.assertIsNone(cache.get('abc', 'a', 1))
+        self.assertEqual(cache.get('abc', 'c', 1), 'c' * 10)
+        self.assertEqual(cache.stats()['bytes'], 20)
+        cache.set('abc', 'd', 1, 'd' * 30)
+        self.assertIsNone(cache.get('abc', 'd', 1))
+
+    def test_invalidate_schedule(self):
+        cache = PageCache(1000)
+        cache.set('abc', 'a', 1, 'x')
+        cache.set('abc', 'b', 1, 'y')
+        cache.set('def', 'a', 1, 'z')
+        cache.invalidate('abc')
+        self.assertIsNone(cache.get('abc', 'a', 1))
+        self.assertEqual(cache.get('def', 'a', 1), 'z')
+        self.assertEqual(cache.stats()['bytes'], 1)
+
+
+class CachedPagesTest(AppTestCase):
+
+    def schedule_page(self, client):
+        response = client.get(f'/s/{self.schedule_id}', query_string={'pw': self.password})
+        self.assertEqual(response.status_code, 200)
+        return response.get_data(as_text=True)
+
+    def test_schedule_page_per_viewer(self):
+        self.schedule_page(self.owner)
+        hits = page_cache.stats()['hits']
+        page = self.schedule_page(self.client_for('viewer2', 'Bea'))
+        self.assertEqual(page_cache.stats()['hits'], hits + 1)
+        self.assertIn('window.userId = "viewer2"', page)
+        self.assertIn(f'/u/{self.schedule_id}/viewer2', page)
+        self.assertNotIn('pagecache-', page)
+
+    def test_writes_show_up(self):
+        self.schedule_page(self.owner)
+        self.client_for('ann', 'Ann').post(f'/u/{self.schedule_id}/ann/selections', json=['M08'])
+        self.assertIn('>Ann</a>', self.schedule_page(self.owner))
+
+        # Written by another worker, which can't clear this one's cache
+        schedule_data = get_storage().get_schedule(self.schedule_id)
+        schedule_data['name'] = 'Renamed elsewhere'
+        get_storage().save_schedule(self.schedule_id, schedule_data)
+        self.assertIn('value="Renamed elsewhere"', self.schedule_page(self.owner))
+
+    def test_user_page_name(self):
+        url = f'/u/{self.schedule_id}/ann'
+        client = self.client_for('ann', '<Ann>')
+        client.get(url)
+        page = client.get(url).get_data(as_text=True)
+        self.assertIn('value="&lt;Ann&gt;"', page)
+        # Another viewer gets the read-only page, without the owner's name
+        other = self.client_for('bob', 'Bob').get(url).get_data(as_text=True)
+        self.assertIn('isOwner =  "False"', other)
+        self.assertNotIn('&lt;Ann&gt;', other)
+
+    def test_flashed_messages_not_cached(self):
+        self.schedule_page(self.owner)
+        with self.owner.session_transaction() as sess:
+            sess['_flashes'] = [('warning', 'Just once')]
+        self.assertIn('Just once', self.schedule_page(self.owner))
+        self.assertNotIn('Just once', self.schedule_page(self.owner))
+
+
+class SQLiteCachedPagesTest(CachedPagesTest):
+    backend = 'sqlite'
+
+
+if __name__ == '__main__':
+    unittest.main()
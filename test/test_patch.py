@@ -0,0 +1,92 @@
+import threading
+import time
+import unittest
+
+from app import app
+from coalesce import WriteCoalescer
+from test.base import AppTestCase
+
+
+class PatchSelectionsTest(AppTestCase):
+
+    def setUp(self):
+        super().setUp()
+        with self.owner.session_transaction() as sess:
+            sess['name'] = 'alice'
+            self.user_id = sess['user_id']
+        self.url = f'/u/{self.schedule_id}/{self.user_id}/selections'
+
+    def info(self):
+        return self.owner.get(f'/s/{self.schedule_id}/info').get_json()
+
+    def test_add_and_remove(self):
+        response = self.owner.patch(self.url, json={'add': ['M08', 'T09']})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['selections_version'], 1)
+
+        response = self.owner.patch(self.url, json={'add': ['W10'], 'remove': ['M08'],
+                                                     'selections_version': 1})
+        self.assertEqual(response.get_json()['selections_version'], 2)
+        self.assertEqual(response.get_json()['version'], self.info()['version'])
+
+        get = self.owner.get(self.url)
+        self.assertEqual(sorted(get.get_json()), ['T09', 'W10'])
+        self.assertEqual(get.headers['X-Selections-Version'], '2')
+        info = self.info()
+        self.assertEqual((info['count'], info['dayhours']), (1, {'T09': 1, 'W10': 1}))
+
+    def test_version_conflict(self):
+        self.owner.post(self.url, json=['M08'])
+        response = self.owner.patch(self.url, json={'add': ['T09'], 'selections_version': 0})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.get_json()['selections'], ['M08'])
+        self.assertEqual(response.get_json()['selections_version'], 1)
+        self.assertEqual(self.info()['dayhours'], {'M08': 1})
+
+    def test_errors(self):
+        self.assertEqual(self.owner.patch(self.url, json=['M08']).status_code, 400)
+        self.assertEqual(self.owner.patch(self.url, json={'add': 'M08'}).status_code, 400)
+        other = app.test_client()
+        self.assertEqual(other.patch(self.url, json={'add': ['M08']}).status_code, 403)
+
+
+class WriteCoalescerTest(unittest.TestCase):
+
+    def test_concurrent_items_share_a_flush(self):
+        coalescer = WriteCoalescer()
+        flushed = []
+
+        def flush(items):
+            flushed.append(list(items))
+            return [item * 10 for item in items]
+
+        results = {}
+
+        def submit(n):
+            results[n] = coalescer.submit('key', n, flush, window=0.1)
+
+        threads = [threading.Thread(target=submit, args=(n,)) for n in range(5)]
+        for thread in threads:
+            thread.start()
+            time.sleep(0.005)
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, {n: n * 10 for n in range(5)})
+        self.assertEqual(flushed, [[0, 1, 2, 3, 4]])
+        self.assertEqual(coalescer.stats(), {'batches': 1, 'items': 5})
+
+    def test_errors_reach_every_waiter(self):
+        coalescer = WriteCoalescer()
+
+        def flush(items):
+            raise IOError('disk full')
+
+        with self.assertRaises(IOError):
+            coalescer.submit('key', 1, flush)
+        # The queue is cleared, so the next submit leads a new batch
+        self.assertEqual(coalescer.submit('key', 2, lambda items: ['ok']), 'ok')
+
+
+if __name__ == '__main__':
+    unittest.main()
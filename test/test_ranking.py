@@ -0,0 +1,62 @@
+import unittest
+
+import dayhours
+import ranking
+from app import app
+from test.base import AppTestCase
+
+
+class RankSlotsTest(unittest.TestCase):
+
+    def test_most_available_first(self):
+        masks = [dayhours.to_mask(s) for s in (['M08', 'T10'], ['T10'], ['T10', 'M08'])]
+        slots = ranking.rank_slots(masks)
+        self.assertEqual([(s['start'], s['count']) for s in slots], [('T10', 3), ('M08', 2)])
+
+    def test_contiguous_blocks(self):
+        masks = [dayhours.to_mask(['M08', 'M09', 'M10']), dayhours.to_mask(['M09', 'M10', 'M11'])]
+        slots = ranking.rank_slots(masks, hours=2)
+        self.assertEqual(slots[0]['dayhours'], ['M09', 'M10'])
+        self.assertEqual(slots[0]['count'], 2)
+        self.assertEqual([s['start'] for s in slots[1:]], ['M08', 'M10'])
+
+    def test_blackouts_quorum_and_required(self):
+        masks = [dayhours.to_mask(s) for s in (['M08', 'T08', 'W08'], ['M08', 'T08'], ['W08'])]
+        blackout = dayhours.to_mask(['M08'])
+        self.assertEqual([s['start'] for s in ranking.rank_slots(masks, blackout)], ['T08', 'W08'])
+        self.assertEqual([s['start'] for s in ranking.rank_slots(masks, blackout, quorum=3)], [])
+        self.assertEqual([s['start'] for s in ranking.rank_slots(masks, blackout, required=[1])], ['T08'])
+        self.assertEqual([s['start'] for s in ranking.rank_slots(masks, blackout, required=[2])], ['W08'])
+
+    def test_hours_out_of_range(self):
+        with self.assertRaises(ValueError):
+            ranking.rank_slots([1], hours=15)
+
+
+class BestRouteTest(AppTestCase):
+
+    def setUp(self):
+        super().setUp()
+        for name, selections in (('alice', ['M08', 'M09']), ('bob', ['M09'])):
+            self.respond(name + 'id', selections, name=name)
+
+    def test_best(self):
+        client = app.test_client()
+        data = client.get(f'/s/{self.schedule_id}/best').get_json()
+        self.assertEqual(data['count'], 2)
+        self.assertEqual(data['slots'][0], {'start': 'M09', 'dayhours': ['M09'], 'count': 2, 'ratio': 1.0})
+
+        data = client.get(f'/s/{self.schedule_id}/best?hours=2&required=bobid').get_json()
+        self.assertEqual(data['slots'], [])
+
+        # limit is kept to 1..MAX_BEST_SLOTS
+        self.assertEqual(len(client.get(f'/s/{self.schedule_id}/best?limit=-1').get_json()['slots']), 1)
+        self.assertEqual(len(client.get(f'/s/{self.schedule_id}/best?limit=0').get_json()['slots']), 1)
+
+        self.assertEqual(client.get(f'/s/{self.schedule_id}/best?required=nobody').status_code, 400)
+        self.assertEqual(client.get(f'/s/{self.schedule_id}/best?hours=x').status_code, 400)
+        self.assertEqual(client.get('/s/missing/best').status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
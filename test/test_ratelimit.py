@@ -0,0 +1,109 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from app import app
+from ratelimit import RateLimiter, parse_budget
+from test.base import AppTestCase
+
+
+class BudgetTest(unittest.TestCase):
+
+    def test_parse(self):
+        self.assertEqual(parse_budget('30/minute'), (30, 60))
+        self.assertEqual(parse_budget(' 5 / Hour'), (5, 3600))
+        for off in (None, '', '0', 'off'):
+            self.assertIsNone(parse_budget(off))
+        for bad in ('30', '30/fortnight', 'lots/minute', '-1/second'):
+            with self.assertRaises(ValueError):
+                parse_budget(bad)
+
+
+class RateLimiterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.data_dir, 'ratelimit.sqlite3')
+
+    def tearDown(self):
+        shutil.rmtree(self.data_dir, ignore_errors=True)
+
+    def test_bucket_refills(self):
+        limiter = RateLimiter(self.path)
+        bucket = [('a', (2, 10))]
+        self.assertEqual(limiter.take(bucket, now=100), 0)
+        self.assertEqual(limiter.take(bucket, now=100), 0)
+        self.assertAlmostEqual(limiter.take(bucket, now=100), 5)
+        self.assertAlmostEqual(limiter.take(bucket, now=104), 1)
+        self.assertEqual(limiter.take(bucket, now=105), 0)
+
+    def test_refused_request_takes_nothing(self):
+        limiter = RateLimiter(self.path)
+        limiter.take([('empty', (1, 60))], now=0)
+        self.assertGreater(limiter.take([('full', (1, 60)), ('empty', (1, 60))], now=0), 0)
+        self.assertEqual(limiter.take([('full', (1, 60))], now=0), 0)
+
+    def test_shared_between_workers(self):
+        bucket = [('a', (1, 60))]
+        self.assertEqual(RateLimiter(self.path).take(bucket, now=0), 0)
+        self.assertGreater(RateLimiter(self.path).take(bucket, now=1), 0)
+
+
+class RateLimitedRoutesTest(AppTestCase):
+
+    config = {'RATE_LIMIT_NEW': (2, 3600), 'RATE_LIMIT_USER': (3, 60), 'RATE_LIMIT_IP': (100, 60),
+              'RATE_LIMIT_SCHEDULE': (100, 60)}
+
+    def setUp(self):
+        super().setUp()
+        with self.owner.session_transaction() as sess:
+            self.user_id = sess['user_id']
+            sess['name'] = 'Ann'
+
+    def test_writes_limited_per_user(self):
+        url = f'/u/{self.schedule_id}/{self.user_id}/selections'
+        for _ in range(3):
+            self.assertEqual(self.owner.post(url, json=['M08']).status_code, 200)
+        response = self.owner.post(url, json=['M09'])
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.headers['Retry-After'], '20')
+        self.assertEqual(response.get_json()['retry_after'], 20)
+        # Reads aren't limited
+        self.assertEqual(self.owner.get(url).get_json(), ['M08'])
+
+        # Nor is another user on the same address
+        other = self.client_for('bob')
+        self.assertEqual(other.post(f'/u/{self.schedule_id}/bob/selections', json=['M08']).status_code, 200)
+
+    def test_schedule_budget_only_charged_to_allowed_writes(self):
+        app.config.update(RATE_LIMIT_SCHEDULE=(2, 60))
+        url = f'/s/{self.schedule_id}/blackouts'
+        for user_id in ('eve', 'mal', 'oscar'):
+            stranger = self.client_for(user_id)
+            self.assertEqual(stranger.post(url, json=['M08']).status_code, 403)
+            self.assertEqual(stranger.post(f'/s/{self.schedule_id}/update',
+                                           json={'name': 'x'}).status_code, 403)
+            self.assertEqual(stranger.post(f'/u/{self.schedule_id}/{self.user_id}/selections',
+                                           json=['M08']).status_code, 403)
+
+        self.assertEqual(self.owner.post(url, json=['M08']).status_code, 200)
+        self.assertEqual(self.owner.post(url, json=['M09']).status_code, 200)
+        self.assertEqual(self.owner.post(url, json=['M10']).status_code, 429)
+
+    def test_new_limited_per_address(self):
+        self.assertEqual(self.owner.get('/new').status_code, 302)
+        self.assertEqual(self.owner.get('/new').status_code, 429)
+        # A client that drops its cookie still has the same address
+        self.assertEqual(app.test_client().get('/new').status_code, 429)
+        other = app.test_client()
+        self.assertEqual(other.get('/new', environ_base={'REMOTE_ADDR': '10.0.0.2'}).status_code, 302)
+
+    def test_limits_off(self):
+        app.config.update(RATE_LIMIT_NEW=None)
+        for _ in range(3):
+            self.assertEqual(self.owner.get('/new').status_code, 302)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import unittest
+from unittest import mock
+
+from app import app, get_storage
+from storage import Storage
+from test.base import AppTestCase
+
+NAMES = ['carol', 'Alice', 'bob', 'Dave', 'eve_1', 'eve%2', 'Frank']
+
+
+class RespondentsTest(AppTestCase):
+
+    def setUp(self):
+        super().setUp()
+        for i, name in enumerate(NAMES):
+            self.respond(f'user{i:02d}', ['M08'], name=name)
+
+    def respondents(self, **args):
+        response = self.owner.get(f'/s/{self.schedule_id}/respondents', query_string=args)
+        self.assertEqual(response.status_code, 200)
+        return response.get_json()
+
+    def test_pages(self):
+        first = self.respondents(limit=3)
+        self.assertEqual(first['total'], len(NAMES))
+        self.assertEqual([r['name'] for r in first['respondents']], ['Alice', 'bob', 'carol'])
+        self.assertEqual(first['respondents'][0]['url'], f'/u/{self.schedule_id}/user01')
+        self.assertNotIn('selections', first['respondents'][0])
+
+        names = [r['name'] for r in first['respondents']]
+        offset = first['next_offset']
+        while offset is not None:
+            page = self.respondents(limit=3, offset=offset)
+            names += [r['name'] for r in page['respondents']]
+            offset = page['next_offset']
+        self.assertEqual(names, sorted(NAMES, key=str.lower))
+
+    def test_fallback_matches_index(self):
+        # Storage.list_respondents() is what the file backend falls back to
+        for args in ({}, {'sort': 'updated'}, {'search': 'eve', 'limit': 1}, {'offset': 5}):
+            self.assertEqual(Storage.list_respondents(get_storage(), self.schedule_id, **args),
+                             get_storage().list_respondents(self.schedule_id, **args))
+
+    def test_search_and_sort(self):
+        found = self.respondents(q='EVE')
+        self.assertEqual([r['name'] for r in found['respondents']], ['eve%2', 'eve_1'])
+        self.assertEqual(found['total'], 2)
+        # LIKE wildcards in the search are literal
+        self.assertEqual([r['name'] for r in self.respondents(q='e_')['respondents']], ['eve_1'])
+        self.assertEqual(self.respondents(q='%')['total'], 1)
+
+        self.respond('user00', ['M08'], name='Carol')
+        latest = self.respondents(sort='updated', limit=1)['respondents']
+        self.assertEqual(latest[0]['name'], 'Carol')
+
+    def test_owner_only(self):
+        other = app.test_client()
+        url = f'/s/{self.schedule_id}/respondents'
+        self.assertEqual(other.get(url).status_code, 403)
+        self.assertEqual(other.get(url, query_string={'pw': self.password}).status_code, 200)
+        self.assertEqual(self.owner.get(url, query_string={'sort': 'size'}).status_code, 400)
+        self.assertEqual(other.get('/s/nosuch/respondents').status_code, 404)
+
+    def test_schedule_page_renders_first_page(self):
+        with mock.patch('app.RESPONDENTS_PAGE_SIZE', 2):
+            html = self.owner.get(f'/s/{self.schedule_id}?pw={self.password}').get_data(as_text=True)
+        self.assertIn('Alice', html)
+        self.assertIn('bob', html)
+        self.assertNotIn('Frank', html)
+        self.assertIn(f'<span id="respondent-count">{len(NAMES)}</span>', html)
+
+    def test_index_rebuilt_when_stale(self):
+        if self.backend != 'file':
+            self.skipTest('Only the file backend has a separate index')
+        # As after an upgrade, with responses saved before the index existed
+        index = get_storage().index
+        with index.db:
+            index.db.execute('DELETE FROM respondents')
+        self.assertEqual(self.respondents()['total'], len(NAMES))
+
+
+class SQLiteRespondentsTest(RespondentsTest):
+    backend = 'sqlite'
+
+
+if __name__ == '__main__':
+    unittest.main()
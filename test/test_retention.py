@@ -0,0 +1,106 @@
+import os
+import time
+import unittest
+
+import retention
+from app import app, export_records, get_storage
+from storage import SQLiteStorage, migrate
+from test.base import AppTestCase
+
+OLD = '2020-01-01T00:00:00'
+
+
+class RetentionTest(AppTestCase):
+
+    create_schedule = False
+
+    def setUp(self):
+        super().setUp()
+        self.checkpoint = os.path.join(self.data_dir, 'checkpoint.json')
+
+        # A schedule nobody has touched for years, one made by a stray click on
+        # New, and one in use
+        self.make_schedule('stale1', {'name': 'Old standup'}, {'u1': ['M08', 'T09']}, age=OLD)
+        self.make_schedule('empty1', {}, {}, age=OLD)
+        self.make_schedule('fresh1', {'name': 'This week'}, {'u2': ['W10']})
+        if self.backend == 'file':
+            self.storage.reindex()
+
+    def make_schedule(self, schedule_id, fields, responses, age=None):
+        # Saving the aggregate marks the schedule active, so the metadata goes last
+        now = time.strftime('%Y-%m-%dT%H:%M:%S')
+        for user_id, selections in responses.items():
+            self.storage.save_user(schedule_id, user_id, {'name': user_id, 'selections': selections,
+                                                          'updated_at': age or now})
+        self.storage.save_aggregate(schedule_id, {'version': 1, 'count': len(responses),
+                                                  'dayhours': {}})
+        self.storage.save_schedule(schedule_id, dict(fields, id=schedule_id, created_at=age or now,
+                                                     updated_at=age or now))
+        if age and self.backend == 'file':
+            old = time.mktime(time.strptime(age, '%Y-%m-%dT%H:%M:%S'))
+            schedule_dir = self.storage.schedule_directory(schedule_id)
+            for name in os.listdir(schedule_dir):
+                os.utime(os.path.join(schedule_dir, name), (old, old))
+
+    def run_retention(self, **kwargs):
+        return retention.run_retention(self.storage, archive_before='2024-01-01',
+                                       purge_before='2024-01-01', checkpoint_path=self.checkpoint,
+                                       **kwargs)
+
+    def test_archive_purge_and_restore(self):
+        stats = self.run_retention(dry_run=True)
+        self.assertEqual((stats['archived'], stats['purged']), (1, 1))
+        self.assertFalse(self.storage.is_archived('stale1'))
+
+        stats = self.run_retention()
+        self.assertEqual((stats['scanned'], stats['archived'], stats['purged']), (3, 1, 1))
+        self.assertTrue(stats['finished'])
+        self.assertTrue(self.storage.is_archived('stale1'))
+        self.assertFalse(self.storage.schedule_exists('empty1'))
+        self.assertTrue(self.storage.schedule_exists('fresh1'))
+        self.assertEqual(self.storage.list_users('stale1'), [])
+
+        # Opening the schedule brings it back
+        info = app.test_client().get('/s/stale1/info').get_json()
+        self.assertEqual(info['count'], 1)
+        self.assertFalse(self.storage.is_archived('stale1'))
+        self.assertEqual(self.storage.get_user('stale1', 'u1')['selections'], ['M08', 'T09'])
+
+        # ... and it counts as activity, so the next pass leaves it alone
+        self.assertEqual(self.run_retention()['archived'], 0)
+
+    def test_export_and_migrate_archived(self):
+        self.run_retention()
+        self.assertTrue(self.storage.is_archived('stale1'))
+
+        with app.app_context():
+            records = list(export_records())
+        exported = [(record['type'], record.get('id') or record['user_id']) for record in records]
+        self.assertIn(('schedule', 'stale1'), exported)
+        self.assertIn(('response', 'u1'), exported)
+        self.assertTrue(self.storage.is_archived('stale1'))
+
+        destination = SQLiteStorage(os.path.join(self.data_dir, 'copy.sqlite3'))
+        self.assertEqual(migrate(self.storage, destination), (2, 2))
+        self.assertTrue(self.storage.is_archived('stale1'))
+        self.assertTrue(destination.is_archived('stale1'))
+        with destination.lock('stale1'):
+            destination.restore_schedule('stale1')
+        self.assertEqual(destination.get_user('stale1', 'u1')['selections'], ['M08', 'T09'])
+
+    def test_checkpoint(self):
+        scanned = []
+        for _ in range(3):
+            stats = self.run_retention(batch_size=1, max_seconds=0)
+            scanned.append(stats['scanned'])
+        self.assertEqual(scanned, [1, 1, 1])
+        self.assertTrue(self.run_retention(batch_size=1, max_seconds=0)['finished'])
+        self.assertEqual(retention.read_checkpoint(self.checkpoint)['after_id'], None)
+
+
+class SQLiteRetentionTest(RetentionTest):
+    backend = 'sqlite'
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,221 @@
+import random
+import shutil
+import unittest
+
+import slots
+from app import app, init_storage
+from test.base import AppTestCase
+
+TOKEN = 'test-token'
+
+
+def as_set(intervals):
+    return set(slots.iter_indexes(intervals))
+
+
+class CalendarTest(unittest.TestCase):
+
+    def setUp(self):
+        self.calendar = slots.Calendar('2025-01-06', '2025-03-16', '09:00', '17:00', 30)
+
+    def test_keys(self):
+        self.assertEqual(self.calendar.days, 70)
+        self.assertEqual(self.calendar.slots_per_day, 16)
+        self.assertEqual(self.calendar.key(0), '2025-01-06T09:00')
+        self.assertEqual(self.calendar.key(17), '2025-01-07T09:30')
+        for i in (0, 15, 16, 500, self.calendar.size - 1):
+            self.assertEqual(self.calendar.index(self.calendar.key(i)), i)
+        for key in ('2025-01-06T08:30', '2025-01-06T17:00', '2025-01-06T09:15',
+                    '2025-03-17T09:00', 'M09', None):
+            with self.assertRaises(ValueError):
+                self.calendar.index(key)
+
+    def test_intervals_round_trip(self):
+        keys = ['2025-01-06T09:00', '2025-01-06T09:30', '2025-01-06T10:30', '2025-01-07T09:00']
+        intervals = self.calendar.intervals(keys)
+        self.assertEqual(intervals, [[0, 2], [3, 4], [16, 17]])
+        self.assertEqual(self.calendar.keys(intervals), keys)
+        self.assertEqual(slots.Calendar.from_dict(self.calendar.to_dict()).to_dict(), self.calendar.to_dict())
+
+    def test_bad_calendars(self):
+        for args in (('2025-01-06', '2025-01-05'), ('2025-01-06', '2026-12-31'),
+                     ('2025-01-06', '2025-01-07', '09:00', '17:00', 45),
+                     ('2025-01-06', '2025-01-07', '17:00', '09:00'),
+                     ('2025-01-06', '2025-01-07', '09:00', '10:30', 60),
+                     ('Monday', '2025-01-07')):
+            with self.assertRaises(ValueError):
+                slots.Calendar(*args)
+
+
+class IntervalsTest(unittest.TestCase):
+
+    def random_intervals(self, rng, size=60):
+        return slots.from_indexes(i for i in range(size) if rng.random() < 0.4)
+
+    def test_set_operations(self):
+        rng = random.Random(1)
+        for _ in range(200):
+            a, b = self.random_intervals(rng), self.random_intervals(rng)
+            self.assertEqual(as_set(slots.union(a, b)), as_set(a) | as_set(b))
+            self.assertEqual(as_set(slots.difference(a, b)), as_set(a) - as_set(b))
+            self.assertEqual(as_set(slots.intersection(a, b)), as_set(a) & as_set(b))
+            self.assertEqual(slots.union(a, b), slots.from_indexes(as_set(a) | as_set(b)))
+
+    def test_counts(self):
+        rng = random.Random(2)
+        lists = [self.random_intervals(rng) for _ in range(10)]
+        runs = slots.count_runs(lists)
+        counts = {i: count for start, end, count in runs for i in range(start, end)}
+        for i in range(60):
+            self.assertEqual(counts.get(i, 0), sum(i in as_set(intervals) for intervals in lists))
+
+        new = self.random_intervals(rng)
+        changed = slots.apply_change(runs, lists[3], new)
+        self.assertEqual(changed, slots.count_runs(lists[:3] + [new] + lists[4:]))
+
+    def test_normalize(self):
+        self.assertEqual(slots.normalize([[5, 8], [0, 2], [1, 3], [3, 4]], 10), [[0, 4], [5, 8]])
+        for bad in ([[2, 2]], [[0, 11]], [[-1, 2]], [[0, 1, 2]], [['0', 1]], [[True, 2]], 'x'):
+            with self.assertRaises(ValueError):
+                slots.normalize(bad, 10)
+
+
+class RankBlocksTest(unittest.TestCase):
+
+    def setUp(self):
+        self.calendar = slots.Calendar('2025-01-06', '2025-01-08', '09:00', '13:00', 60)
+
+    def test_blocks_stay_within_a_day(self):
+        # Free from 11:00 on the first day to 11:00 on the second
+        everyone = [[[2, 6]], [[2, 6]]]
+        ranked = slots.rank_blocks(self.calendar, everyone, length=2)
+        self.assertEqual([block['start'] for block in ranked],
+                         ['2025-01-06T11:00', '2025-01-07T09:00'])
+        self.assertEqual(ranked[0]['dayhours'], ['2025-01-06T11:00', '2025-01-06T12:00'])
+        self.assertEqual(ranked[0]['ratio'], 1.0)
+
+    def test_quorum_required_and_blackouts(self):
+        lists = [[[0, 4]], [[1, 3]], [[8, 12]]]
+        ranked = slots.rank_blocks(self.calendar, lists, length=1, quorum=2)
+        self.assertEqual([block['start'] for block in ranked], ['2025-01-06T10:00', '2025-01-06T11:00'])
+        ranked = slots.rank_blocks(self.calendar, lists, blackouts=[[1, 2]], required=[0])
+        self.assertEqual(ranked[0]['start'], '2025-01-06T11:00')
+        self.assertNotIn('2025-01-06T10:00', [block['start'] for block in ranked])
+        self.assertFalse(any(block['start'].startswith('2025-01-08') for block in ranked))
+        with self.assertRaises(ValueError):
+            slots.rank_blocks(self.calendar, lists, length=5)
+
+
+class DateRangeScheduleTest(AppTestCase):
+
+    config = {'BULK_API_TOKEN': TOKEN}
+    create_schedule = False
+
+    def setUp(self):
+        super().setUp()
+        self.schedule_id, self.password = self.new_schedule(
+            self.owner, start='2025-01-06', end='2025-02-16', day_start='09:00', day_end='12:00',
+            slot_minutes=30)
+
+    def info(self):
+        return self.owner.get(f'/s/{self.schedule_id}/info').get_json()
+
+    def test_selections_are_stored_as_intervals(self):
+        client = self.client_for('alice')
+        url = f'/u/{self.schedule_id}/alice/selections'
+        keys = ['2025-01-06T09:00', '2025-01-06T09:30', '2025-02-16T11:30']
+        self.assertEqual(client.post(url, json=keys).status_code, 200)
+        self.assertEqual(client.get(url).get_json(), keys)
+        self.assertEqual(client.get(url, query_string={'format': 'intervals'}).get_json(),
+                         {'intervals': [[0, 2], [251, 252]]})
+
+        info = self.info()
+        self.assertEqual(info['calendar']['slot_minutes'], 30)
+        self.assertEqual(info['runs'], [[0, 2, 1], [251, 252, 1]])
+        self.assertEqual(info['tiers'], [[0, 2, '100'], [251, 252, '100']])
+        self.assertNotIn('dayhours', info)
+
+        self.assertEqual(client.post(url, json=['M09']).status_code, 400)
+        self.assertEqual(client.post(url, json={'intervals': [[0, 500]]}).status_code, 400)
+
+    def test_patch_and_aggregate(self):
+        alice, bob = self.client_for('alice'), self.client_for('bob')
+        alice.post(f'/u/{self.schedule_id}/alice/selections', json={'intervals': [[0, 6]]})
+        bob.post(f'/u/{self.schedule_id}/bob/selections', json={'intervals': [[2, 4]]})
+        self.assertEqual(self.info()['runs'], [[0, 2, 1], [2, 4, 2], [4, 6, 1]])
+
+        response = bob.patch(f'/u/{self.schedule_id}/bob/selections', json={
+            'add': ['2025-01-06T11:00'], 'remove': ['2025-01-06T10:00'], 'selections_version': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(bob.get(f'/u/{self.schedule_id}/bob/selections').get_json(),
+                         ['2025-01-06T10:30', '2025-01-06T11:00'])
+        self.assertEqual(self.info()['runs'], [[0, 3, 1], [3, 5, 2], [5, 6, 1]])
+
+        conflict = bob.patch(f'/u/{self.schedule_id}/bob/selections', json={
+            'add': ['2025-01-06T09:00'], 'selections_version': 1})
+        self.assertEqual(conflict.status_code, 409)
+        self.assertEqual(conflict.get_json()['selections'], ['2025-01-06T10:30', '2025-01-06T11:00'])
+
+    def test_blackouts_and_best(self):
+        for user_id in ('alice', 'bob'):
+            self.client_for(user_id).post(f'/u/{self.schedule_id}/{user_id}/selections',
+                                          json={'intervals': [[0, 6], [6, 8]]})
+        url = f'/s/{self.schedule_id}/blackouts'
+        self.assertEqual(self.owner.post(url, json=['2025-01-06T09:30']).status_code, 200)
+        self.assertEqual(self.owner.get(url).get_json(), ['2025-01-06T09:30'])
+        self.assertEqual(self.info()['blackouts'], [[1, 2]])
+
+        best = self.owner.get(f'/s/{self.schedule_id}/best', query_string={'hours': 1}).get_json()
+        # Two slots a block, none of them blacked out or running into the next day
+        self.assertEqual([slot['start'] for slot in best['slots']],
+                         ['2025-01-06T10:00', '2025-01-06T10:30', '2025-01-06T11:00',
+                          '2025-01-07T09:00'])
+        self.assertEqual(best['slots'][0]['count'], 2)
+        self.assertEqual(self.owner.get(f'/s/{self.schedule_id}/best',
+                                        query_string={'hours': 4}).status_code, 400)
+
+    def test_rebuild_matches_incremental(self):
+        from app import get_storage, rebuild_aggregate
+        rng = random.Random(3)
+        for i in range(8):
+            intervals = slots.from_indexes(rng.sample(range(252), 40))
+            self.client_for(f'user{i}').post(f'/u/{self.schedule_id}/user{i}/selections',
+                                             json={'intervals': intervals})
+        incremental = get_storage().get_aggregate(self.schedule_id)
+        rebuilt = rebuild_aggregate(self.schedule_id)
+        self.assertEqual(rebuilt['runs'], incremental['runs'])
+        self.assertEqual(rebuilt['count'], 8)
+
+    def test_weekly_schedules_unchanged(self):
+        schedule_id, _ = self.new_schedule(self.owner)
+        client = self.client_for('alice')
+        client.post(f'/u/{schedule_id}/alice/selections', json=['M09'])
+        info = self.owner.get(f'/s/{schedule_id}/info').get_json()
+        self.assertEqual(info['dayhours'], {'M09': 1})
+        self.assertNotIn('calendar', info)
+
+        combined = self.owner.get('/combined/info', query_string={'schedule': [schedule_id, self.schedule_id]})
+        self.assertEqual(combined.status_code, 400)
+
+    def test_bad_range_is_refused(self):
+        response = self.owner.get('/new', query_string={'start': '2025-01-06', 'end': '2024-01-06'})
+        self.assertEqual(response.status_code, 302)
+        self.assertNotIn('/s/', response.headers['Location'])
+
+    def test_export_and_import(self):
+        self.client_for('alice').post(f'/u/{self.schedule_id}/alice/selections',
+                                      json=['2025-01-06T09:00'])
+        headers = {'Authorization': f'Bearer {TOKEN}'}
+        csv = self.owner.get(f'/bulk/export?schedule={self.schedule_id}&format=csv', headers=headers)
+        self.assertIn('2025-01-06T09:00', csv.get_data(as_text=True))
+
+        ndjson = self.owner.get(f'/bulk/export?schedule={self.schedule_id}', headers=headers).get_data()
+        shutil.rmtree(self.data_dir)
+        init_storage(app)
+        summary = self.owner.post('/bulk/import', data=ndjson, headers=headers).get_json()
+        self.assertEqual(summary['responses'], 1)
+        self.assertEqual(self.info()['runs'], [[0, 1, 1]])
+
+
+if __name__ == '__main__':
+    unittest.main()
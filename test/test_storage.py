@@ -0,0 +1,126 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from app import app
+from test.base import AppTestCase
+from storage import FileStorage, SQLiteStorage, migrate, shard_path
+
+
+class StorageBackendTest(unittest.TestCase):
+    """Behaviour both backends must share"""
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.data_dir, ignore_errors=True)
+
+    def backends(self):
+        yield FileStorage(os.path.join(self.data_dir, 'files'))
+        yield SQLiteStorage(os.path.join(self.data_dir, 'db.sqlite3'))
+
+    def test_round_trip(self):
+        for storage in self.backends():
+            with self.subTest(backend=storage.name):
+                self.assertFalse(storage.schedule_exists('abc123'))
+                self.assertIsNone(storage.get_schedule('abc123'))
+
+                self.assertTrue(storage.save_schedule('abc123', {'id': 'abc123', 'blackouts': ['M08']}))
+                self.assertTrue(storage.schedule_exists('abc123'))
+                self.assertEqual(storage.get_schedule('abc123'), {'id': 'abc123', 'blackouts': ['M08']})
+
+                storage.save_user('abc123', 'u1', {'name': 'Ann', 'selections': ['T09', 'W10']})
+                storage.save_user('abc123', 'u2', {'name': 'Bo', 'selections': []})
+                self.assertEqual(storage.get_user('abc123', 'u1')['selections'], ['T09', 'W10'])
+                self.assertEqual(sorted(user_id for user_id, _ in storage.list_users('abc123')), ['u1', 'u2'])
+                self.assertEqual(storage.list_users('nothere'), [])
+
+                self.assertIsNone(storage.get_aggregate('abc123'))
+                storage.save_aggregate('abc123', {'version': 3, 'count': 2, 'dayhours': {'T09': 1}})
+                self.assertEqual(storage.get_aggregate('abc123')['version'], 3)
+                self.assertEqual(storage.list_schedule_ids(), ['abc123'])
+
+    def test_list_schedules(self):
+        for storage in self.backends():
+            with self.subTest(backend=storage.name):
+                storage.save_schedule('old001', {'name': 'Old', 'creator_id': 'ann',
+                                                 'created_at': '2024-01-01T00:00:00'})
+                storage.save_schedule('new001', {'name': 'New', 'creator_id': 'ann',
+                                                 'created_at': '2025-06-01T00:00:00'})
+                storage.save_schedule('bob001', {'name': 'Bob', 'creator_id': 'bob',
+                                                 'created_at': '2025-01-01T00:00:00'})
+                storage.save_aggregate('new001', {'version': 2, 'count': 3, 'dayhours': {}})
+
+                mine = storage.list_schedules(creator_id='ann')
+                self.assertEqual([(s['id'], s['name'], s['respondents']) for s in mine],
+                                 [('new001', 'New', 3), ('old001', 'Old', 0)])
+                self.assertEqual([s['id'] for s in storage.list_schedules(
+                    created_before='2025-01-01')], ['old001'])
+                # A response counts as activity
+                self.assertEqual(sorted(s['id'] for s in storage.list_schedules(
+                    updated_before='2025-07-01')), ['bob001', 'old001'])
+                self.assertEqual(len(storage.list_schedules(limit=1)), 1)
+
+    def test_sharded_layout(self):
+        storage = FileStorage(self.data_dir)
+        storage.save_schedule('abc123', {'id': 'abc123'})
+        self.assertEqual(storage.schedule_directory('abc123'),
+                         os.path.join(self.data_dir, shard_path('abc123')))
+        self.assertTrue(os.path.exists(storage.meta_path('abc123')))
+
+        # A schedule directory from before sharding is still found where it is
+        os.makedirs(os.path.join(self.data_dir, 'flat01'))
+        with open(os.path.join(self.data_dir, 'flat01', 'meta.json'), 'w') as f:
+            json.dump({'id': 'flat01', 'creator_id': 'ann', 'created_at': '2024-01-01'}, f)
+        self.assertEqual(storage.get_schedule('flat01')['creator_id'], 'ann')
+        self.assertEqual(sorted(storage.list_schedule_ids()), ['abc123', 'flat01'])
+        self.assertEqual(storage.list_schedules(creator_id='ann'), [])
+
+        self.assertEqual(storage.reindex(move_flat=True), 2)
+        self.assertEqual([s['id'] for s in storage.list_schedules(creator_id='ann')], ['flat01'])
+        self.assertFalse(os.path.exists(os.path.join(self.data_dir, 'flat01')))
+        self.assertEqual(storage.get_schedule('flat01')['creator_id'], 'ann')
+
+    def test_migrate(self):
+        source, destination = self.backends()
+        source.save_schedule('abc123', {'id': 'abc123', 'name': 'Standup'})
+        source.save_user('abc123', 'u1', {'name': 'Ann', 'selections': ['M08']})
+        os.makedirs(os.path.join(source.data_dir, 'nometa'))
+
+        self.assertEqual(migrate(source, destination), (1, 1))
+        self.assertEqual(destination.get_schedule('abc123')['name'], 'Standup')
+        self.assertEqual(destination.get_user('abc123', 'u1')['selections'], ['M08'])
+
+
+class SQLiteAppTest(AppTestCase):
+    """The routes running on the SQLite backend"""
+
+    backend = 'sqlite'
+
+    def test_respond_and_info(self):
+        self.respond('ann', ['M08', 'M09'])
+        info = self.owner.get(f'/s/{self.schedule_id}/info').get_json()
+        self.assertEqual(info['count'], 1)
+        self.assertEqual(info['dayhours'], {'M08': 1, 'M09': 1})
+        self.assertTrue(os.path.exists(os.path.join(self.data_dir, 'scheduler.sqlite3')))
+        self.assertFalse(os.path.exists(os.path.join(self.data_dir, self.schedule_id)))
+
+    def test_my_schedules(self):
+        schedule_id, _ = self.new_schedule(self.owner)
+        page = self.owner.get('/').get_data(as_text=True)
+        self.assertIn('My Schedules', page)
+        self.assertIn(f'/s/{schedule_id}?pw=', page)
+        self.assertNotIn('My Schedules', app.test_client().get('/').get_data(as_text=True))
+
+    def test_migrate_command(self):
+        source_dir = os.path.join(self.data_dir, 'old')
+        FileStorage(source_dir).save_schedule('abc123', {'id': 'abc123'})
+        result = app.test_cli_runner().invoke(args=['migrate-storage', '--source-dir', source_dir])
+        self.assertIn('Migrated 1 schedules and 0 responses', result.output)
+
+
+if __name__ == '__main__':
+    unittest.main()